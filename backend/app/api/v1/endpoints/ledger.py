@@ -2,7 +2,10 @@ from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
 
+from app.core import config
 from app.core.database import get_db
+from app.core.websocket import manager
+from app.services.ingestion_matcher import ingestion_matcher
 from app.models import tables
 from app.schemas import schemas
 from app.api.v1.endpoints import deps
@@ -45,6 +48,17 @@ async def upload_ledger(
     # Refresh all to get IDs
     for record in saved_records:
         db.refresh(record)
+
+    # 3. Match the new rows right away against the open bank rows
+    if config.INGEST_MATCHING:
+        try:
+            await ingestion_matcher.ingest_ledger(db, [
+                {"id": r.id, "date": r.date, "amount": r.amount, "description": r.description}
+                for r in saved_records
+            ], websocket_manager=manager)
+        except Exception as e:
+            # The rows are saved either way; the next run matches them
+            print(f"Ingestion matching failed: {str(e)}")
         
     return saved_records
 
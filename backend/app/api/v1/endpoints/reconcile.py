@@ -1,17 +1,41 @@
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, BackgroundTasks
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
 from sqlalchemy.orm import Session
 from app.core.database import get_db
+from app.core import config
+from app.services.job_queue import ScopeBusy, enqueue_job
 from app.services.matching_engine import MatchingEngine
+from app.services.run_rollback import rollback_run
+from app.services.reconciliation_scope import ReconciliationScope
+from app.schemas import schemas
 from app.api.v1.endpoints import deps
 # Import tables to access them for deletion
 from app.models import tables
 from app.core.websocket import manager
+from app.core.feed_encoding import ENCODINGS
+from app.services.ingestion_matcher import ingestion_matcher
 
 router = APIRouter()
 
 @router.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(
+    websocket: WebSocket,
+    run_id: Optional[str] = None,
+    after_seq: Optional[int] = None,
+    encoding: str = "json"
+):
+    """
+    Live match feed. The first frames are a "hello" (per-run summaries) and the recent
+    events of each run; after a reconnect pass ?run_id=...&after_seq=... (the last
+    event seen) to only get what was missed.
+    ?encoding=columnar (or msgpack, in binary frames) sends batches as arrays per field
+    instead of one JSON object per event.
+    """
+    if encoding not in ENCODINGS:
+        # 1003: unsupported data
+        await websocket.close(code=1003)
+        return
+    await manager.connect(websocket, run_id, after_seq, encoding)
     try:
         while True:
             # Keep alive, or listen for commands if needed
@@ -19,35 +43,150 @@ async def websocket_endpoint(websocket: WebSocket):
     except WebSocketDisconnect:
         manager.disconnect(websocket)
 
+@router.get("/ws/metrics")
+def websocket_metrics():
+    """
+    Per connected live-feed client: queue depth, frames sent and frames dropped.
+    """
+    return {"policy": manager.slow_client_policy, "connections": manager.metrics()}
+
 @router.post("/run")
 async def run_reconciliation(
-    background_tasks: BackgroundTasks,
+    scope: Optional[schemas.ReconcileScope] = None,
+    incremental: bool = None,
+    dry_run: bool = False,
     db: Session = Depends(get_db),
     current_user: tables.User = Depends(deps.get_current_superuser)
 ):
     """
-    Triggers reconciliation in the background. 
-    Returns immediately so Nginx doesn't timeout.
+    Queues a reconciliation job for the worker process (worker.py) and returns its id
+    right away; poll /jobs/{job_id} for progress.
+    With ?incremental=true only rows uploaded since the last completed run are evaluated.
+    With ?dry_run=true every pass runs but nothing is saved; the job's results carry the
+    per-pass report (candidates, ambiguous rows, matches, fetch / match / persist time).
+    An optional JSON body (statement_ids, bank_name, date_from, date_to, gl_code_prefixes)
+    limits the run to that slice. Bank filters don't limit the ledger side, so slices
+    only count as separate when both their bank and ledger rows are (see ReconciliationScope.overlaps).
+    Only one job per overlapping scope can be queued or running (409 otherwise).
     """
+    run_scope = ReconciliationScope(**scope.model_dump()) if scope else None
+    if incremental is None:
+        incremental = config.RECONCILE_INCREMENTAL
     try:
-        engine = MatchingEngine(db)
-        
-        # Define wrapper to run async engine path synchronously or handle new loop
-        # But MatchingEngine.run is async. BackgroundTasks expects a sync/async function.
-        # We can pass the coroutine directly if using FastAPI >= 0.68
-        
-        background_tasks.add_task(engine.run, websocket_manager=manager)
-        
-        return {"status": "started", "message": "Reconciliation started in background"}
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+        job = enqueue_job(db, run_scope, incremental, options={"dry_run": True} if dry_run else None)
+    except ScopeBusy as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "job_id": e.job.id})
+
+    return {"status": "queued", "job_id": job.id, "message": "Reconciliation queued"}
+
+@router.get("/runs/{run_id}")
+def get_run(run_id: str, db: Session = Depends(get_db)):
+    """
+    Status, results and timings (fetch / match / persist, per pass) of a reconciliation run.
+    """
+    run = db.get(tables.ReconciliationRun, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return {
+        "id": run.id,
+        "mode": run.mode,
+        "status": run.status,
+        "scope": run.scope,
+        "incremental": run.incremental,
+        "results": run.results,
+        "stats": run.stats,
+        "checkpoint": run.checkpoint,
+        "resumed_from": run.resumed_from,
+        "rollback": run.rollback,
+        "rerun_of": run.rerun_of,
+        "started_at": run.started_at,
+        "finished_at": run.finished_at
+    }
+
+@router.post("/runs/{run_id}/rollback")
+def rollback_reconciliation_run(
+    run_id: str,
+    db: Session = Depends(get_db),
+    current_user: tables.User = Depends(deps.get_current_superuser)
+):
+    """
+    Deletes all matches (and mismatch reports) written by one run, putting its rows
+    back in the unmatched pool. Other runs' matches are untouched.
+    """
+    run = db.get(tables.ReconciliationRun, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    if run.status == "running":
+        raise HTTPException(status_code=409, detail="Run is still in progress")
+    if run.status == "rolled_back":
+        raise HTTPException(status_code=409, detail="Run was already rolled back")
+
+    run = rollback_run(db, run)
+    ingestion_matcher.invalidate()
+    return {"status": "rolled_back", "run_id": run.id, **run.rollback}
+
+@router.post("/runs/{run_id}/rerun")
+def rerun_reconciliation(
+    run_id: str,
+    options: Optional[schemas.RerunOptions] = None,
+    db: Session = Depends(get_db),
+    current_user: tables.User = Depends(deps.get_current_superuser)
+):
+    """
+    Queues a new run over the rows a rolled-back run released (its scope, narrowed to
+    their date span), optionally with different matching parameters.
+    """
+    run = db.get(tables.ReconciliationRun, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    if run.status != "rolled_back":
+        raise HTTPException(status_code=409, detail="Only rolled-back runs can be re-run")
+
+    engine_options = options.model_dump(exclude_none=True) if options else {}
+    try:
+        # Fail fast on bad parameters instead of in the worker
+        MatchingEngine(db, **engine_options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        job = enqueue_job(
+            db, ReconciliationScope.from_dict(run.scope), options={**engine_options, "rerun_of": run.id}
+        )
+    except ScopeBusy as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "job_id": e.job.id})
+
+    return {"status": "queued", "job_id": job.id, "message": "Re-run queued"}
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str, db: Session = Depends(get_db)):
+    """
+    Status, progress and (once finished) results of a reconciliation job.
+    """
+    job = db.get(tables.ReconciliationJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "id": job.id,
+        "status": job.status,
+        "scope": job.scope,
+        "incremental": job.incremental,
+        "progress": job.progress,
+        "results": job.results,
+        "error": job.error,
+        "run_id": job.run_id,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at
+    }
 
 @router.get("/stats")
 def get_stats(db: Session = Depends(get_db)):
     total_bank = db.query(tables.Transaction).count()
-    total_matches = db.query(tables.ReconciliationMatch).count()
+    # Split groups add ledger-only rows; count each bank transaction once
+    total_matches = db.query(tables.ReconciliationMatch).filter(
+        tables.ReconciliationMatch.transaction_id != None
+    ).count()
     
     rate = 0
     if total_bank > 0:
@@ -67,6 +206,7 @@ def clear_data(db: Session = Depends(get_db)):
         db.query(tables.InternalLedger).delete()
         db.query(tables.BankStatement).delete()
         db.commit()
+        ingestion_matcher.invalidate()
         return {"status": "success", "message": "All data cleared"}
     except Exception as e:
         db.rollback()
@@ -1,8 +1,12 @@
+import uuid
 from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
 
+from app.core import config
 from app.core.database import get_db
+from app.core.websocket import manager
+from app.services.ingestion_matcher import ingestion_matcher
 from app.models import tables
 from app.schemas import schemas
 from app.api.v1.endpoints import deps
@@ -50,8 +54,11 @@ async def upload_statement(
     db.refresh(db_statement)
 
     # 3. Save Transactions to DB
+    # IDs are set here so the rows can be matched without re-reading them
+    new_rows = []
     for tx in unified_transactions:
         db_tx = tables.Transaction(
+            id=str(uuid.uuid4()),
             date=tx.date,
             amount=tx.amount,
             description=tx.description,
@@ -60,8 +67,18 @@ async def upload_statement(
             statement_id=db_statement.id
         )
         db.add(db_tx)
+        new_rows.append({"id": db_tx.id, "date": tx.date, "amount": tx.amount, "description": tx.description})
     
     db.commit()
+
+    # 4. Match the new rows right away against the open ledger rows
+    if config.INGEST_MATCHING:
+        try:
+            await ingestion_matcher.ingest_bank(db, new_rows, websocket_manager=manager)
+        except Exception as e:
+            # The rows are saved either way; the next run matches them
+            print(f"Ingestion matching failed: {str(e)}")
+
     db.refresh(db_statement)
     
     return db_statement
@@ -81,4 +98,5 @@ def reset_data(db: Session = Depends(get_db)):
     db.query(tables.BankStatement).delete()
     
     db.commit()
+    ingestion_matcher.invalidate()
     return None
\ No newline at end of file
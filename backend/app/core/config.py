@@ -1 +1,97 @@
-# Environment variables and settings
\ No newline at end of file
+# Environment variables and settings
+import os
+from decimal import Decimal
+
+# --- RECONCILIATION ---
+# Maximum distance (in days) between bank and ledger dates in the fuzzy_date pass
+FUZZY_DATE_WINDOW_DAYS = int(os.getenv("FUZZY_DATE_WINDOW_DAYS", "2"))
+
+# Number of ReconciliationMatch rows written per bulk INSERT
+MATCH_BATCH_SIZE = int(os.getenv("MATCH_BATCH_SIZE", "1000"))
+
+# Where matching runs: "python" (ORM objects), "numpy" (columnar), "parallel" (columnar,
+# over worker processes), "sql" (set-based, inside the database) or "stream" (out of core)
+MATCH_ENGINE_MODE = os.getenv("MATCH_ENGINE_MODE", "python")
+# Worker processes for the "parallel" mode
+MATCH_WORKERS = int(os.getenv("MATCH_WORKERS", str(os.cpu_count() or 1)))
+# Rows held in memory per chunk by the "stream" mode
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "50000"))
+
+# Commit and checkpoint a run every N insert batches (0 = once per pass, which keeps
+# each pass all-or-nothing). A run still marked 'running' whose last checkpoint is older
+# than RUN_STALE_SECONDS was interrupted; the next run over its scope resumes it
+RUN_CHECKPOINT_BATCHES = int(os.getenv("RUN_CHECKPOINT_BATCHES", "0"))
+RUN_STALE_SECONDS = int(os.getenv("RUN_STALE_SECONDS", "900"))
+
+# Seconds a worker (worker.py) sleeps when the job queue is empty
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+# How often a worker marks its running job as alive; jobs silent for RUN_STALE_SECONDS are requeued
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "30"))
+
+# Match uploaded rows against a warm in-process index of open rows as they arrive
+INGEST_MATCHING = os.getenv("INGEST_MATCHING", "false").lower() == "true"
+
+# Only evaluate rows uploaded since the last completed run (against all open rows they can pair with)
+RECONCILE_INCREMENTAL = os.getenv("RECONCILE_INCREMENTAL", "false").lower() == "true"
+
+# How the fuzzy_date pass picks between competing candidates: "greedy" or "optimal"
+FUZZY_ASSIGNMENT = os.getenv("FUZZY_ASSIGNMENT", "greedy")
+# Rows per side above which an ambiguous block is not solved optimally
+ASSIGNMENT_MAX_BLOCK_SIZE = int(os.getenv("ASSIGNMENT_MAX_BLOCK_SIZE", "40"))
+
+# Match known bank counterparties against the ledger counterparty / GL code they were
+# matched to before (learned into match_patterns after every run), python mode only.
+# Only patterns confirmed by at least PATTERN_MIN_HITS matches are trusted
+PATTERN_MATCHING = os.getenv("PATTERN_MATCHING", "false").lower() == "true"
+PATTERN_MIN_HITS = int(os.getenv("PATTERN_MIN_HITS", "2"))
+
+# Learn the fuzzy_date window per counterparty from past matches, python mode only.
+# Needs ADAPTIVE_WINDOW_MIN_SAMPLES pairs; the window covers the given quantile of
+# observed lags (plus a spare day) and never exceeds ADAPTIVE_WINDOW_MAX_DAYS
+ADAPTIVE_DATE_WINDOWS = os.getenv("ADAPTIVE_DATE_WINDOWS", "false").lower() == "true"
+ADAPTIVE_WINDOW_MIN_SAMPLES = int(os.getenv("ADAPTIVE_WINDOW_MIN_SAMPLES", "5"))
+ADAPTIVE_WINDOW_QUANTILE = float(os.getenv("ADAPTIVE_WINDOW_QUANTILE", "0.95"))
+ADAPTIVE_WINDOW_MAX_DAYS = int(os.getenv("ADAPTIVE_WINDOW_MAX_DAYS", "7"))
+
+# Amount-tolerance pass (fees, FX rounding, short payments), python mode only.
+# A pair may differ by max(absolute, relative * amount); dates use FUZZY_DATE_WINDOW_DAYS
+AMOUNT_TOLERANCE_MATCHING = os.getenv("AMOUNT_TOLERANCE_MATCHING", "false").lower() == "true"
+AMOUNT_TOLERANCE_ABSOLUTE = Decimal(os.getenv("AMOUNT_TOLERANCE_ABSOLUTE", "0.50"))
+AMOUNT_TOLERANCE_RELATIVE = float(os.getenv("AMOUNT_TOLERANCE_RELATIVE", "0.01"))
+
+# Split-payment pass (one row on one side settles several on the other), python mode only
+SPLIT_MATCHING = os.getenv("SPLIT_MATCHING", "false").lower() == "true"
+SPLIT_DATE_WINDOW_DAYS = int(os.getenv("SPLIT_DATE_WINDOW_DAYS", "5"))
+SPLIT_MAX_PARTS = int(os.getenv("SPLIT_MAX_PARTS", "4"))
+SPLIT_MAX_CANDIDATES = int(os.getenv("SPLIT_MAX_CANDIDATES", "20"))
+# Hard time budget for the subset-sum search of one counterparty block
+SPLIT_BLOCK_TIME_LIMIT_MS = int(os.getenv("SPLIT_BLOCK_TIME_LIMIT_MS", "200"))
+
+# Description-similarity pass over leftovers, python mode only
+DESCRIPTION_MATCHING = os.getenv("DESCRIPTION_MATCHING", "false").lower() == "true"
+DESCRIPTION_DATE_WINDOW_DAYS = int(os.getenv("DESCRIPTION_DATE_WINDOW_DAYS", "7"))
+# Amounts are bucketed by this many cents; pairs may be at most one bucket apart
+DESCRIPTION_AMOUNT_BUCKET_CENTS = int(os.getenv("DESCRIPTION_AMOUNT_BUCKET_CENTS", "100"))
+DESCRIPTION_MIN_SIMILARITY = float(os.getenv("DESCRIPTION_MIN_SIMILARITY", "0.6"))
+# Bank rows scored per block (bounds the size of each similarity matrix)
+DESCRIPTION_BLOCK_SIZE = int(os.getenv("DESCRIPTION_BLOCK_SIZE", "256"))
+
+# --- LIVE FEED (WebSocket) ---
+# Match events are buffered and sent as one frame per tick, or sooner once
+# WS_FLUSH_MAX_EVENTS are waiting (which is also the most events per frame)
+WS_FLUSH_INTERVAL_MS = int(os.getenv("WS_FLUSH_INTERVAL_MS", "100"))
+WS_FLUSH_MAX_EVENTS = int(os.getenv("WS_FLUSH_MAX_EVENTS", "500"))
+# Frames queued per client before the slow-client policy kicks in:
+# "drop_oldest", "snapshot" (replace the backlog with one progress snapshot) or "disconnect"
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "100"))
+WS_SLOW_CLIENT_POLICY = os.getenv("WS_SLOW_CLIENT_POLICY", "drop_oldest")
+# How events reach clients connected to other processes (API workers, worker.py):
+# "local" (this process only), "postgres" (LISTEN/NOTIFY) or "polling" (a feed_events
+# table polled every WS_FEED_POLL_MS, for SQLite / dev setups)
+WS_FEED_BACKEND = os.getenv("WS_FEED_BACKEND", "local")
+WS_FEED_CHANNEL = os.getenv("WS_FEED_CHANNEL", "reconcile_feed")
+WS_FEED_POLL_MS = int(os.getenv("WS_FEED_POLL_MS", "500"))
+WS_FEED_RETENTION_SECONDS = int(os.getenv("WS_FEED_RETENTION_SECONDS", "300"))
+# Recent events kept per run (and how many runs) for clients that join or reconnect mid-run
+WS_REPLAY_EVENTS = int(os.getenv("WS_REPLAY_EVENTS", "1000"))
+WS_REPLAY_RUNS = int(os.getenv("WS_REPLAY_RUNS", "5"))
@@ -0,0 +1,181 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, select, text
+from app.core import config
+
+# "local" keeps events in this process, "postgres" fans them out with LISTEN/NOTIFY,
+# "polling" through the feed_events table (SQLite / dev)
+FEED_BACKENDS = ("local", "postgres", "polling")
+
+class LocalFeedBackend:
+    """
+    Hands published batches straight to this process's clients.
+    """
+    # Whether other processes see what this one publishes
+    shared = False
+
+    def __init__(self):
+        self._deliver = None
+
+    async def listen(self, deliver):
+        self._deliver = deliver
+
+    def publish(self, events):
+        if self._deliver is not None:
+            self._deliver(events)
+
+    async def close(self):
+        self._deliver = None
+
+class PostgresFeedBackend:
+    """
+    Fans batches out to every process with LISTEN/NOTIFY on `channel`.
+    Notifications sent by one session arrive in order, and a run is published by the
+    one process running it, so its events keep their order everywhere. A NOTIFY
+    payload is capped at 8000 bytes; bigger batches are split over several.
+    """
+    shared = True
+    MAX_PAYLOAD_BYTES = 7900
+
+    def __init__(self, engine, channel: str):
+        self.engine = engine
+        self.channel = channel
+        self._listener = None
+
+    async def listen(self, deliver):
+        # A dedicated connection, kept out of the pool: it stays in autocommit and LISTENing
+        raw = self.engine.raw_connection()
+        raw.detach()
+        connection = raw.driver_connection
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+
+        def on_readable():
+            connection.poll()
+            while connection.notifies:
+                deliver(json.loads(connection.notifies.pop(0).payload))
+
+        asyncio.get_running_loop().add_reader(connection.fileno(), on_readable)
+        self._listener = raw
+
+    def publish(self, events):
+        with self.engine.begin() as connection:
+            for payload in self._payloads(events):
+                connection.execute(
+                    text("SELECT pg_notify(:channel, :payload)"), {"channel": self.channel, "payload": payload}
+                )
+
+    async def close(self):
+        if self._listener is not None:
+            asyncio.get_running_loop().remove_reader(self._listener.driver_connection.fileno())
+            self._listener.close()
+            self._listener = None
+
+    def _payloads(self, events):
+        """
+        JSON arrays of events, each under MAX_PAYLOAD_BYTES (json.dumps escapes to ASCII).
+        """
+        chunk, size = [], 2
+        for event in events:
+            encoded = json.dumps(event, default=str)
+            if chunk and size + len(encoded) + 1 > self.MAX_PAYLOAD_BYTES:
+                yield "[" + ",".join(chunk) + "]"
+                chunk, size = [], 2
+            chunk.append(encoded)
+            size += len(encoded) + 1
+        if chunk:
+            yield "[" + ",".join(chunk) + "]"
+
+class PollingFeedBackend:
+    """
+    Fans batches out through the feed_events table: publishers insert one row per
+    batch, listeners poll for rows past the last id they have seen. Meant for SQLite
+    and dev setups, where writes are serialised so ids follow commit order.
+    Rows older than `retention_seconds` are pruned by the publishers.
+    """
+    shared = True
+    PRUNE_EVERY = 100
+
+    def __init__(self, session_factory, poll_seconds: float, retention_seconds: int):
+        self.session_factory = session_factory
+        self.poll_seconds = poll_seconds
+        self.retention_seconds = retention_seconds
+        self._last_id = 0
+        self._published = 0
+        self._poller = None
+
+    async def listen(self, deliver):
+        # Only what is published from now on; the feed is not a history
+        self._last_id = await asyncio.to_thread(self._max_id)
+        self._poller = asyncio.get_running_loop().create_task(self._poll(deliver))
+
+    def publish(self, events):
+        from app.models.tables import FeedEvent
+
+        db = self.session_factory()
+        try:
+            db.add(FeedEvent(events=events))
+            self._published += 1
+            if self._published % self.PRUNE_EVERY == 0:
+                cutoff = datetime.utcnow() - timedelta(seconds=self.retention_seconds)
+                db.execute(delete(FeedEvent).where(FeedEvent.created_at < cutoff))
+            db.commit()
+        finally:
+            db.close()
+
+    async def close(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+
+    async def _poll(self, deliver):
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                batches = await asyncio.to_thread(self._read)
+            except Exception as e:
+                # Try again next tick; _last_id didn't move, so nothing is skipped
+                print(f"Live feed poll failed: {str(e)}")
+                continue
+            for events in batches:
+                deliver(events)
+
+    def _read(self):
+        from app.models.tables import FeedEvent
+
+        db = self.session_factory()
+        try:
+            rows = db.execute(
+                select(FeedEvent.id, FeedEvent.events).where(FeedEvent.id > self._last_id).order_by(FeedEvent.id)
+            ).all()
+        finally:
+            db.close()
+        if rows:
+            self._last_id = rows[-1][0]
+        return [events for _, events in rows]
+
+    def _max_id(self):
+        from app.models.tables import FeedEvent
+
+        db = self.session_factory()
+        try:
+            return db.execute(select(func.max(FeedEvent.id))).scalar() or 0
+        finally:
+            db.close()
+
+def create_feed_backend(name: str = None):
+    """
+    The backend named by `name` (default WS_FEED_BACKEND), on the app's database.
+    """
+    name = name or config.WS_FEED_BACKEND
+    if name not in FEED_BACKENDS:
+        raise ValueError(f"Unknown live-feed backend '{name}', expected one of {FEED_BACKENDS}")
+    if name == "local":
+        return LocalFeedBackend()
+
+    from app.core.database import SessionLocal, engine
+    if name == "postgres":
+        return PostgresFeedBackend(engine, config.WS_FEED_CHANNEL)
+    return PollingFeedBackend(SessionLocal, config.WS_FEED_POLL_MS / 1000, config.WS_FEED_RETENTION_SECONDS)
@@ -0,0 +1,65 @@
+import json
+from datetime import date
+import msgpack
+
+# What a live-feed client can ask for (?encoding=...):
+# "json" - one object per event, the default
+# "columnar" - batches as arrays per field (amounts in cents, dates as day ordinals), JSON text
+# "msgpack" - the columnar frames, MessagePack-encoded in binary frames
+ENCODINGS = ("json", "columnar", "msgpack")
+
+class Frame:
+    """
+    A message for the live feed, encoded at most once per encoding however many
+    clients receive it.
+    """
+    def __init__(self, message: dict):
+        self.message = message
+        self._encoded = {}
+
+    def encode(self, encoding: str):
+        """
+        str for text frames, bytes for binary ones.
+        """
+        if encoding not in self._encoded:
+            self._encoded[encoding] = encode_frame(self.message, encoding)
+        return self._encoded[encoding]
+
+def encode_frame(message: dict, encoding: str):
+    if encoding == "json":
+        return json.dumps(message, default=str)
+    columnar = to_columnar(message)
+    if encoding == "columnar":
+        return json.dumps(columnar, separators=(",", ":"), default=str)
+    return msgpack.packb(columnar, default=str)
+
+def to_columnar(message: dict):
+    """
+    Turns the events of a batch frame into one array per field, in event order:
+    amount_cents (int), day (date.toordinal(), i.e. days since 0001-01-01 = 1), and
+    match types / run ids as positions in the frame's "match_types" / "runs" lists.
+    Frames without events are returned as they are.
+    """
+    events = message.get("events")
+    if events is None:
+        return message
+
+    match_types, runs = {}, {}
+    columns = {
+        "id": [], "seq": [], "run": [], "type": [], "amount_cents": [], "day": [],
+        "confidence": [], "bank_desc": [], "ledger_desc": []
+    }
+    for event in events:
+        columns["id"].append(event["id"])
+        columns["seq"].append(event.get("seq"))
+        columns["run"].append(runs.setdefault(event.get("run_id"), len(runs)))
+        columns["type"].append(match_types.setdefault(event.get("match_type"), len(match_types)))
+        columns["amount_cents"].append(round(float(event["amount"]) * 100))
+        columns["day"].append(date.fromisoformat(event["date"]).toordinal())
+        columns["confidence"].append(event.get("confidence"))
+        columns["bank_desc"].append(event.get("bank_desc"))
+        columns["ledger_desc"].append(event.get("ledger_desc"))
+
+    frame = {k: v for k, v in message.items() if k != "events"}
+    frame.update({"format": "columnar", "match_types": list(match_types), "runs": list(runs), "columns": columns})
+    return frame
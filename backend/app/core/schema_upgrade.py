@@ -0,0 +1,47 @@
+from sqlalchemy import inspect, text
+from app.core.database import Base
+
+# Columns added to tables that already existed; create_all only creates missing
+# tables, so databases from before them get these through upgrade_schema().
+# (table, column, SQL default for the rows already there)
+ADDED_COLUMNS = (
+    ("transactions", "created_at", None),
+    ("internal_ledger", "created_at", None),
+    ("reconciliation_matches", "group_id", None),
+    ("reconciliation_matches", "run_id", None),
+    ("reconciliation_matches", "patterns_learned", "FALSE"),
+    ("reconciliation_matches", "lags_learned", "FALSE"),
+)
+
+def upgrade_schema(engine):
+    """
+    Adds the columns in ADDED_COLUMNS (and their indexes) to existing tables that
+    lack them. Safe to run on every start; does nothing on an up-to-date database.
+    Returns the "table.column" names added.
+
+    Rows that predate created_at keep it NULL, so incremental runs treat them as old.
+    """
+    from app.models import tables  # noqa: F401 - registers the models on Base
+
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    with engine.begin() as connection:
+        for table_name, column_name, default in ADDED_COLUMNS:
+            if table_name not in existing_tables:
+                continue
+            if column_name in {c["name"] for c in inspector.get_columns(table_name)}:
+                continue
+            table = Base.metadata.tables[table_name]
+            column = table.c[column_name]
+            ddl = f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column.type.compile(dialect=engine.dialect)}"
+            if default is not None:
+                ddl += f" DEFAULT {default}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            connection.execute(text(ddl))
+            for index in table.indexes:
+                if column_name in index.columns:
+                    index.create(connection, checkfirst=True)
+            added.append(f"{table_name}.{column_name}")
+    return added
@@ -1,32 +1,362 @@
-from typing import List
+import asyncio
+import itertools
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Dict
 from fastapi import WebSocket
+from app.core import config
+from app.core.feed_backends import create_feed_backend
+from app.core.feed_encoding import Frame
+
+# What happens when a client's send queue is full: drop its oldest frame, replace its
+# whole backlog with one progress snapshot, or close the connection
+SLOW_CLIENT_POLICIES = ("drop_oldest", "snapshot", "disconnect")
+
+# Put in a client's queue to make its writer close the socket
+_CLOSE = object()
+
+class ClientConnection:
+    """
+    One WebSocket with its own bounded send queue and writer task, so a slow client
+    only ever delays itself. offer() never waits; when the queue is full the policy
+    decides what gives. Frames go out in the encoding the client asked for.
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, websocket: WebSocket, queue_size: int, policy: str, on_closed, encoding: str = "json"):
+        self.id = next(self._ids)
+        self.websocket = websocket
+        self.policy = policy
+        self.encoding = encoding
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.sent = 0
+        self.bytes_sent = 0
+        self.dropped = 0
+        self.snapshots = 0
+        self.closing = False
+        self._on_closed = on_closed
+        self.writer = asyncio.get_running_loop().create_task(self._write())
+
+    def offer(self, message: Frame, snapshot=None):
+        """
+        Queues a frame. `snapshot` builds the frame that replaces the backlog under the
+        "snapshot" policy.
+        """
+        if self.closing:
+            return
+        if not self.queue.full():
+            self.queue.put_nowait(message)
+            return
+
+        if self.policy == "drop_oldest":
+            self.queue.get_nowait()
+            self.dropped += 1
+            self.queue.put_nowait(message)
+        elif self.policy == "snapshot":
+            self.dropped += self._drain() + 1
+            self.snapshots += 1
+            self.queue.put_nowait(snapshot())
+        else:
+            self.dropped += self._drain() + 1
+            self.closing = True
+            self.queue.put_nowait(_CLOSE)
+
+    def metrics(self):
+        return {
+            "id": self.id,
+            "policy": self.policy,
+            "encoding": self.encoding,
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "sent": self.sent,
+            "bytes_sent": self.bytes_sent,
+            "dropped": self.dropped,
+            "snapshots": self.snapshots
+        }
+
+    def stop(self):
+        self.closing = True
+        self.writer.cancel()
+
+    def _drain(self):
+        drained = 0
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            drained += 1
+        return drained
+
+    async def _write(self):
+        try:
+            while True:
+                message = await self.queue.get()
+                if message is _CLOSE:
+                    # 1013: try again later
+                    await self.websocket.close(code=1013)
+                    break
+                payload = message.encode(self.encoding)
+                if isinstance(payload, bytes):
+                    await self.websocket.send_bytes(payload)
+                else:
+                    await self.websocket.send_text(payload)
+                self.sent += 1
+                self.bytes_sent += len(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # If sending fails, assume disconnected
+            pass
+        self._on_closed(self.websocket)
+
+class RunFeed:
+    """
+    The last `size` events of one run (a ring buffer) and a running summary of all of
+    them, so a client joining mid-run gets the picture without a table read.
+    """
+    def __init__(self, run_id, size: int):
+        self.run_id = run_id
+        self.tail = deque(maxlen=size)
+        self.events = 0
+        self.by_type = Counter()
+        self.last_seq = 0
+
+    def add(self, event):
+        self.tail.append(event)
+        self.events += 1
+        self.by_type[event.get("match_type")] += 1
+        self.last_seq = event.get("seq", self.last_seq)
+
+    def summary(self):
+        return {"run_id": self.run_id, "events": self.events, "by_type": dict(self.by_type), "last_seq": self.last_seq}
+
+    def since(self, seq: int):
+        """
+        Buffered events after `seq`, or None if some of them already left the buffer.
+        """
+        if seq >= self.last_seq:
+            return []
+        if not self.tail or self.tail[0].get("seq", 0) > seq + 1:
+            return None
+        return [e for e in self.tail if e.get("seq", 0) > seq]
 
 class ConnectionManager:
     """
     Manages active WebSocket connections and handles broadcasting messages.
+
+    Match events go through publish(), which only appends to a buffer and never awaits
+    the network. The buffer is handed to the feed backend (see feed_backends) once per
+    tick (`flush_interval_ms`), or sooner once `max_events` are waiting: by a flusher
+    task in processes that listen (the API, from startup on), inline from publish()
+    elsewhere (worker.py). The backend delivers every batch to each listening
+    process, which records it for replay and broadcasts it as a "batch" frame with
+    running totals per match type, clients or not.
+
+    Every event gets a `seq`, counting up per run_id in the publishing process, and
+    a run is published by one process only, so its events keep their order.
+    The last `replay_runs` runs keep a RunFeed; a connecting client first gets a
+    "hello" frame with their summaries, then their buffered tails. A reconnecting
+    client passes the run_id / seq it saw last and only gets what came after; if
+    that run is no longer (or never was) buffered here, it is listed in the hello's
+    "gaps" and the client has to reload.
+    Broadcasting only puts the frame in each client's queue (see ClientConnection);
+    the per-client writers do the sending.
     """
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    def __init__(
+        self,
+        flush_interval_ms: int = None,
+        max_events: int = None,
+        queue_size: int = None,
+        slow_client_policy: str = None,
+        backend=None,
+        replay_events: int = None,
+        replay_runs: int = None
+    ):
+        self.connections: Dict[WebSocket, ClientConnection] = {}
+        self.flush_interval = (config.WS_FLUSH_INTERVAL_MS if flush_interval_ms is None else flush_interval_ms) / 1000
+        self.max_events = config.WS_FLUSH_MAX_EVENTS if max_events is None else max_events
+        self.queue_size = config.WS_SEND_QUEUE_SIZE if queue_size is None else queue_size
+        self.slow_client_policy = slow_client_policy or config.WS_SLOW_CLIENT_POLICY
+        if self.slow_client_policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"Unknown slow-client policy '{self.slow_client_policy}', expected one of {SLOW_CLIENT_POLICIES}")
+        self.backend = backend or create_feed_backend()
+        self.replay_events = config.WS_REPLAY_EVENTS if replay_events is None else replay_events
+        self.replay_runs = config.WS_REPLAY_RUNS if replay_runs is None else replay_runs
+        # run_id -> RunFeed, least recently active first
+        self.runs = OrderedDict()
+        # Events delivered so far, per match type
+        self.totals = Counter()
+        # Last seq handed out, per run_id
+        self._seqs = Counter()
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._wake = None
+        self._flusher = None
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket, run_id: str = None, after_seq: int = None, encoding: str = "json"):
+        """
+        Accepts the client and queues its catch-up frames. With `after_seq`, the tail of
+        run `run_id` starts after that seq; other runs are sent whole.
+        """
         await websocket.accept()
-        self.active_connections.append(websocket)
+        await self.start()
+        connection = ClientConnection(
+            websocket, self.queue_size, self.slow_client_policy, self.disconnect, encoding
+        )
+        self.connections[websocket] = connection
+
+        # Queued before any live frame can be, so the client sees no gap or reordering
+        gaps, replays = [], []
+        for feed in self.runs.values():
+            events = list(feed.tail)
+            if after_seq is not None and feed.run_id == run_id:
+                events = feed.since(after_seq)
+                if events is None:
+                    # Part of what the client missed is gone; it has to reload
+                    gaps.append(feed.run_id)
+                    events = list(feed.tail)
+            replays.append(events)
+        if after_seq and run_id is not None and run_id not in self.runs:
+            # Evicted, or published before this process listened: nothing to resume from
+            gaps.append(run_id)
+        connection.offer(Frame({
+            "type": "hello",
+            "progress": self._progress(),
+            "runs": [feed.summary() for feed in self.runs.values()],
+            "gaps": gaps
+        }), self._snapshot)
+        for events in replays:
+            for start in range(0, len(events), self.max_events):
+                connection.offer(
+                    Frame({"type": "batch", "replay": True, "events": events[start:start + self.max_events]}),
+                    self._snapshot
+                )
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        connection = self.connections.pop(websocket, None)
+        if connection is not None:
+            connection.stop()
 
-    async def broadcast(self, message: dict):
+    def metrics(self):
         """
-        Sends a JSON message to all connected clients.
+        Queue depth, frames sent and frames dropped, per connected client.
         """
-        # Iterate over a copy to avoid modification issues during iteration (though disconnect handles remove)
-        for connection in list(self.active_connections):
+        return [connection.metrics() for connection in self.connections.values()]
+
+    async def start(self):
+        """
+        Starts the flusher task and listens to the backend on the running event loop
+        (again, if the loop changed).
+        """
+        loop = asyncio.get_running_loop()
+        if self._flusher is None or self._flusher.done() or self._flusher.get_loop() is not loop:
+            self._wake = asyncio.Event()
+            self._flusher = loop.create_task(self._run_flusher())
+            await self.backend.listen(self._deliver)
+
+    async def stop(self):
+        """
+        Stops the flusher, publishes whatever is still buffered and stops listening.
+        """
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+            self._send(self._take())
+            await self.backend.close()
+        else:
+            self.flush()
+
+    def publish(self, event: dict):
+        """
+        Queues a match event for the next frame. Never blocks on a client.
+        """
+        run_id = event.get("run_id")
+        self._seqs[run_id] += 1
+        event["seq"] = self._seqs[run_id]
+        self._buffer.append(event)
+
+        if len(self._buffer) >= self.max_events or (
+            self._flusher is None and time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        """
+        Publishes the buffered events: on the flusher's next turn if it runs, otherwise
+        right away in the calling thread.
+        """
+        if self._flusher is not None:
+            self._wake.set()
+        else:
+            self._send(self._take())
+
+    def broadcast(self, message: dict):
+        """
+        Queues a message for every connected client; it is encoded once per encoding.
+        """
+        frame = Frame(message)
+        for connection in list(self.connections.values()):
+            connection.offer(frame, self._snapshot)
+
+    def _take(self):
+        events, self._buffer = self._buffer, []
+        self._last_flush = time.monotonic()
+        return events
+
+    def _send(self, events):
+        """
+        Publishes through the backend. A failure loses these events but never reaches
+        the caller: a run must not fail, nor the flusher stop, over the live feed.
+        """
+        try:
+            for start in range(0, len(events), self.max_events):
+                self.backend.publish(events[start:start + self.max_events])
+        except Exception as e:
+            print(f"Live feed publish failed, {len(events)} events dropped: {str(e)}")
+
+    def _deliver(self, events):
+        """
+        Called by the backend with each published batch, on this process's event loop.
+        """
+        for event in events:
+            self.totals[event.get("match_type")] += 1
+            self._run_feed(event.get("run_id")).add(event)
+        self.broadcast({"type": "batch", "events": events, "progress": self._progress()})
+
+    def _run_feed(self, run_id):
+        feed = self.runs.get(run_id)
+        if feed is None:
+            feed = self.runs[run_id] = RunFeed(run_id, self.replay_events)
+            while len(self.runs) > self.replay_runs:
+                self.runs.popitem(last=False)
+        else:
+            self.runs.move_to_end(run_id)
+        return feed
+
+    def _progress(self):
+        return {"events": sum(self.totals.values()), "by_type": dict(self.totals)}
+
+    def _snapshot(self):
+        # Sent instead of a backlog the client couldn't keep up with; it should reload
+        return Frame({"type": "snapshot", "progress": self._progress()})
+
+    async def _run_flusher(self):
+        while True:
             try:
-                await connection.send_json(message)
-            except:
-                # If sending fails, assume disconnected
-                self.disconnect(connection)
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            events = self._take()
+            if not events:
+                continue
+            if self.backend.shared:
+                # Publishing is a database round trip; keep it off the event loop
+                await asyncio.to_thread(self._send, events)
+            else:
+                self._send(events)
 
 # Global instance
 manager = ConnectionManager()
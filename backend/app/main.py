@@ -13,13 +13,27 @@ from app.api.v1.endpoints.ledger import router as ledger_router
 from app.api.v1.endpoints.reconcile import router as reconcile_router
 from app.api.v1.endpoints.auth import router as auth_router
 from app.api.v1.endpoints.users import router as users_router
+from app.core.websocket import manager
+from app.core.schema_upgrade import upgrade_schema
 
 # --- DATABASE INIT ---
 # This line creates the tables in the database file if they don't exist
 Base.metadata.create_all(bind=engine)
+# ...and adds the columns newer versions put on tables that already existed
+upgrade_schema(engine)
 
 app = FastAPI(title="Financial Reconciliation Engine")
 
+@app.on_event("startup")
+async def start_live_feed():
+    # Listen from the start, so runs are recorded for replay before any client connects
+    await manager.start()
+
+@app.on_event("shutdown")
+async def flush_live_feed():
+    # Send whatever the live feed still has buffered before the sockets close
+    await manager.stop()
+
 # --- CORS MIDDLEWARE ---
 # --- CORS MIDDLEWARE ---
 # Get allowed origins from env (comma separated list) or default to localhost
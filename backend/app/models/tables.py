@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Integer, Boolean, Date, DateTime, Numeric, ForeignKey, Enum
+from sqlalchemy import Column, String, Integer, Boolean, Date, DateTime, Numeric, ForeignKey, Enum, JSON
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 
@@ -47,6 +47,8 @@ class Transaction(Base):
     description = Column(String, nullable=True)
     external_ref_id = Column(String, nullable=True, index=True)
     raw_source = Column(String, nullable=True) 
+    # When the row was uploaded; incremental runs only look at rows newer than their watermark
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     
     statement_id = Column(String, ForeignKey("bank_statements.id"))
     
@@ -63,6 +65,7 @@ class InternalLedger(Base):
     amount = Column(Numeric(14, 2), nullable=False)
     description = Column(String, nullable=True)
     gl_code = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     
     reconciliation_match = relationship("ReconciliationMatch", back_populates="ledger", uselist=False)
 
@@ -77,7 +80,120 @@ class ReconciliationMatch(Base):
     
     match_type = Column(String)
     confidence_score = Column(Numeric(3, 2))
+    # Split matches (one row settling several on the other side) are stored as several
+    # rows sharing a group_id; only one row per group carries both sides.
+    group_id = Column(String, nullable=True, index=True)
+    # Run that wrote the match (None for matches made on upload); lets a run be rolled back
+    run_id = Column(String, nullable=True, index=True)
     matched_at = Column(DateTime, default=datetime.utcnow)
+    # Whether learn_patterns() already counted this match in match_patterns
+    patterns_learned = Column(Boolean, default=False, nullable=False, index=True)
+    # Whether learn_lags() already counted this match in counterparty_lags
+    lags_learned = Column(Boolean, default=False, nullable=False, index=True)
     
     transaction = relationship("Transaction", back_populates="reconciliation_match")
-    ledger = relationship("InternalLedger", back_populates="reconciliation_match")
\ No newline at end of file
+    ledger = relationship("InternalLedger", back_populates="reconciliation_match")
+
+# --- 6. RECONCILIATION RUNS ---
+class ReconciliationRun(Base):
+    __tablename__ = "reconciliation_runs"
+
+    id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
+
+    mode = Column(String)
+    incremental = Column(Boolean, default=False)
+    status = Column(String, default="running") # 'running', 'completed', 'failed', 'interrupted', 'rolled_back'
+    # Rows created before this moment were visible to the run; the next incremental
+    # run only evaluates rows created after it
+    watermark = Column(DateTime, nullable=False)
+    # Filters the run was limited to (see ReconciliationScope); "{}" means everything
+    scope = Column(JSON, nullable=True)
+    scope_key = Column(String, index=True, default="{}")
+    started_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    results = Column(JSON, nullable=True)
+    # Seconds spent fetching / matching / persisting, and per pass the candidates,
+    # ambiguous rows, matches and time (see RunStats)
+    stats = Column(JSON, nullable=True)
+    # Passes committed so far, plus the pass / batch count in progress; written in the
+    # same transaction as the matches. heartbeat_at is the time of the last checkpoint
+    checkpoint = Column(JSON, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    # The interrupted run ('interrupted' status) this one picked up from
+    resumed_from = Column(String, nullable=True)
+    # Set when rolled back: matches deleted and the date span of the rows they released
+    rollback = Column(JSON, nullable=True)
+    # The rolled-back run whose rows this run reprocessed
+    rerun_of = Column(String, nullable=True)
+
+# --- 7. MATCH PATTERNS ---
+class MatchPattern(Base):
+    __tablename__ = "match_patterns"
+
+    id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
+
+    # counterparty_key() of the bank description, e.g. "AWS" for "POS DEBIT AWS #8832"
+    bank_key = Column(String, nullable=False, index=True)
+    # What that bank counterparty was matched to on the ledger side
+    ledger_key = Column(String, nullable=False)
+    gl_code = Column(String, nullable=True)
+    # How many matches confirmed this pattern, and the newest of them
+    hits = Column(Integer, default=0)
+    last_matched_at = Column(DateTime, nullable=True, index=True)
+
+# --- 7b. COUNTERPARTY LAGS ---
+class CounterpartyLag(Base):
+    __tablename__ = "counterparty_lags"
+
+    id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
+
+    # counterparty_key() of the bank description, and one |ledger date - bank date|
+    # seen for it: a histogram of its lags, from which adaptive windows are read
+    bank_key = Column(String, nullable=False, index=True)
+    lag_days = Column(Integer, nullable=False)
+    hits = Column(Integer, default=0)
+
+# --- 8. RECONCILIATION JOBS ---
+class ReconciliationJob(Base):
+    __tablename__ = "reconciliation_jobs"
+
+    id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
+
+    status = Column(String, default="queued", index=True) # 'queued', 'running', 'completed', 'failed'
+    incremental = Column(Boolean, default=False)
+    # Same meaning as on ReconciliationRun; only one job per overlapping scope is queued or running
+    scope = Column(JSON, nullable=True)
+    scope_key = Column(String, index=True, default="{}")
+    # Extra MatchingEngine arguments (mode, date_window_days, rerun_of, ...)
+    options = Column(JSON, nullable=True)
+    # Worker that claimed the job, and the run it produced
+    worker = Column(String, nullable=True)
+    run_id = Column(String, nullable=True)
+    # Passes committed / matches written so far, then the run's results
+    progress = Column(JSON, nullable=True)
+    results = Column(JSON, nullable=True)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # Last progress report; a running job that stops reporting is handed out again
+    heartbeat_at = Column(DateTime, nullable=True)
+
+# --- 9. LIVE FEED EVENTS ---
+class FeedEvent(Base):
+    __tablename__ = "feed_events"
+
+    # Outbox of the "polling" live-feed backend: each row is one batch of match events,
+    # read back in id order by every API process, and pruned after a while
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    events = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+# --- 10. JOB QUEUE LOCK ---
+class JobQueueLock(Base):
+    __tablename__ = "job_queue_lock"
+
+    # A single row. Enqueueing a job updates it first, which takes a row lock on
+    # Postgres and the write lock on SQLite, so two overlap checks never race
+    id = Column(Integer, primary_key=True)
+    locked_at = Column(DateTime, nullable=True)
@@ -43,4 +43,28 @@ class LedgerOut(LedgerBase):
     id: str
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# --- RECONCILIATION SCHEMAS ---
+class ReconcileScope(BaseModel):
+    """
+    Optional filters for a reconciliation run; leave everything empty to reconcile all data.
+    """
+    statement_ids: Optional[List[str]] = None
+    bank_name: Optional[str] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    gl_code_prefixes: Optional[List[str]] = None
+
+class RerunOptions(BaseModel):
+    """
+    Matching parameters for re-running a rolled-back run; unset fields use the defaults.
+    """
+    mode: Optional[str] = None
+    date_window_days: Optional[int] = None
+    assignment: Optional[str] = None
+    adaptive_windows: Optional[bool] = None
+    pattern_matching: Optional[bool] = None
+    tolerance_matching: Optional[bool] = None
+    split_matching: Optional[bool] = None
+    description_matching: Optional[bool] = None
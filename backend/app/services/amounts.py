@@ -0,0 +1,11 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+def to_cents(amount):
+    """
+    Absolute amount as integer cents, rounded half up like sql_matcher.cents_expr and
+    the Numeric(14, 2) columns: an unrounded upload of 19.999 is 2000, same as the
+    20.00 the database stores for it.
+    """
+    if not isinstance(amount, Decimal):
+        amount = Decimal(str(amount))
+    return int((abs(amount) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
@@ -0,0 +1,61 @@
+from typing import List, Tuple
+
+def min_cost_assignment(cost: List[List[float]]) -> List[Tuple[int, int]]:
+    """
+    Solves a (possibly rectangular) min-cost assignment with the Hungarian algorithm.
+    Returns (row, col) pairs; every row of the smaller side gets exactly one column.
+
+    Pure Python, O(n^2 * m) - meant for the small blocks the matching engine builds,
+    not for whole ledgers.
+    """
+    if not cost or not cost[0]:
+        return []
+
+    # The algorithm below assigns rows into columns, so it needs rows <= columns
+    if len(cost) > len(cost[0]):
+        transposed = [list(col) for col in zip(*cost)]
+        return [(row, col) for col, row in min_cost_assignment(transposed)]
+
+    n, m = len(cost), len(cost[0])
+    inf = float("inf")
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    owner = [0] * (m + 1) # owner[j] = row (1-based) assigned to column j
+    way = [0] * (m + 1)
+
+    for i in range(1, n + 1):
+        owner[0] = i
+        j0 = 0
+        minv = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = owner[j0]
+            delta = inf
+            j1 = 0
+            row = cost[i0 - 1]
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = row[j - 1] - u[i0] - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[owner[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if owner[j0] == 0:
+                break
+        # Walk the augmenting path back to the start
+        while j0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+
+    return [(owner[j] - 1, j - 1) for j in range(1, m + 1) if owner[j]]
@@ -0,0 +1,131 @@
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.models import tables
+from app.services.reconciliation_scope import ReconciliationScope
+from app.services.sql_matcher import cents_expr, day_number_expr, unmatched_clause
+
+# (absolute cents, day number, rank inside the (cents, day) group)
+KEY_DTYPE = [("cents", "i8"), ("day", "i8"), ("rank", "i8")]
+
+class ColumnarMatcher:
+    """
+    Matching core that works on NumPy columns instead of ORM objects.
+
+    Only the id, the absolute amount in integer cents and the day number of each
+    unmatched row are loaded (computed by the database), so no Decimal or date objects
+    are created. Pairing uses the same rules as the Python engine: the n-th bank row of
+    an (amount, day) group takes the n-th ledger row of the target group, and the
+    fuzzy_date pass tries offsets -1, +1, -2, +2, ... so the closest date wins.
+    """
+    def __init__(self, db: Session = None, scope: ReconciliationScope = None):
+        # db is optional: worker processes get their columns handed over via set_columns
+        self.db = db
+        self.scope = scope or ReconciliationScope()
+        self.dialect = db.get_bind().dialect.name if db is not None else None
+
+    def load(self):
+        """
+        Loads both sides as columns. Returns (bank rows, ledger rows) loaded.
+        """
+        self.set_columns(
+            self._load_columns(tables.Transaction, tables.ReconciliationMatch.transaction_id),
+            self._load_columns(tables.InternalLedger, tables.ReconciliationMatch.ledger_id)
+        )
+        return len(self.bank_ids), len(self.ledger_ids)
+
+    def set_columns(self, bank, ledger):
+        """
+        Uses already loaded (ids, cents, days) columns for each side; all rows start open.
+        """
+        self.bank_ids, self.bank_cents, self.bank_days = bank
+        self.ledger_ids, self.ledger_cents, self.ledger_days = ledger
+        self.bank_open = np.ones(len(self.bank_ids), dtype=bool)
+        self.ledger_open = np.ones(len(self.ledger_ids), dtype=bool)
+
+    def partitions(self, count):
+        """
+        Splits both sides into `count` independent partitions by amount. Rows only
+        ever pair with rows of the same absolute amount, so no pair crosses partitions.
+        Load order is kept inside each partition.
+        """
+        parts = []
+        for p in range(count):
+            bank_mask = self.bank_cents % count == p
+            ledger_mask = self.ledger_cents % count == p
+            parts.append((
+                (self.bank_ids[bank_mask], self.bank_cents[bank_mask], self.bank_days[bank_mask]),
+                (self.ledger_ids[ledger_mask], self.ledger_cents[ledger_mask], self.ledger_days[ledger_mask])
+            ))
+        return parts
+
+    def pair_on_offset(self, offset):
+        """
+        Pairs open bank rows with open ledger rows dated `offset` days later.
+        Returns a list of (transaction_id, ledger_id) and closes the paired rows.
+        """
+        bank_idx = np.flatnonzero(self.bank_open)
+        ledger_idx = np.flatnonzero(self.ledger_open)
+        if not len(bank_idx) or not len(ledger_idx):
+            return []
+
+        bank_keys = self._keys(self.bank_cents[bank_idx], self.bank_days[bank_idx] + offset)
+        ledger_keys = self._keys(self.ledger_cents[ledger_idx], self.ledger_days[ledger_idx])
+
+        # Sort the ledger keys once, then locate every bank key with one searchsorted
+        order = np.argsort(ledger_keys, kind="stable")
+        sorted_keys = ledger_keys[order]
+        pos = np.searchsorted(sorted_keys, bank_keys)
+        in_range = pos < len(sorted_keys)
+        hit = np.zeros(len(bank_keys), dtype=bool)
+        hit[in_range] = sorted_keys[pos[in_range]] == bank_keys[in_range]
+
+        matched_bank = bank_idx[hit]
+        matched_ledger = ledger_idx[order[pos[hit]]]
+        self.bank_open[matched_bank] = False
+        self.ledger_open[matched_ledger] = False
+        return list(zip(self.bank_ids[matched_bank], self.ledger_ids[matched_ledger]))
+
+    def open_bank_ids(self):
+        """
+        Ids of bank rows nobody paired with, in load order.
+        """
+        return list(self.bank_ids[self.bank_open])
+
+    def _load_columns(self, model, match_fk):
+        stmt = select(
+            model.id,
+            cents_expr(model.amount),
+            day_number_expr(model.date, self.dialect)
+        ).where(
+            unmatched_clause(model, match_fk), *self.scope.filters_for(model)
+        ).order_by(model.date, model.id)
+
+        rows = self.db.execute(stmt).all()
+        ids = np.array([r[0] for r in rows], dtype=object)
+        cents = np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows))
+        days = np.fromiter((r[2] for r in rows), dtype=np.int64, count=len(rows))
+        return ids, cents, days
+
+    @staticmethod
+    def _keys(cents, days):
+        """
+        Builds (cents, day, rank) keys; rank numbers the rows of each (cents, day)
+        group in their current (load) order.
+        """
+        order = np.lexsort((days, cents)) # stable, so load order is kept inside a group
+        sorted_cents, sorted_days = cents[order], days[order]
+
+        group_start = np.ones(len(order), dtype=bool)
+        group_start[1:] = (sorted_cents[1:] != sorted_cents[:-1]) | (sorted_days[1:] != sorted_days[:-1])
+        starts = np.flatnonzero(group_start)
+        group_of = np.cumsum(group_start) - 1
+
+        ranks = np.empty(len(order), dtype=np.int64)
+        ranks[order] = np.arange(len(order)) - starts[group_of]
+
+        keys = np.empty(len(order), dtype=KEY_DTYPE)
+        keys["cents"] = cents
+        keys["day"] = days
+        keys["rank"] = ranks
+        return keys
@@ -0,0 +1,99 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+import numpy as np
+from app.services.similarity import similarity_matrix
+from app.services.amounts import to_cents
+
+class DescriptionMatcher:
+    """
+    Pairs leftover rows whose descriptions are similar.
+
+    Candidates are blocked first, so no N x M similarity matrix is ever built: bank
+    rows are grouped by amount bucket, sorted by date and cut into chunks of at most
+    `block_size`. Each chunk is scored (TF-IDF char n-grams, one matrix product)
+    against the ledger rows of the neighbouring buckets inside the chunk's date span.
+    Pairs must also differ by at most one bucket in amount and `date_window_days`
+    in date; the best-scoring pairs above `min_similarity` are taken one-to-one.
+    """
+    def __init__(self, date_window_days: int, bucket_cents: int, min_similarity: float, block_size: int):
+        self.date_window_days = date_window_days
+        self.bucket_cents = bucket_cents
+        self.min_similarity = min_similarity
+        self.block_size = block_size
+        # (bank, ledger) pairs scored by the last match()
+        self.candidates = 0
+
+    def match(self, bank_rows, ledger_rows):
+        """
+        Returns (bank_tx, ledger_entry, similarity) triples.
+        """
+        ledger_buckets = defaultdict(list)
+        for entry in ledger_rows:
+            ledger_buckets[to_cents(entry.amount) // self.bucket_cents].append(entry)
+        ledger_ordinals = {}
+        for bucket, entries in ledger_buckets.items():
+            entries.sort(key=lambda e: e.date.toordinal())
+            ledger_ordinals[bucket] = [e.date.toordinal() for e in entries]
+
+        bank_buckets = defaultdict(list)
+        for bank_tx in bank_rows:
+            bank_buckets[to_cents(bank_tx.amount) // self.bucket_cents].append(bank_tx)
+
+        taken = set()
+        pairs = []
+        for bucket in sorted(bank_buckets):
+            banks = sorted(bank_buckets[bucket], key=lambda b: b.date.toordinal())
+            for start in range(0, len(banks), self.block_size):
+                chunk = banks[start:start + self.block_size]
+                candidates = self._candidates(chunk, bucket, ledger_buckets, ledger_ordinals, taken)
+                if candidates:
+                    self.candidates += len(chunk) * len(candidates)
+                    pairs.extend(self._score_block(chunk, candidates, taken))
+        return pairs
+
+    def _candidates(self, chunk, bucket, ledger_buckets, ledger_ordinals, taken):
+        """
+        Untaken ledger rows in the neighbouring amount buckets, dated within the
+        chunk's date span widened by the window.
+        """
+        first = chunk[0].date.toordinal() - self.date_window_days
+        last = chunk[-1].date.toordinal() + self.date_window_days
+        candidates = []
+        for neighbour in (bucket - 1, bucket, bucket + 1):
+            ordinals = ledger_ordinals.get(neighbour)
+            if not ordinals:
+                continue
+            lo, hi = bisect_left(ordinals, first), bisect_right(ordinals, last)
+            candidates.extend(e for e in ledger_buckets[neighbour][lo:hi] if id(e) not in taken)
+        return candidates
+
+    def _score_block(self, chunk, candidates, taken):
+        scores = similarity_matrix(
+            [b.description for b in chunk],
+            [e.description for e in candidates]
+        )
+
+        # Rule out pairs outside the date window or more than one bucket apart
+        bank_days = np.array([b.date.toordinal() for b in chunk])
+        ledger_days = np.array([e.date.toordinal() for e in candidates])
+        bank_cents = np.array([to_cents(b.amount) for b in chunk])
+        ledger_cents = np.array([to_cents(e.amount) for e in candidates])
+        allowed = (
+            (np.abs(bank_days[:, None] - ledger_days[None, :]) <= self.date_window_days)
+            & (np.abs(bank_cents[:, None] - ledger_cents[None, :]) <= self.bucket_cents)
+        )
+        scores = np.where(allowed, scores, 0.0)
+
+        # Best pairs first; each row on either side is used once
+        rows, cols = np.nonzero(scores >= self.min_similarity)
+        order = np.argsort(-scores[rows, cols], kind="stable")
+        used_banks = set()
+        pairs = []
+        for k in order:
+            i, j = rows[k], cols[k]
+            if i in used_banks or id(candidates[j]) in taken:
+                continue
+            used_banks.add(i)
+            taken.add(id(candidates[j]))
+            pairs.append((chunk[i], candidates[j], float(scores[i, j])))
+        return pairs
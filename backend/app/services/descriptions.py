@@ -0,0 +1,27 @@
+import re
+from typing import List
+
+# Words banks and ledgers add around the counterparty name; they say nothing about who paid
+NOISE_TOKENS = {
+    "POS", "DEBIT", "CREDIT", "CARD", "WIRE", "DEPOSIT", "TRANSFER", "ACH", "SEPA",
+    "FROM", "TO", "FOR", "PAYMENT", "PMT", "INV", "INVOICE", "REF", "THE", "AND", "OF"
+}
+
+_TOKEN_RE = re.compile(r"[A-Z][A-Z&]+")
+
+def description_tokens(description: str) -> List[str]:
+    """
+    Uppercase word tokens of a description with numbers, punctuation and banking
+    noise words removed, e.g. "POS DEBIT AWS #8832" -> ["AWS"].
+    """
+    if not description:
+        return []
+    return [t for t in _TOKEN_RE.findall(description.upper()) if t not in NOISE_TOKENS]
+
+def counterparty_key(description: str) -> str:
+    """
+    A stable key for "who is on the other side", shared by the bank and ledger
+    wording of the same counterparty ("WIRE DEPOSIT FROM Acme Corp" and
+    "Inv #1234 - Acme Corp" both give "ACME CORP").
+    """
+    return " ".join(sorted(set(description_tokens(description))))
@@ -0,0 +1,218 @@
+import uuid
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.core import config
+from app.models import tables
+from app.services.amounts import to_cents
+from app.services.sql_matcher import unmatched_clause
+
+class OpenRows:
+    """
+    Unmatched rows of one side, indexed by absolute cents and date ordinal.
+    Each (cents, ordinal) slot is a queue, so the oldest row is taken first.
+    """
+    def __init__(self):
+        self.slots = defaultdict(lambda: defaultdict(deque))
+        self.rows = {}
+
+    def add(self, row):
+        self.rows[row["id"]] = row
+        self.slots[row["cents"]][row["ordinal"]].append(row["id"])
+
+    def take(self, cents, ordinal, window):
+        """
+        Removes and returns the open row closest to `ordinal` (earlier date first on a
+        tie, same order as the batch engine) within `window` days, or None.
+        """
+        by_day = self.slots.get(cents)
+        if not by_day:
+            return None
+        for offset in [0] + [o for d in range(1, window + 1) for o in (-d, d)]:
+            queue = by_day.get(ordinal + offset)
+            if queue:
+                row = self.rows.pop(queue.popleft())
+                if not queue:
+                    del by_day[ordinal + offset]
+                if not by_day:
+                    del self.slots[cents]
+                return row
+        return None
+
+class IngestionMatcher:
+    """
+    Matches rows while they are uploaded instead of waiting for the next run.
+
+    Keeps a warm, in-process index of the unmatched rows of both sides (loaded on first
+    use). Every uploaded row is looked up in the other side's index: same day first,
+    then -1, +1, ... days up to the fuzzy window. Hits are written as exact / fuzzy_date
+    matches and broadcast right away; misses join their own side's index.
+
+    The index belongs to one process. Runs change the data underneath it, so the
+    engine drops it when a run starts and ends, and nothing is matched during a run.
+    Other processes (a worker running the engine, another API process) can still match
+    rows behind its back, so pairs are checked against the database before they are
+    written; on a conflict the index is reloaded and the upload looked up once more.
+    """
+    def __init__(self, date_window_days: int = None):
+        self.date_window_days = config.FUZZY_DATE_WINDOW_DAYS if date_window_days is None else date_window_days
+        self.bank = None
+        self.ledger = None
+
+    @property
+    def warm(self):
+        return self.bank is not None
+
+    def invalidate(self):
+        self.bank = None
+        self.ledger = None
+
+    async def ingest_bank(self, db: Session, rows, websocket_manager=None):
+        """
+        Matches freshly uploaded bank rows (dicts with id, date, amount, description).
+        Returns the number of matches written.
+        """
+        return await self._ingest(db, rows, "bank", websocket_manager)
+
+    async def ingest_ledger(self, db: Session, rows, websocket_manager=None):
+        return await self._ingest(db, rows, "ledger", websocket_manager)
+
+    async def _ingest(self, db, rows, side, websocket_manager):
+        if self._run_in_progress(db):
+            # The run will see these rows (or the next one will); don't race its inserts
+            self.invalidate()
+            return 0
+        for attempt in range(2):
+            if not self.warm:
+                # The uploaded rows are already committed; they go through the lookup below
+                self._warm_up(db, exclude={row["id"] for row in rows})
+            pairs = self._pair(rows, side)
+            if not pairs:
+                return 0
+            match_rows = self._write_matches(db, pairs)
+            if match_rows is not None:
+                break
+            # The index was stale: drop it, so the retry (or the next upload) reloads it
+            self.invalidate()
+        else:
+            # Still conflicting; the next run picks these rows up
+            return 0
+
+        if websocket_manager:
+            for match_row, (bank_row, ledger_row) in zip(match_rows, pairs):
+                websocket_manager.publish({
+                    "id": match_row["id"],
+                    "match_type": match_row["match_type"],
+                    "amount": float(bank_row["amount"]),
+                    "date": str(bank_row["date"]),
+                    "bank_desc": bank_row["description"],
+                    "ledger_desc": ledger_row["description"],
+                    "confidence": match_row["confidence_score"]
+                })
+            websocket_manager.flush()
+        return len(pairs)
+
+    def _pair(self, rows, side):
+        own, other = (self.bank, self.ledger) if side == "bank" else (self.ledger, self.bank)
+        pairs = []
+        for row in rows:
+            row = self._open_row(row)
+            partner = other.take(row["cents"], row["ordinal"], self.date_window_days)
+            if partner is None:
+                own.add(row)
+            else:
+                pairs.append((row, partner) if side == "bank" else (partner, row))
+        return pairs
+
+    def _write_matches(self, db, pairs):
+        """
+        Writes the pairs as matches and returns the rows written, or None (nothing
+        written) if another process matched one of the rows since the index was loaded.
+        """
+        now = datetime.utcnow()
+        match_rows = []
+        for bank_row, ledger_row in pairs:
+            exact = bank_row["ordinal"] == ledger_row["ordinal"]
+            match_rows.append({
+                "id": str(uuid.uuid4()),
+                "transaction_id": bank_row["id"],
+                "ledger_id": ledger_row["id"],
+                "match_type": "exact" if exact else "fuzzy_date",
+                "confidence_score": 1.0 if exact else 0.85,
+                "matched_at": now,
+                "group_id": None
+            })
+        bank_ids = [bank_row["id"] for bank_row, _ in pairs]
+        ledger_ids = [ledger_row["id"] for _, ledger_row in pairs]
+        try:
+            if self._already_matched(db, bank_ids, ledger_ids):
+                db.rollback()
+                return None
+            # A bank row reported as a mismatch by an earlier run is matched now
+            for start in range(0, len(bank_ids), 500):
+                db.execute(delete(tables.ReconciliationMatch).where(
+                    tables.ReconciliationMatch.match_type == "mismatch",
+                    tables.ReconciliationMatch.transaction_id.in_(bank_ids[start:start + 500])
+                ))
+            db.execute(insert(tables.ReconciliationMatch), match_rows)
+            db.commit()
+        except IntegrityError:
+            # Matched by another process between the check and the insert
+            db.rollback()
+            return None
+        except Exception:
+            db.rollback()
+            self.invalidate()
+            raise
+        return match_rows
+
+    @staticmethod
+    def _already_matched(db, bank_ids, ledger_ids):
+        """
+        Whether any of the rows has a match in the database (a bank row's 'mismatch'
+        does not count).
+        """
+        M = tables.ReconciliationMatch
+        checks = ((M.transaction_id, bank_ids, (M.match_type != "mismatch",)), (M.ledger_id, ledger_ids, ()))
+        for column, ids, extra in checks:
+            for start in range(0, len(ids), 500):
+                if db.execute(select(M.id).where(column.in_(ids[start:start + 500]), *extra).limit(1)).first():
+                    return True
+        return False
+
+    def _warm_up(self, db, exclude):
+        self.bank, self.ledger = OpenRows(), OpenRows()
+        sides = (
+            (self.bank, tables.Transaction, tables.ReconciliationMatch.transaction_id),
+            (self.ledger, tables.InternalLedger, tables.ReconciliationMatch.ledger_id),
+        )
+        for index, model, match_fk in sides:
+            stmt = select(model.id, model.date, model.amount, model.description).where(
+                unmatched_clause(model, match_fk)
+            ).order_by(model.date, model.id)
+            for id_, date_, amount, description in db.execute(stmt):
+                if id_ in exclude:
+                    continue
+                index.add(self._open_row({"id": id_, "date": date_, "amount": amount, "description": description}))
+
+    @staticmethod
+    def _open_row(row):
+        return dict(row, cents=to_cents(row["amount"]), ordinal=row["date"].toordinal())
+
+    @staticmethod
+    def _run_in_progress(db):
+        """
+        Whether a run is live: 'running' with a checkpoint within RUN_STALE_SECONDS.
+        One left 'running' by a crashed process (see MatchingEngine._interrupted_run)
+        doesn't hold ingestion matching back.
+        """
+        R = tables.ReconciliationRun
+        stale_before = datetime.utcnow() - timedelta(seconds=config.RUN_STALE_SECONDS)
+        return db.query(R.id).filter(
+            R.status == "running", R.heartbeat_at >= stale_before
+        ).first() is not None
+
+# Global instance, shared by the upload endpoints and the engine
+ingestion_matcher = IngestionMatcher()
@@ -0,0 +1,179 @@
+import asyncio
+import threading
+import traceback
+from datetime import datetime, timedelta
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.core import config
+from app.core.websocket import manager
+from app.models import tables
+from app.services.matching_engine import MatchingEngine
+from app.services.reconciliation_scope import ReconciliationScope
+
+ACTIVE_STATUSES = ("queued", "running")
+
+class ScopeBusy(Exception):
+    """
+    Raised by enqueue_job when a job for an overlapping scope is already queued or running.
+    """
+    def __init__(self, job):
+        super().__init__(f"Job {job.id} is already {job.status} for this scope")
+        self.job = job
+
+def _lock_queue(db: Session):
+    """
+    Holds the queue lock until the caller commits or rolls back, so only one process
+    at a time checks a new job against the active ones (enqueue_job). Claiming
+    doesn't need it.
+    """
+    Q = tables.JobQueueLock
+    if db.execute(update(Q).where(Q.id == 1).values(locked_at=datetime.utcnow())).rowcount:
+        return
+    # First use: create the lock row; if another process just did, lock theirs
+    try:
+        db.add(Q(id=1, locked_at=datetime.utcnow()))
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        db.execute(update(Q).where(Q.id == 1).values(locked_at=datetime.utcnow()))
+
+def _first_overlapping(jobs, scope: ReconciliationScope):
+    for job in jobs:
+        if ReconciliationScope.from_dict(job.scope).overlaps(scope):
+            return job
+    return None
+
+def enqueue_job(db: Session, scope: ReconciliationScope = None, incremental: bool = False, options: dict = None):
+    """
+    Queues a reconciliation run and returns the job; `options` are passed on to
+    MatchingEngine. Raises ScopeBusy if an overlapping job is still queued or running.
+    """
+    J = tables.ReconciliationJob
+    scope = scope or ReconciliationScope()
+    _lock_queue(db)
+    active = _first_overlapping(
+        db.query(J).filter(J.status.in_(ACTIVE_STATUSES)).order_by(J.created_at), scope
+    )
+    if active:
+        busy = ScopeBusy(active)
+        db.rollback()
+        raise busy
+
+    job = J(
+        status="queued",
+        incremental=bool(incremental),
+        scope=scope.to_dict(),
+        scope_key=scope.key,
+        options=options or None
+    )
+    db.add(job)
+    db.commit()
+    return job
+
+def claim_job(db: Session, worker: str):
+    """
+    Claims the oldest queued job. Returns the job (now 'running') or None.
+
+    No scope check is needed here: enqueue_job, under the queue lock, refuses a job
+    that overlaps any queued or running one, so active jobs never overlap each other.
+    On Postgres the candidate is read with FOR UPDATE SKIP LOCKED, so workers don't
+    queue up behind each other; SQLite has no row locks and ignores it. Either way the
+    claim itself is a conditional UPDATE (status still 'queued'), so only one worker
+    can win a job.
+    """
+    J = tables.ReconciliationJob
+    # Jobs whose worker died (e.g. a deploy) go back in the queue; their run resumes
+    # from its last checkpoint
+    stale_before = datetime.utcnow() - timedelta(seconds=config.RUN_STALE_SECONDS)
+    db.execute(update(J).where(
+        J.status == "running", func.coalesce(J.heartbeat_at, J.started_at) < stale_before
+    ).values(status="queued", worker=None))
+    db.commit()
+
+    job = db.query(J).filter(J.status == "queued").order_by(J.created_at).limit(1).with_for_update(
+        skip_locked=True
+    ).first()
+    if job is None:
+        db.rollback()
+        return None
+
+    now = datetime.utcnow()
+    claimed = db.execute(
+        update(J).where(J.id == job.id, J.status == "queued").values(
+            status="running", worker=worker, started_at=now, heartbeat_at=now
+        )
+    ).rowcount
+    db.commit()
+    if not claimed:
+        return None
+    db.refresh(job)
+    return job
+
+def run_job(job_id: str, session_factory):
+    """
+    Runs a claimed job to completion in the calling process. The engine gets its own
+    session; job bookkeeping (progress, status) goes through a second one so it is
+    never rolled back with a failed pass. Dry runs keep their report in the job's results.
+    """
+    J = tables.ReconciliationJob
+    job_db = session_factory()
+    engine_db = session_factory()
+    try:
+        job = job_db.get(J, job_id)
+
+        def report(progress):
+            job.progress = progress
+            job_db.commit()
+
+        engine = None
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=_beat, args=(job_id, session_factory, stop), daemon=True)
+        heartbeat.start()
+        try:
+            # Inside the try: bad options (e.g. mode="optimal" with sql) fail the job, not the worker
+            engine = MatchingEngine(
+                engine_db,
+                incremental=job.incremental,
+                scope=ReconciliationScope.from_dict(job.scope),
+                on_progress=report,
+                **(job.options or {})
+            )
+            # With a shared feed backend the API processes relay this run's events live
+            feed = manager if manager.backend.shared and not engine.dry_run else None
+            job.results = asyncio.run(engine.run(feed))
+            job.status = "completed"
+        except Exception as e:
+            traceback.print_exc()
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            stop.set()
+            heartbeat.join()
+        job.run_id = engine.run_id if engine is not None else None
+        job.finished_at = datetime.utcnow()
+        job_db.commit()
+        return job.status
+    finally:
+        engine_db.close()
+        job_db.close()
+
+def _beat(job_id, session_factory, stop):
+    """
+    Touches the job's heartbeat_at every JOB_HEARTBEAT_SECONDS while it runs, so a
+    long pass without progress reports isn't mistaken for a dead worker. A failed
+    beat is logged and the next one tried as usual.
+    """
+    J = tables.ReconciliationJob
+    while not stop.wait(config.JOB_HEARTBEAT_SECONDS):
+        db = session_factory()
+        try:
+            db.execute(update(J).where(J.id == job_id).values(heartbeat_at=datetime.utcnow()))
+            db.commit()
+        except Exception as e:
+            # E.g. "database is locked" while a SQLite pass holds the write lock. Keep
+            # beating: a dead heartbeat gets a running job handed to a second worker
+            db.rollback()
+            print(f"Heartbeat of job {job_id} failed, retrying: {str(e)}")
+        finally:
+            db.close()
@@ -0,0 +1,136 @@
+import math
+from collections import defaultdict
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from app.models import tables
+from app.services.descriptions import counterparty_key
+from app.services.sql_matcher import day_number_expr
+
+# Learned windows get one spare day on top of the observed lag, so a counterparty
+# that starts clearing slower can still be matched (and then learned from)
+LEARNING_MARGIN_DAYS = 1
+
+class LagProfiles:
+    """
+    Fuzzy_date windows per counterparty, learned from past matches.
+
+    For every counterparty (see counterparty_key) with at least `min_samples` matched
+    pairs, the window is the `quantile` of |ledger date - bank date| plus a spare day,
+    capped at `max_days`. Counterparties without enough history keep the default window.
+    The lags come from the counterparty_lags histograms that learn_lags() keeps.
+    """
+    def __init__(self, windows, default_window: int):
+        self.windows = windows
+        self.default_window = default_window
+        self._memo = {}
+
+    @classmethod
+    def from_histograms(cls, histograms, default_window: int, min_samples: int, quantile: float, max_days: int):
+        """
+        `histograms`: counterparty -> {lag in days: number of pairs}.
+        """
+        windows = {}
+        for key, histogram in histograms.items():
+            samples = sum(histogram.values())
+            if samples < min_samples:
+                continue
+            # Position of the quantile among the sorted lags, as with a list of them
+            position = min(samples - 1, math.ceil(quantile * samples) - 1)
+            seen = 0
+            for lag in sorted(histogram):
+                seen += histogram[lag]
+                if seen > position:
+                    windows[key] = min(max_days, lag + LEARNING_MARGIN_DAYS)
+                    break
+        return cls(windows, default_window)
+
+    def window_for(self, description):
+        if description not in self._memo:
+            self._memo[description] = self.windows.get(counterparty_key(description), self.default_window)
+        return self._memo[description]
+
+    @property
+    def max_window(self):
+        return max([self.default_window, *self.windows.values()])
+
+def load_lag_profiles(db: Session, default_window: int, min_samples: int, quantile: float, max_days: int):
+    """
+    Returns LagProfiles from the learned histograms. Only reads counterparty_lags
+    (a row per counterparty and lag), never the match history itself.
+    """
+    C = tables.CounterpartyLag
+    histograms = defaultdict(dict)
+    for bank_key, lag_days, hits in db.execute(select(C.bank_key, C.lag_days, C.hits).where(C.hits > 0)):
+        histograms[bank_key][lag_days] = hits
+    return LagProfiles.from_histograms(histograms, default_window, min_samples, quantile, max_days)
+
+def learn_lags(db: Session, before):
+    """
+    Adds the lags of the one-to-one matches made before `before` (a run's start, so
+    never its own uncommitted matches) and not learned yet to counterparty_lags, and
+    flags them, in one transaction. Returns the number of matches learned.
+    """
+    M = tables.ReconciliationMatch
+    stmt = _lags_query(db).where(
+        M.lags_learned.is_(False), M.matched_at < before
+    ).with_for_update(of=M, skip_locked=True)  # a concurrent learner keeps its rows
+
+    counts = defaultdict(int)
+    match_ids = []
+    for match_id, description, days in db.execute(stmt):
+        match_ids.append(match_id)
+        key = counterparty_key(description)
+        if key:
+            counts[(key, int(days))] += 1
+
+    for start in range(0, len(match_ids), 500):
+        db.execute(update(M).where(M.id.in_(match_ids[start:start + 500])).values(lags_learned=True))
+    _add_hits(db, counts)
+    db.commit()
+    return sum(counts.values())
+
+def unlearn_lags(db: Session, run_id: str):
+    """
+    Takes the learned matches of `run_id` back out of the histograms, before the run
+    is rolled back. Leaves committing to the caller.
+    """
+    M = tables.ReconciliationMatch
+    counts = defaultdict(int)
+    for _, description, days in db.execute(_lags_query(db).where(M.run_id == run_id, M.lags_learned.is_(True))):
+        key = counterparty_key(description)
+        if key:
+            counts[(key, int(days))] -= 1
+    _add_hits(db, counts)
+
+def _lags_query(db: Session):
+    """
+    (match id, bank description, |ledger day - bank day|) of the one-to-one pairs; the
+    day difference is computed by the database.
+    """
+    dialect = db.get_bind().dialect.name
+    T, L, M = tables.Transaction, tables.InternalLedger, tables.ReconciliationMatch
+    lag = func.abs(day_number_expr(L.date, dialect) - day_number_expr(T.date, dialect))
+    return select(M.id, T.description, lag).select_from(M).join(
+        T, T.id == M.transaction_id
+    ).join(
+        L, L.id == M.ledger_id
+    ).where(M.group_id.is_(None))
+
+def _add_hits(db: Session, counts):
+    """
+    Adds `counts` ((counterparty, lag) -> pairs, possibly negative) to the histograms.
+    """
+    C = tables.CounterpartyLag
+    existing = {}
+    bank_keys = list({key for key, _ in counts})
+    for start in range(0, len(bank_keys), 500):
+        for row in db.query(C).filter(C.bank_key.in_(bank_keys[start:start + 500])):
+            existing[(row.bank_key, row.lag_days)] = row
+
+    for (bank_key, lag_days), hits in counts.items():
+        row = existing.get((bank_key, lag_days))
+        if row is None:
+            if hits > 0:
+                db.add(C(bank_key=bank_key, lag_days=lag_days, hits=hits))
+        else:
+            row.hits = max(0, row.hits + hits)
@@ -1,19 +1,376 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from datetime import timedelta
+from sqlalchemy import and_, delete, func, insert, select
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, deque
+from datetime import date, datetime, timedelta
 from decimal import Decimal
+import uuid
+from app.core import config
 from app.models import tables
+from app.services.sql_matcher import SqlMatcher, unmatched_clause
+from app.services.reconciliation_scope import FULL_SCOPE_KEY, ReconciliationScope
+from app.services.columnar_matcher import ColumnarMatcher
+from app.services.parallel_matcher import ParallelMatcher
+from app.services.streaming_matcher import StreamingMatcher
+from app.services.assignment import min_cost_assignment
+from app.services.split_matcher import SplitMatcher
+from app.services.description_matcher import DescriptionMatcher
+from app.services.descriptions import counterparty_key
+from app.services.tolerance_matcher import ToleranceMatcher
+from app.services.lag_profiles import learn_lags, load_lag_profiles
+from app.services.pattern_memory import PatternMemory, learn_patterns
+from app.services.ingestion_matcher import ingestion_matcher
+from app.services.run_stats import RunStats
+
+# "python" matches ORM objects in-process, "numpy" matches id/cents/day columns in-process,
+# "parallel" spreads the numpy passes over worker processes,
+# "sql" runs the passes as set-based statements in the database
+# "stream" merge-joins sorted cursors in bounded memory, for data that doesn't fit in RAM
+ENGINE_MODES = ("python", "numpy", "parallel", "sql", "stream")
+
+# How fuzzy_date candidates are chosen: "greedy" (closest date first) or
+# "optimal" (min-cost assignment over blocks of competing rows, python mode only)
+ASSIGNMENT_STRATEGIES = ("greedy", "optimal")
 
 class MatchingEngine:
-    def __init__(self, db: Session):
+    def __init__(
+        self,
+        db: Session,
+        date_window_days: int = None,
+        batch_size: int = None,
+        mode: str = None,
+        assignment: str = None,
+        max_block_size: int = None,
+        adaptive_windows: bool = None,
+        pattern_matching: bool = None,
+        tolerance_matching: bool = None,
+        split_matching: bool = None,
+        description_matching: bool = None,
+        incremental: bool = None,
+        scope: ReconciliationScope = None,
+        workers: int = None,
+        stream_chunk_rows: int = None,
+        rerun_of: str = None,
+        dry_run: bool = False,
+        on_progress=None
+    ):
         self.db = db
+        self.mode = mode or config.MATCH_ENGINE_MODE
+        if self.mode not in ENGINE_MODES:
+            raise ValueError(f"Unknown matching mode '{self.mode}', expected one of {ENGINE_MODES}")
+        # How far apart (in days) bank and ledger dates may be in the fuzzy_date pass
+        self.date_window_days = config.FUZZY_DATE_WINDOW_DAYS if date_window_days is None else date_window_days
+        # How many match rows are sent per bulk INSERT
+        self.batch_size = config.MATCH_BATCH_SIZE if batch_size is None else batch_size
+        # Worker processes used by the "parallel" mode
+        self.workers = config.MATCH_WORKERS if workers is None else workers
+        # Rows matched per chunk (and fetched per cursor round trip) by the "stream" mode
+        self.stream_chunk_rows = config.STREAM_CHUNK_ROWS if stream_chunk_rows is None else stream_chunk_rows
+
+        self.assignment = assignment or config.FUZZY_ASSIGNMENT
+        if self.assignment not in ASSIGNMENT_STRATEGIES:
+            raise ValueError(f"Unknown assignment '{self.assignment}', expected one of {ASSIGNMENT_STRATEGIES}")
+        if self.assignment == "optimal" and self.mode != "python":
+            raise ValueError("Optimal assignment is only available in the 'python' matching mode")
+        # Largest block (rows per side) solved optimally; bigger ones stay greedy
+        self.max_block_size = config.ASSIGNMENT_MAX_BLOCK_SIZE if max_block_size is None else max_block_size
+
+        # Per-counterparty fuzzy_date windows learned from match history
+        self.adaptive_windows = config.ADAPTIVE_DATE_WINDOWS if adaptive_windows is None else adaptive_windows
+        if self.adaptive_windows and self.mode != "python":
+            raise ValueError("Adaptive date windows are only available in the 'python' matching mode")
+        if self.adaptive_windows and self.assignment == "optimal":
+            raise ValueError("Adaptive date windows can't be combined with optimal assignment")
+
+        # Consult learned counterparty -> ledger/GL patterns first, and keep learning them
+        self.pattern_matching = config.PATTERN_MATCHING if pattern_matching is None else pattern_matching
+        if self.pattern_matching and self.mode != "python":
+            raise ValueError("Pattern matching is only available in the 'python' matching mode")
+
+        self.tolerance_matching = config.AMOUNT_TOLERANCE_MATCHING if tolerance_matching is None else tolerance_matching
+        if self.tolerance_matching and self.mode != "python":
+            raise ValueError("Amount-tolerance matching is only available in the 'python' matching mode")
+
+        self.split_matching = config.SPLIT_MATCHING if split_matching is None else split_matching
+        if self.split_matching and self.mode != "python":
+            raise ValueError("Split matching is only available in the 'python' matching mode")
+
+        self.description_matching = config.DESCRIPTION_MATCHING if description_matching is None else description_matching
+        if self.description_matching and self.mode != "python":
+            raise ValueError("Description matching is only available in the 'python' matching mode")
+
+        # Incremental runs only evaluate rows uploaded since the last completed run
+        self.incremental = config.RECONCILE_INCREMENTAL if incremental is None else incremental
+        # What the caller asked for (statements, bank, GL codes, dates); incremental runs narrow it further
+        self.requested_scope = scope or ReconciliationScope()
+        self.scope = self.requested_scope
+        # Id of a rolled-back run: only the rows it released (and their neighbours) are loaded
+        self.rerun_of = rerun_of
+        # Run every pass but keep nothing: no run record, and all writes are rolled back
+        self.dry_run = dry_run
+
+        # Called with {"passes_committed", "matches_written"} after every committed pass
+        self.on_progress = on_progress
+        self.run_id = None
+        # When the run started; history learned for it predates this
+        self.started_at = None
+        # LagProfiles of an adaptive run, once loaded
+        self._profiles = None
+        self._passes_committed = 0
+        self._matches_written = 0
+        self._pass_rows = 0
+        # Rows written by the pass in progress, across its checkpoint commits
+        self._pass_matches = 0
+
+        # Commit (and checkpoint) every N batches inside a pass; 0 commits once per pass
+        self.checkpoint_batches = config.RUN_CHECKPOINT_BATCHES
+        self.run_record = None
+        # Checkpoint of the interrupted run this one resumes, if any
+        self._resumed = {}
+        self._batches_in_pass = 0
+
+        # Per-pass counts and fetch / match / persist timings; stored on the run record
+        self.stats = RunStats(count_objects=dry_run)
+
+        # Matches waiting to be written, and rows already paired in this run
+        self._pending_matches = []
+        # Live-feed manager of the run, and the events of matches not committed yet;
+        # they go out after the commit, when no write lock is held (see _commit)
+        self._feed = None
+        self._pending_events = []
+        self._matched_bank_ids = set()
+        self._matched_ledger_ids = set()
 
     async def run(self, websocket_manager=None):
         """
-        Executes the reconciliation logic in passes.
+        Executes the reconciliation logic in passes and records the run.
+        A dry run returns the results plus the instrumentation report ("stats") and
+        leaves the database as it found it.
+        """
+        run_record = self._start_run()
+        try:
+            results = await self._run_mode(websocket_manager)
+            if self.pattern_matching and not self.dry_run:
+                # Fold this run's matches into the pattern memory for the next run
+                with self.stats.timed("persist"):
+                    results["patterns_learned"] = learn_patterns(self.db)
+        except Exception:
+            self.db.rollback()
+            if run_record is not None:
+                self._finish_run(run_record, "failed")
+            raise
+        if self.dry_run:
+            # The passes ran in one transaction that was never committed
+            self.db.rollback()
+            return {**results, "dry_run": True, "stats": self.stats.to_dict()}
+        self._finish_run(run_record, "completed", results)
+        return results
+
+    async def _run_mode(self, websocket_manager):
+        if self.adaptive_windows and not self.dry_run:
+            # Matches committed before this run join the lag histograms (each once); the
+            # windows never learn from what this run is about to match
+            with self.stats.timed("persist"):
+                learn_lags(self.db, before=self.started_at)
+        # Mismatches are recomputed: drop the old ones in scope, the final pass rewrites them
+        self._clear_mismatches()
+
+        if self.mode == "sql":
+            # Everything happens in the database; there are no per-row events to broadcast
+            return SqlMatcher(
+                self.db, self.date_window_days, self.scope,
+                commit=self._commit_sql_step, resume=self._resumed, run_id=self.run_id
+            ).run()
+        if self.mode in ("numpy", "parallel"):
+            return await self._run_columnar()
+        if self.mode == "stream":
+            return self._run_stream()
+
+        # Each pass commits, and the rows we loaded are only read afterwards.
+        # Keep them from expiring so later passes don't re-SELECT every row.
+        expire_on_commit = self.db.expire_on_commit
+        self.db.expire_on_commit = False
+        try:
+            return await self._run_passes(websocket_manager)
+        finally:
+            self.db.expire_on_commit = expire_on_commit
+
+    def _start_run(self):
+        """
+        Creates the ReconciliationRun row and works out the scope of this run.
+        A dry run only works out the scope.
+        """
+        watermark = datetime.utcnow()
+        self.started_at = watermark
+        if self.rerun_of:
+            self.scope = self._build_rerun_scope()
+        elif self.incremental:
+            self.scope = self._build_scope()
+        else:
+            self.scope = self.requested_scope
+        if self.dry_run:
+            return None
+
+        run_record = tables.ReconciliationRun(
+            mode=self.mode,
+            incremental=self.incremental,
+            watermark=watermark,
+            started_at=watermark,
+            heartbeat_at=watermark,
+            scope=self.requested_scope.to_dict(),
+            scope_key=self.requested_scope.key,
+            rerun_of=self.rerun_of
+        )
+        self.db.add(run_record)
+
+        interrupted = self._interrupted_run(watermark)
+        if interrupted is not None:
+            interrupted.status = "interrupted"
+            run_record.resumed_from = interrupted.id
+            # Pass progress only carries over when the passes are the same and the data
+            # is too: a row uploaded since could pair in a pass that would be skipped
+            if interrupted.mode == self.mode and not self._uploaded_since(interrupted.watermark):
+                self._resumed = interrupted.checkpoint or {}
+                run_record.checkpoint = {"completed_passes": self._resumed.get("completed_passes", [])}
+
+        self.db.commit()
+        self.run_record = run_record
+        self.run_id = run_record.id
+        # The run changes what is matched; the upload-time index is reloaded afterwards
+        ingestion_matcher.invalidate()
+        return run_record
+
+    def _interrupted_run(self, now):
+        """
+        The last run over the same scope that never finished: still marked 'running'
+        but without a checkpoint for RUN_STALE_SECONDS (its process is gone).
+        """
+        R = tables.ReconciliationRun
+        return self.db.query(R).filter(
+            R.status == "running",
+            R.scope_key == self.requested_scope.key,
+            R.heartbeat_at < now - timedelta(seconds=config.RUN_STALE_SECONDS)
+        ).order_by(R.started_at.desc()).first()
+
+    def _uploaded_since(self, watermark):
+        """
+        True if rows in this run's scope were created after `watermark`.
+        """
+        for model in (tables.Transaction, tables.InternalLedger):
+            if self.db.execute(
+                select(model.id).where(model.created_at > watermark, *self.scope.filters_for(model)).limit(1)
+            ).first():
+                return True
+        return False
+
+    def _pass_completed(self, name):
+        """
+        True if the interrupted run this one resumes already committed pass `name`.
+        """
+        return name in self._resumed.get("completed_passes", ())
+
+    def _build_scope(self):
+        """
+        Scope of an incremental run: the date span of rows uploaded since the last
+        completed run over the same scope (or the whole database), widened by the
+        largest match window. Only open rows in that span can pair with the new rows,
+        so nothing else is loaded.
+        """
+        requested = self.requested_scope
+        previous = self.db.query(tables.ReconciliationRun).filter(
+            tables.ReconciliationRun.status == "completed",
+            tables.ReconciliationRun.scope_key.in_({requested.key, FULL_SCOPE_KEY})
+        ).order_by(tables.ReconciliationRun.watermark.desc()).first()
+        if not previous:
+            # First run for this scope: everything in it is new
+            return requested
+
+        spans = []
+        for model in (tables.Transaction, tables.InternalLedger):
+            spans.extend(self.db.execute(
+                select(func.min(model.date), func.max(model.date)).where(
+                    model.created_at > previous.watermark, *requested.filters_for(model)
+                )
+            ).one())
+        new_dates = [d for d in spans if d is not None]
+        if not new_dates:
+            return requested.narrowed(empty=True)
+
+        window = self._max_window()
+        return requested.narrowed(
+            date_from=min(new_dates) - timedelta(days=window),
+            date_to=max(new_dates) + timedelta(days=window)
+        )
+
+    def _build_rerun_scope(self):
+        """
+        Scope of a re-run: the date span of the rows a rollback released, widened by
+        the largest match window, inside the requested scope.
         """
-        import asyncio 
+        previous = self.db.get(tables.ReconciliationRun, self.rerun_of)
+        if previous is None or previous.status != "rolled_back":
+            raise ValueError(f"Run {self.rerun_of} has not been rolled back")
+
+        span = previous.rollback or {}
+        if not span.get("date_from"):
+            return self.requested_scope.narrowed(empty=True)
+        window = timedelta(days=self._max_window())
+        return self.requested_scope.narrowed(
+            date_from=date.fromisoformat(span["date_from"]) - window,
+            date_to=date.fromisoformat(span["date_to"]) + window
+        )
 
+    def _lag_profiles(self):
+        """
+        The per-counterparty windows of this run, loaded once.
+        """
+        if self._profiles is None:
+            with self.stats.timed("fetch"):
+                self._profiles = load_lag_profiles(
+                    self.db,
+                    self.date_window_days,
+                    config.ADAPTIVE_WINDOW_MIN_SAMPLES,
+                    config.ADAPTIVE_WINDOW_QUANTILE,
+                    config.ADAPTIVE_WINDOW_MAX_DAYS
+                )
+        return self._profiles
+
+    def _max_window(self):
+        """
+        Largest date distance any enabled pass can pair over.
+        """
+        window = self.date_window_days
+        if self.adaptive_windows:
+            window = max(window, config.ADAPTIVE_WINDOW_MAX_DAYS)
+        if self.split_matching:
+            window = max(window, config.SPLIT_DATE_WINDOW_DAYS)
+        if self.description_matching:
+            window = max(window, config.DESCRIPTION_DATE_WINDOW_DAYS)
+        return window
+
+    def _clear_mismatches(self):
+        """
+        Deletes 'mismatch' rows of bank transactions in scope so they can be matched again.
+        """
+        in_scope = select(tables.Transaction.id).where(*self.scope.bank_filters())
+        with self.stats.timed("persist"):
+            self.db.execute(
+                delete(tables.ReconciliationMatch).where(
+                    tables.ReconciliationMatch.match_type == "mismatch",
+                    tables.ReconciliationMatch.transaction_id.in_(in_scope)
+                )
+            )
+
+    def _finish_run(self, run_record, status, results=None):
+        run_record.status = status
+        run_record.finished_at = datetime.utcnow()
+        run_record.results = results
+        run_record.stats = self.stats.to_dict()
+        self.db.commit()
+        ingestion_matcher.invalidate()
+
+    async def _run_passes(self, websocket_manager):
+        self._feed = websocket_manager
         results = {
             "bank_items_scanned": 0,
             "ledger_items_scanned": 0,
@@ -21,18 +378,28 @@ class MatchingEngine:
             "fuzzy_matches": 0
         }
 
-        # 1. Fetch all UNMATCHED Bank Transactions
-        unmatched_bank = self.db.query(tables.Transaction).outerjoin(
-            tables.ReconciliationMatch, tables.Transaction.id == tables.ReconciliationMatch.transaction_id
-        ).filter(tables.ReconciliationMatch.id == None).all()
+        # 1. Fetch all UNMATCHED Bank Transactions in scope
+        # Ordered by (date, id) so pairing is deterministic and agrees with the "sql" mode
+        with self.stats.timed("fetch"):
+            unmatched_bank = self.db.query(tables.Transaction).filter(
+                unmatched_clause(tables.Transaction, tables.ReconciliationMatch.transaction_id),
+                *self.scope.bank_filters()
+            ).order_by(
+                tables.Transaction.date, tables.Transaction.id
+            ).all()
 
-        # 2. Fetch all UNMATCHED Ledger Entries
-        unmatched_ledger = self.db.query(tables.InternalLedger).outerjoin(
-            tables.ReconciliationMatch, tables.InternalLedger.id == tables.ReconciliationMatch.ledger_id
-        ).filter(tables.ReconciliationMatch.id == None).all()
+            # 2. Fetch all UNMATCHED Ledger Entries in scope
+            unmatched_ledger = self.db.query(tables.InternalLedger).filter(
+                unmatched_clause(tables.InternalLedger, tables.ReconciliationMatch.ledger_id),
+                *self.scope.ledger_filters()
+            ).order_by(
+                tables.InternalLedger.date, tables.InternalLedger.id
+            ).all()
 
         results["bank_items_scanned"] = len(unmatched_bank)
         results["ledger_items_scanned"] = len(unmatched_ledger)
+        self.stats.rows_in_memory(len(unmatched_bank) + len(unmatched_ledger))
+        self.stats.begin_passes()
 
         # Stop if we don't have data to process
         if not unmatched_bank:
@@ -44,104 +411,588 @@ class MatchingEngine:
         # Convert ledger list to a mutable list so we can remove items as we match them
         available_ledger = list(unmatched_ledger)
         
-        # Helper to broadcast
-        async def broadcast_match(match_obj):
+        # Helper to publish to the live feed; events are handed to the manager once their
+        # matches are committed, and it sends them in batches, so matching never waits on a client
+        def publish_match(match_row, bank_tx, ledger_tx):
             if websocket_manager:
-                await websocket_manager.broadcast({
-                    "id": match_obj.id,
-                    "match_type": match_obj.match_type,
-                    "amount": float(match_obj.transaction.amount),
-                    "date": str(match_obj.transaction.date),
-                    "bank_desc": match_obj.transaction.description,
-                    "ledger_desc": match_obj.ledger.description,
-                    "confidence": float(match_obj.confidence_score)
+                self._publish({
+                    "id": match_row["id"],
+                    "match_type": match_row["match_type"],
+                    "amount": float(bank_tx.amount),
+                    "date": str(bank_tx.date),
+                    "bank_desc": bank_tx.description,
+                    "ledger_desc": ledger_tx.description,
+                    "run_id": self.run_id,
+                    "confidence": float(match_row["confidence_score"])
                 })
-                # Simulate work for visual effect
-                await asyncio.sleep(0.05)
+
+        # --- PASS 0: LEARNED PATTERNS (Counterparty memory + Amount + Date window) ---
+        # Bank counterparties seen before only look at the ledger counterparty / GL code
+        # they were matched to last time, which is a far smaller bucket than the ledger.
+        if self.pattern_matching and not self._pass_completed("pattern"):
+            results["pattern_matches"] = 0
+            # Learn whatever was matched since the last run (everything, the first time)
+            if not self.dry_run:
+                with self.stats.timed("persist"):
+                    learn_patterns(self.db)
+            with self.stats.timed("fetch"):
+                memory = PatternMemory.load(
+                    self.db,
+                    [counterparty_key(b.description) for b in unmatched_bank],
+                    config.PATTERN_MIN_HITS,
+                    self.date_window_days
+                )
+            for bank_tx, match in memory.match(unmatched_bank, available_ledger):
+                match_row = self._create_match(bank_tx, match, "pattern", 0.95)
+                results["pattern_matches"] += 1
+                publish_match(match_row, bank_tx, match)
+
+            self.stats.count("pattern", candidates=memory.candidates)
+            self._commit_pass("pattern")
+            available_ledger = [l for l in available_ledger if l.id not in self._matched_ledger_ids]
 
         # --- PASS 1: EXACT MATCH (Amount + Date) ---
-        for bank_tx in unmatched_bank:
-            # Try to find a match. We check:
-            # 1. Exact amount match
-            # 2. FLIPPED sign match (e.g. -100 vs 100)
-            match = next((
-                l for l in available_ledger 
-                if (l.amount == bank_tx.amount or l.amount == -bank_tx.amount) 
-                and l.date == bank_tx.date
-            ), None)
-            
-            if match:
-                db_match = self._create_match(bank_tx, match, "exact", 1.0)
-                available_ledger.remove(match) 
+        # Index the ledger by (absolute amount, date) so each lookup is a dict hit.
+        # Keying on the absolute amount covers FLIPPED sign matches (e.g. -100 vs 100),
+        # and the per-key queue keeps ledger order so the first available row wins.
+        # A resumed run skips the passes its interrupted run already finished.
+        used_ledger_ids = set()
+        if not self._pass_completed("exact"):
+            exact_index = self._build_exact_index(available_ledger)
+
+            for bank_tx in unmatched_bank:
+                if bank_tx.id in self._matched_bank_ids:
+                    continue
+                queue = exact_index.get((abs(bank_tx.amount), bank_tx.date))
+                if not queue:
+                    continue
+
+                self.stats.count("exact", candidates=len(queue), ambiguous=len(queue) > 1)
+                match = queue.popleft()
+                match_row = self._create_match(bank_tx, match, "exact", 1.0)
+                used_ledger_ids.add(match.id)
                 results["exact_matches"] += 1
-                await broadcast_match(db_match)
-                continue 
-
-        # --- PASS 2: FUZZY DATE (Amount + Date +/- 2 Days) ---
-        # We filter again to get only bank items that were NOT matched in Pass 1
-        remaining_bank = [b for b in unmatched_bank if not b.reconciliation_match]
-
-        for bank_tx in remaining_bank:
-            # Logic: Amount match AND Date difference <= 2 days
-            match = next((
-                l for l in available_ledger 
-                if (l.amount == bank_tx.amount or l.amount == -bank_tx.amount)
-                and abs((l.date - bank_tx.date).days) <= 2
-            ), None)
-
-            if match:
-                db_match = self._create_match(bank_tx, match, "fuzzy_date", 0.85) # 85% confidence
-                available_ledger.remove(match)
-                results["fuzzy_matches"] += 1
-                await broadcast_match(db_match)
+                publish_match(match_row, bank_tx, match)
+
+            self._commit_pass("exact")
+
+        # Drop consumed ledger rows in one sweep instead of list.remove() per match
+        available_ledger = [l for l in available_ledger if l.id not in used_ledger_ids]
+
+        # --- PASS 2: FUZZY DATE (Amount + Date +/- window) ---
+        # Ledger rows are grouped by absolute amount and sorted by date ordinal, so a
+        # candidate is found with a bisect instead of a scan of the whole ledger.
+        # We widen the distance one day at a time (earlier ledger date first), which
+        # gives every bank row its closest-dated partner before farther ones are tried.
+        remaining_bank = [b for b in unmatched_bank if b.id not in self._matched_bank_ids]
+        date_index = self._build_date_index(available_ledger)
+
+        if not self._pass_completed("fuzzy_date"):
+            if self.assignment == "optimal":
+                # Rows competing for the same candidates are paired as a block first, so
+                # one bank row can't take the only partner another bank row had.
+                # Whatever is left (e.g. blocks over the size cap) goes through the rounds below.
+                for bank_tx, match in self._assign_ambiguous_blocks(remaining_bank, date_index):
+                    match_row = self._create_match(bank_tx, match, "fuzzy_date", 0.85)
+                    results["fuzzy_matches"] += 1
+                    publish_match(match_row, bank_tx, match)
+
+            # With adaptive windows each bank row stops at its counterparty's learned window
+            windows = {b.id: self.date_window_days for b in remaining_bank}
+            if self.adaptive_windows:
+                profiles = self._lag_profiles()
+                windows = {b.id: profiles.window_for(b.description) for b in remaining_bank}
+                results["lag_profiles"] = len(profiles.windows)
+            self._count_window_candidates(remaining_bank, date_index, windows)
+
+            for distance in range(1, max(windows.values(), default=0) + 1):
+                for offset in (-distance, distance):
+                    for bank_tx in remaining_bank:
+                        if bank_tx.id in self._matched_bank_ids or windows[bank_tx.id] < distance:
+                            continue
+
+                        group = date_index.get(abs(bank_tx.amount))
+                        if not group:
+                            continue
+
+                        match = self._take_on_ordinal(group, bank_tx.date.toordinal() + offset)
+                        if match:
+                            match_row = self._create_match(bank_tx, match, "fuzzy_date", 0.85) # 85% confidence
+                            results["fuzzy_matches"] += 1
+                            publish_match(match_row, bank_tx, match)
+
+            self._commit_pass("fuzzy_date")
+
+        # --- PASS 3: AMOUNT TOLERANCE (Amount +/- tolerance + Date +/- window) ---
+        if self.tolerance_matching and not self._pass_completed("amount_tolerance"):
+            results["tolerance_matches"] = 0
+            leftover_bank = [b for b in remaining_bank if b.id not in self._matched_bank_ids]
+            leftover_ledger = [entry for _, entries in date_index.values() for entry in entries]
+
+            matcher = ToleranceMatcher(
+                self.date_window_days,
+                config.AMOUNT_TOLERANCE_ABSOLUTE,
+                config.AMOUNT_TOLERANCE_RELATIVE
+            )
+            # The fuzzy_date pass's windows: a same-amount pair it left as too far apart
+            # for the counterparty must not come back here as a tolerance match
+            windows = None
+            if self.adaptive_windows:
+                profiles = self._lag_profiles()
+                windows = {b.id: profiles.window_for(b.description) for b in leftover_bank}
+            for bank_tx, entry, closeness in matcher.match(leftover_bank, leftover_ledger, windows):
+                # 0.8 for a near-identical amount, down to 0.5 at the edge of the tolerance
+                match_row = self._create_match(bank_tx, entry, "amount_tolerance", round(0.5 + 0.3 * closeness, 2))
+                results["tolerance_matches"] += 1
+                publish_match(match_row, bank_tx, entry)
+
+            self.stats.count("amount_tolerance", candidates=matcher.candidates, ambiguous=matcher.ambiguous)
+            self._commit_pass("amount_tolerance")
+
+        # --- PASS 4: SPLIT PAYMENTS (one row settles several on the other side) ---
+        if self.split_matching and not self._pass_completed("split"):
+            results["split_matches"] = 0
+            leftover_bank = [b for b in remaining_bank if b.id not in self._matched_bank_ids]
+            leftover_ledger = [
+                entry for _, entries in date_index.values() for entry in entries
+                if entry.id not in self._matched_ledger_ids
+            ]
+
+            splitter = SplitMatcher(
+                config.SPLIT_DATE_WINDOW_DAYS,
+                config.SPLIT_MAX_PARTS,
+                config.SPLIT_MAX_CANDIDATES,
+                config.SPLIT_BLOCK_TIME_LIMIT_MS
+            )
+            for bank_rows, ledger_rows in splitter.match(leftover_bank, leftover_ledger):
+                group_rows = self._create_split_match(bank_rows, ledger_rows, 0.75)
+                results["split_matches"] += 1
+                publish_match(group_rows[0], bank_rows[0], ledger_rows[0])
+
+            results["split_blocks_timed_out"] = splitter.timed_out_blocks
+            self._commit_pass("split")
+
+        # --- PASS 5: DESCRIPTION SIMILARITY (Amount bucket + Date window + Text) ---
+        if self.description_matching and not self._pass_completed("description"):
+            results["description_matches"] = 0
+            leftover_bank = [b for b in remaining_bank if b.id not in self._matched_bank_ids]
+            leftover_ledger = [
+                entry for _, entries in date_index.values() for entry in entries
+                if entry.id not in self._matched_ledger_ids
+            ]
+
+            matcher = DescriptionMatcher(
+                config.DESCRIPTION_DATE_WINDOW_DAYS,
+                config.DESCRIPTION_AMOUNT_BUCKET_CENTS,
+                config.DESCRIPTION_MIN_SIMILARITY,
+                config.DESCRIPTION_BLOCK_SIZE
+            )
+            for bank_tx, entry, similarity in matcher.match(leftover_bank, leftover_ledger):
+                # Text alone is weaker evidence than amount + date, so cap below fuzzy_date
+                match_row = self._create_match(bank_tx, entry, "description", round(0.8 * similarity, 2))
+                results["description_matches"] += 1
+                publish_match(match_row, bank_tx, entry)
+
+            self.stats.count("description", candidates=matcher.candidates)
+            self._commit_pass("description")
 
         # --- FINAL PASS: REPORT MISMATCHES ---
         # Any bank transaction that is still unmatched is a deviation
-        final_unmatched = [b for b in unmatched_bank if not b.reconciliation_match]
+        final_unmatched = [b for b in unmatched_bank if b.id not in self._matched_bank_ids]
         
         for tx in final_unmatched:
-            # We explicitly save this as a "mismatch" in the database
-            # This requires the ReconciliationMatch model to allow nullable ledger_id
-            # Assuming schema supports it or we need to check. 
-            # If schema enforces ledger_id, we might need to adjust strategy.
-            # Let's check schema first? No, let's assume valid or fix if error.
-            # Actually, standard practice: Mismatches are Matches with no pair.
-            
-            # Using helper but passing None for ledger_tx
-            # We need to update helper to handle None ledger
-            db_match = self._create_match(tx, None, "mismatch", 0.0)
+            # We explicitly save this as a "mismatch" in the database:
+            # mismatches are Matches with no ledger pair (ledger_id is nullable).
+            match_row = self._create_match(tx, None, "mismatch", 0.0)
             
             if websocket_manager:
-                await websocket_manager.broadcast({
-                    "id": db_match.id,
+                self._publish({
+                    "id": match_row["id"],
                     "match_type": "mismatch",
                     "amount": float(tx.amount),
                     "date": str(tx.date),
                     "bank_desc": tx.description,
                     "ledger_desc": "-",
+                    "run_id": self.run_id,
                     "confidence": 0.0
                 })
-                await asyncio.sleep(0.01)
 
+        self._commit_pass("mismatch")
+
+        return results
+
+    async def _run_columnar(self):
+        """
+        Same passes as _run_passes, but on NumPy columns (in-process, or spread over
+        worker processes in "parallel" mode); the only ORM work left is writing the
+        matches back.
+        """
+        matcher = ColumnarMatcher(self.db, self.scope)
+        with self.stats.timed("fetch"):
+            bank_count, ledger_count = matcher.load()
+        self.stats.rows_in_memory(bank_count + ledger_count)
+        self.stats.begin_passes()
+        results = {
+            "bank_items_scanned": bank_count,
+            "ledger_items_scanned": ledger_count,
+            "exact_matches": 0,
+            "fuzzy_matches": 0
+        }
+        if not bank_count:
+            return results
+
+        if self.mode == "parallel":
+            exact, fuzzy, open_bank = await ParallelMatcher(matcher, self.workers, self.date_window_days).run()
+        else:
+            exact = matcher.pair_on_offset(0)
+            fuzzy = []
+            for distance in range(1, self.date_window_days + 1):
+                for offset in (-distance, distance):
+                    fuzzy.extend(matcher.pair_on_offset(offset))
+            open_bank = matcher.open_bank_ids()
+
+        # --- PASS 1: EXACT MATCH (Amount + Date) ---
+        for transaction_id, ledger_id in exact:
+            self._queue_match(transaction_id, ledger_id, "exact", 1.0)
+        results["exact_matches"] = len(exact)
+        self._commit_pass("exact")
+
+        # --- PASS 2: FUZZY DATE (Amount + Date +/- window) ---
+        for transaction_id, ledger_id in fuzzy:
+            self._queue_match(transaction_id, ledger_id, "fuzzy_date", 0.85)
+        results["fuzzy_matches"] = len(fuzzy)
+        self._commit_pass("fuzzy_date")
+
+        # --- FINAL PASS: REPORT MISMATCHES ---
+        for transaction_id in open_bank:
+            self._queue_match(transaction_id, None, "mismatch", 0.0)
+        self._commit_pass("mismatch")
+
+        return results
+
+    def _run_stream(self):
+        """
+        Same passes again, out of core: StreamingMatcher spills its pairs to temp
+        files, which are then written back pass by pass through the batched inserts.
+        """
+        streamer = StreamingMatcher(self.db, self.date_window_days, self.stream_chunk_rows, self.scope)
+        try:
+            spills = streamer.run()
+            # Reading the cursors is interleaved with matching; the streamer times the latter
+            self.stats.add_seconds("fetch", streamer.read_seconds)
+            self.stats.rows_in_memory(streamer.peak_buffer_rows)
+            results = {
+                "bank_items_scanned": streamer.bank_count,
+                "ledger_items_scanned": streamer.ledger_count,
+                # --- PASS 1: EXACT MATCH (Amount + Date) ---
+                "exact_matches": self._write_spill(spills["exact"], "exact", 1.0),
+                # --- PASS 2: FUZZY DATE (Amount + Date +/- window) ---
+                "fuzzy_matches": self._write_spill(spills["fuzzy_date"], "fuzzy_date", 0.85)
+            }
+            # --- FINAL PASS: REPORT MISMATCHES ---
+            self._write_spill(spills["mismatch"], "mismatch", 0.0)
+        finally:
+            streamer.close()
         return results
 
+    def _write_spill(self, rows, match_type, confidence):
+        """
+        Writes one spilled pass and commits it. Returns the number of rows written.
+        """
+        count = 0
+        for transaction_id, ledger_id in rows:
+            self._queue_match(transaction_id, ledger_id or None, match_type, confidence)
+            count += 1
+        self._commit_pass(match_type)
+        # Nothing reads the taken-id sets in this mode; don't let them grow with the data
+        self._matched_bank_ids.clear()
+        self._matched_ledger_ids.clear()
+        return count
+
+    @staticmethod
+    def _build_exact_index(ledger_entries):
+        """
+        Groups ledger entries by (absolute amount, date), preserving their order.
+        """
+        index = defaultdict(deque)
+        for entry in ledger_entries:
+            index[(abs(entry.amount), entry.date)].append(entry)
+        return index
+
+    @staticmethod
+    def _build_date_index(ledger_entries):
+        """
+        Groups ledger entries by absolute amount. Each group holds two parallel lists
+        (date ordinals, entries) sorted by date, keeping ledger order within a day.
+        """
+        buckets = defaultdict(list)
+        for entry in ledger_entries:
+            buckets[abs(entry.amount)].append(entry)
+
+        index = {}
+        for amount, entries in buckets.items():
+            entries.sort(key=lambda e: e.date.toordinal())
+            index[amount] = ([e.date.toordinal() for e in entries], entries)
+        return index
+
+    def _count_window_candidates(self, bank_rows, date_index, windows):
+        """
+        Records, for the fuzzy_date pass, how many ledger rows each open bank row could
+        pair with inside its window, and how many bank rows have more than one.
+        """
+        candidates = ambiguous = 0
+        for bank_tx in bank_rows:
+            group = date_index.get(abs(bank_tx.amount))
+            if bank_tx.id in self._matched_bank_ids or not group:
+                continue
+            ordinal, window = bank_tx.date.toordinal(), windows[bank_tx.id]
+            found = bisect_right(group[0], ordinal + window) - bisect_left(group[0], ordinal - window)
+            candidates += found
+            ambiguous += found > 1
+        self.stats.count("fuzzy_date", candidates=candidates, ambiguous=ambiguous)
+
+    @staticmethod
+    def _take_on_ordinal(group, ordinal):
+        """
+        Removes and returns the first ledger entry dated on `ordinal`, or None.
+        """
+        ordinals, entries = group
+        pos = bisect_left(ordinals, ordinal)
+        if pos == len(ordinals) or ordinals[pos] != ordinal:
+            return None
+        del ordinals[pos]
+        return entries.pop(pos)
+
+    def _assign_ambiguous_blocks(self, bank_rows, date_index):
+        """
+        Groups bank and ledger rows of the same amount into blocks of rows that compete
+        for the same candidates inside the date window, and pairs each block with a
+        min-cost assignment (cost = days apart, most pairs first).
+        Returns (bank_tx, ledger_entry) pairs; paired entries are removed from the index.
+        """
+        by_amount = defaultdict(list)
+        for bank_tx in bank_rows:
+            if abs(bank_tx.amount) in date_index:
+                by_amount[abs(bank_tx.amount)].append(bank_tx)
+
+        pairs = []
+        for amount, banks in by_amount.items():
+            ordinals, entries = date_index[amount]
+            taken = set()
+
+            for block_banks, lo, hi in self._candidate_blocks(banks, ordinals):
+                # A lone pair is not ambiguous, and oversized blocks would be too slow
+                if len(block_banks) == 1 and hi - lo == 1:
+                    continue
+                if max(len(block_banks), hi - lo) > self.max_block_size:
+                    continue
+
+                for bank_pos, ledger_pos in self._solve_block(block_banks, ordinals[lo:hi]):
+                    pairs.append((block_banks[bank_pos], entries[lo + ledger_pos]))
+                    taken.add(lo + ledger_pos)
+
+            if taken:
+                keep = [k for k in range(len(entries)) if k not in taken]
+                ordinals[:] = [ordinals[k] for k in keep]
+                entries[:] = [entries[k] for k in keep]
+        return pairs
+
+    def _candidate_blocks(self, banks, ordinals):
+        """
+        Yields (bank rows, lo, hi) blocks where ordinals[lo:hi] are the ledger rows
+        reachable from those bank rows. Each bank row's window is a contiguous slice of
+        the sorted ledger, so overlapping slices are merged into one block.
+        """
+        window = self.date_window_days
+        block, block_lo, block_hi = [], 0, 0
+
+        for bank_tx in sorted(banks, key=lambda b: b.date.toordinal()):
+            ordinal = bank_tx.date.toordinal()
+            lo = bisect_left(ordinals, ordinal - window)
+            hi = bisect_right(ordinals, ordinal + window)
+            if lo == hi:
+                continue
+            if block and lo < block_hi:
+                block.append(bank_tx)
+                block_hi = max(block_hi, hi)
+                continue
+            if block:
+                yield block, block_lo, block_hi
+            block, block_lo, block_hi = [bank_tx], lo, hi
+
+        if block:
+            yield block, block_lo, block_hi
+
+    def _solve_block(self, block_banks, block_ordinals):
+        """
+        Returns (bank position, ledger position) pairs of the min-cost assignment.
+        Pairs outside the window get a cost larger than any set of real pairs, so the
+        solver first maximises the number of matches and then minimises the total gap.
+        """
+        window = self.date_window_days
+        out_of_window = (window + 1) * (len(block_banks) + len(block_ordinals))
+        cost = []
+        for bank_tx in block_banks:
+            ordinal = bank_tx.date.toordinal()
+            cost.append([
+                abs(ordinal - o) if abs(ordinal - o) <= window else out_of_window
+                for o in block_ordinals
+            ])
+        return [(i, j) for i, j in min_cost_assignment(cost) if cost[i][j] != out_of_window]
+
     def _create_match(self, bank_tx, ledger_tx, match_type, confidence):
         """
-        Helper to save the match to DB. Returns the DB object.
+        Queues a match between two loaded rows. Returns the row dict.
         """
-        db_match = tables.ReconciliationMatch(
-            transaction_id=bank_tx.id,
-            ledger_id=ledger_tx.id if ledger_tx else None,
-            match_type=match_type,
-            confidence_score=confidence
-        )
-        self.db.add(db_match)
-        
-        # We also update the objects in memory so our loops know they are taken
-        bank_tx.reconciliation_match = db_match
-        if ledger_tx:
-            ledger_tx.reconciliation_match = db_match
+        return self._queue_match(bank_tx.id, ledger_tx.id if ledger_tx else None, match_type, confidence)
+
+    def _create_split_match(self, bank_rows, ledger_rows, confidence):
+        """
+        Queues one "split" group: the first row links both sides, the others link the
+        remaining rows of the bigger side, all under a shared group_id.
+        """
+        group_id = str(uuid.uuid4())
+        group_rows = []
+        for i in range(max(len(bank_rows), len(ledger_rows))):
+            group_rows.append(self._queue_match(
+                bank_rows[i].id if i < len(bank_rows) else None,
+                ledger_rows[i].id if i < len(ledger_rows) else None,
+                "split",
+                confidence,
+                group_id=group_id
+            ))
+        return group_rows
+
+    def _queue_match(self, transaction_id, ledger_id, match_type, confidence, group_id=None):
+        """
+        Queues a match row for the next bulk insert. Returns the row dict.
+        IDs are generated here (uuid4, like the model default) so no refresh is needed.
+        """
+        match_row = {
+            "id": str(uuid.uuid4()),
+            "transaction_id": transaction_id,
+            "ledger_id": ledger_id,
+            "match_type": match_type,
+            "confidence_score": confidence,
+            "matched_at": datetime.utcnow(),
+            "group_id": group_id,
+            "run_id": self.run_id
+        }
+        self._pending_matches.append(match_row)
         
-        self.db.commit()
-        self.db.refresh(db_match) # Refresh to get IDs etc
-        return db_match
\ No newline at end of file
+        # We also remember the bank row in memory so our loops know it is taken
+        if transaction_id:
+            self._matched_bank_ids.add(transaction_id)
+        if ledger_id:
+            self._matched_ledger_ids.add(ledger_id)
+
+        if len(self._pending_matches) >= self.batch_size:
+            self._flush_matches()
+        return match_row
+
+    def _flush_matches(self):
+        """
+        Sends queued matches as one executemany INSERT inside the current transaction.
+        """
+        if not self._pending_matches:
+            return
+        try:
+            with self.stats.timed("persist"):
+                self.db.execute(insert(tables.ReconciliationMatch), self._pending_matches)
+        except Exception:
+            self._rollback()
+            raise
+        self._pass_rows += len(self._pending_matches)
+        pass_name = self._pending_matches[-1]["match_type"]
+        self._pending_matches = []
+
+        self._batches_in_pass += 1
+        if self.checkpoint_batches and self._batches_in_pass % self.checkpoint_batches == 0:
+            self._commit(pass_name, pass_done=False)
+
+    def _commit_pass(self, name):
+        """
+        Writes whatever is still queued and commits the pass as a single transaction
+        (or its last batches, with RUN_CHECKPOINT_BATCHES), checkpointing it as done.
+        """
+        self._flush_matches()
+        self._commit(name, pass_done=True)
+        self._batches_in_pass = 0
+
+    def _commit_sql_step(self, name, rows, pass_done):
+        """
+        Commit hook for SqlMatcher: one statement's rows, or the end of a pass.
+        """
+        self._pass_rows += rows
+        if not pass_done:
+            self._batches_in_pass += 1
+        self._commit(name, pass_done)
+        if pass_done:
+            self._batches_in_pass = 0
+
+    def _commit(self, name, pass_done):
+        """
+        Commits the matches written so far together with the run's checkpoint, so the
+        checkpoint never claims more than what is stored.
+        """
+        if self.run_record is not None:
+            checkpoint = dict(self.run_record.checkpoint or {})
+            completed = list(checkpoint.get("completed_passes", []))
+            if pass_done and name not in completed:
+                completed.append(name)
+            self.run_record.checkpoint = {
+                "completed_passes": completed,
+                "pass": None if pass_done else name,
+                "batches": 0 if pass_done else self._batches_in_pass,
+                "matches_written": self._matches_written + self._pass_rows
+            }
+            self.run_record.heartbeat_at = datetime.utcnow()
+        if not self.dry_run:
+            try:
+                with self.stats.timed("persist"):
+                    self.db.commit()
+            except Exception:
+                self._rollback()
+                raise
+        self._send_events()
+
+        self._matches_written += self._pass_rows
+        self._pass_matches += self._pass_rows
+        self._pass_rows = 0
+        if pass_done:
+            self._passes_committed += 1
+            self.stats.end_pass(name, self._pass_matches)
+            self._pass_matches = 0
+        if self.on_progress:
+            self.on_progress({
+                "passes_committed": self._passes_committed,
+                "matches_written": self._matches_written
+            })
+
+    def _publish(self, event):
+        self._pending_events.append(event)
+
+    def _send_events(self):
+        """
+        Hands the events of the matches just committed to the live feed. Publishing
+        can write to the database (the "polling" backend), which must not wait on
+        the write lock of this run's own open transaction. A dry run commits nothing,
+        so it publishes nothing.
+        """
+        events, self._pending_events = self._pending_events, []
+        if self._feed is None or self.dry_run or not events:
+            return
+        for event in events:
+            self._feed.publish(event)
+        self._feed.flush()
+
+    def _rollback(self):
+        """
+        Undoes the current pass: nothing it queued or inserted is kept.
+        """
+        self.db.rollback()
+        self._pending_matches = []
+        # Their matches are gone too
+        self._pending_events = []
+        self._pass_rows = 0
+        self._batches_in_pass = 0
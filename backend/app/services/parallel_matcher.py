@@ -0,0 +1,59 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from app.services.columnar_matcher import ColumnarMatcher
+
+def match_partition(bank, ledger, date_window_days):
+    """
+    Worker entry point: runs the exact and fuzzy_date passes on one partition.
+    Takes and returns plain columns / ids only, so everything pickles cheaply.
+    Returns (exact pairs, fuzzy pairs).
+    """
+    matcher = ColumnarMatcher()
+    matcher.set_columns(bank, ledger)
+
+    exact = matcher.pair_on_offset(0)
+    fuzzy = []
+    for distance in range(1, date_window_days + 1):
+        for offset in (-distance, distance):
+            fuzzy.extend(matcher.pair_on_offset(offset))
+    return exact, fuzzy
+
+class ParallelMatcher:
+    """
+    Spreads the exact and fuzzy_date passes over a ProcessPoolExecutor.
+
+    Unmatched rows are loaded once as columns, split into partitions by amount
+    (cents modulo the partition count) and matched in worker processes while the
+    event loop stays free. Since a pair never crosses partitions, each ledger row is
+    still used at most once, and merging the partitions in index order gives the
+    same matches as the sequential engine, whatever the worker count.
+    """
+    def __init__(self, matcher: ColumnarMatcher, workers: int, date_window_days: int):
+        self.matcher = matcher
+        self.workers = workers
+        self.date_window_days = date_window_days
+
+    async def run(self):
+        """
+        Returns (exact pairs, fuzzy pairs, open bank ids) merged over all partitions.
+        """
+        # A few partitions per worker evens out skewed amount distributions
+        partitions = [
+            p for p in self.matcher.partitions(self.workers * 4)
+            if len(p[0][0]) and len(p[1][0])
+        ]
+        exact, fuzzy = [], []
+        if partitions:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures = [
+                    asyncio.wrap_future(pool.submit(match_partition, bank, ledger, self.date_window_days))
+                    for bank, ledger in partitions
+                ]
+                # gather keeps submission order, so the merge is deterministic
+                for part_exact, part_fuzzy in await asyncio.gather(*futures):
+                    exact.extend(part_exact)
+                    fuzzy.extend(part_fuzzy)
+
+        paired = {transaction_id for transaction_id, _ in exact + fuzzy}
+        open_bank = [b for b in self.matcher.bank_ids if b not in paired]
+        return exact, fuzzy, open_bank
@@ -0,0 +1,165 @@
+from collections import defaultdict
+from bisect import bisect_left
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from app.models import tables
+from app.services.descriptions import counterparty_key
+
+class PatternMemory:
+    """
+    What each bank counterparty was matched to before: (ledger counterparty, GL code)
+    patterns with their hit counts, read from the match_patterns table.
+
+    A bank row with a known counterparty only looks at ledger rows in the buckets of
+    its patterns (same ledger counterparty, GL code and amount), most-confirmed
+    pattern first, and takes the closest date inside the window.
+    """
+    def __init__(self, patterns, date_window_days: int):
+        # bank_key -> [(ledger_key, gl_code)], most hits first
+        self.patterns = patterns
+        self.date_window_days = date_window_days
+        # Ledger buckets probed by the last match()
+        self.candidates = 0
+
+    @classmethod
+    def load(cls, db: Session, bank_keys, min_hits: int, date_window_days: int):
+        """
+        Loads the patterns of the given bank counterparties with at least `min_hits` hits.
+        """
+        P = tables.MatchPattern
+        patterns = defaultdict(list)
+        keys = list(set(bank_keys))
+        # Chunked so the IN list stays within the database's parameter limit
+        for start in range(0, len(keys), 500):
+            rows = db.execute(
+                select(P.bank_key, P.ledger_key, P.gl_code).where(
+                    P.bank_key.in_(keys[start:start + 500]), P.hits >= min_hits
+                ).order_by(P.bank_key, P.hits.desc(), P.ledger_key)
+            )
+            for bank_key, ledger_key, gl_code in rows:
+                patterns[bank_key].append((ledger_key, gl_code))
+        return cls(patterns, date_window_days)
+
+    def match(self, bank_rows, ledger_rows):
+        """
+        Returns (bank_tx, ledger_entry) pairs; each ledger row is used once.
+        """
+        if not self.patterns:
+            return []
+
+        # (ledger_key, gl_code, absolute amount) -> (date ordinals, entries), sorted by date
+        buckets = defaultdict(lambda: ([], []))
+        for entry in sorted(ledger_rows, key=lambda e: e.date.toordinal()):
+            ordinals, entries = buckets[(counterparty_key(entry.description), entry.gl_code, abs(entry.amount))]
+            ordinals.append(entry.date.toordinal())
+            entries.append(entry)
+
+        pairs = []
+        for bank_tx in bank_rows:
+            for ledger_key, gl_code in self.patterns.get(counterparty_key(bank_tx.description), ()):
+                bucket = buckets.get((ledger_key, gl_code, abs(bank_tx.amount)))
+                self.candidates += 1
+                match = self._take_closest(bucket, bank_tx.date.toordinal()) if bucket else None
+                if match:
+                    pairs.append((bank_tx, match))
+                    break
+        return pairs
+
+    def _take_closest(self, bucket, ordinal):
+        """
+        Removes and returns the entry dated closest to `ordinal` inside the window
+        (the earlier one on a tie), or None.
+        """
+        ordinals, entries = bucket
+        for offset in self._offsets():
+            pos = bisect_left(ordinals, ordinal + offset)
+            if pos < len(ordinals) and ordinals[pos] == ordinal + offset:
+                del ordinals[pos]
+                return entries.pop(pos)
+        return None
+
+    def _offsets(self):
+        yield 0
+        for distance in range(1, self.date_window_days + 1):
+            yield -distance
+            yield distance
+
+def learn_patterns(db: Session):
+    """
+    Folds the matches not learned yet into match_patterns and flags them, in one
+    transaction, so each match counts once however late it was committed. Only
+    one-to-one pairs count. Returns the number of matches learned.
+    """
+    T, L, M = tables.Transaction, tables.InternalLedger, tables.ReconciliationMatch
+    stmt = select(M.id, T.description, L.description, L.gl_code, M.matched_at).select_from(M).join(
+        T, T.id == M.transaction_id
+    ).join(
+        L, L.id == M.ledger_id
+    ).where(
+        M.group_id.is_(None), M.patterns_learned.is_(False)
+    ).with_for_update(of=M, skip_locked=True)  # a concurrent learner keeps its rows
+
+    counts = defaultdict(int)
+    newest = {}
+    match_ids = []
+    for match_id, bank_desc, ledger_desc, gl_code, matched_at in db.execute(stmt):
+        match_ids.append(match_id)
+        key = _pattern_key(bank_desc, ledger_desc, gl_code)
+        if key is None:
+            continue
+        counts[key] += 1
+        newest[key] = max(newest.get(key, matched_at), matched_at)
+
+    for start in range(0, len(match_ids), 500):
+        db.execute(update(M).where(M.id.in_(match_ids[start:start + 500])).values(patterns_learned=True))
+    _add_hits(db, counts, newest)
+    db.commit()
+    return sum(counts.values())
+
+def unlearn_patterns(db: Session, run_id: str):
+    """
+    Takes the learned matches of `run_id` back out of the hit counts, before the run
+    is rolled back, so re-running it does not count them twice. Leaves committing
+    to the caller.
+    """
+    T, L, M = tables.Transaction, tables.InternalLedger, tables.ReconciliationMatch
+    stmt = select(T.description, L.description, L.gl_code).select_from(M).join(
+        T, T.id == M.transaction_id
+    ).join(
+        L, L.id == M.ledger_id
+    ).where(M.run_id == run_id, M.group_id.is_(None), M.patterns_learned.is_(True))
+
+    counts = defaultdict(int)
+    for bank_desc, ledger_desc, gl_code in db.execute(stmt):
+        key = _pattern_key(bank_desc, ledger_desc, gl_code)
+        if key is not None:
+            counts[key] -= 1
+    _add_hits(db, counts, {})
+
+def _pattern_key(bank_desc, ledger_desc, gl_code):
+    bank_key, ledger_key = counterparty_key(bank_desc), counterparty_key(ledger_desc)
+    if not bank_key or not ledger_key:
+        return None
+    return bank_key, ledger_key, gl_code
+
+def _add_hits(db: Session, counts, newest):
+    """
+    Adds `counts` (possibly negative) to the hits of the patterns, creating new ones.
+    """
+    P = tables.MatchPattern
+    existing = {}
+    bank_keys = list({k[0] for k in counts})
+    for start in range(0, len(bank_keys), 500):
+        for pattern in db.query(P).filter(P.bank_key.in_(bank_keys[start:start + 500])):
+            existing[(pattern.bank_key, pattern.ledger_key, pattern.gl_code)] = pattern
+
+    for key, hits in counts.items():
+        pattern = existing.get(key)
+        if pattern is None:
+            if hits > 0:
+                bank_key, ledger_key, gl_code = key
+                db.add(P(bank_key=bank_key, ledger_key=ledger_key, gl_code=gl_code, hits=hits, last_matched_at=newest[key]))
+        else:
+            pattern.hits = max(0, pattern.hits + hits)
+            if key in newest:
+                pattern.last_matched_at = max(pattern.last_matched_at, newest[key])
@@ -0,0 +1,144 @@
+import json
+from datetime import date
+from typing import List
+from sqlalchemy import false, or_, select
+from app.models import tables
+
+class ReconciliationScope:
+    """
+    The slice of data a reconciliation run looks at. Every matching mode turns it
+    into WHERE clauses, so only the relevant rows are ever loaded.
+    A scope with no filters covers the whole database.
+
+    Bank-side filters: statement_ids, bank_name. Ledger-side filter: gl_code_prefixes.
+    The date range applies to both sides, so e.g. two runs that only differ in
+    bank_name still load (and can match) the same ledger rows; see overlaps().
+    """
+    def __init__(
+        self,
+        statement_ids: List[str] = None,
+        bank_name: str = None,
+        gl_code_prefixes: List[str] = None,
+        date_from: date = None,
+        date_to: date = None,
+        empty: bool = False
+    ):
+        self.statement_ids = statement_ids or None
+        self.bank_name = bank_name or None
+        self.gl_code_prefixes = gl_code_prefixes or None
+        self.date_from = date_from
+        self.date_to = date_to
+        # Nothing to do at all (e.g. an incremental run with no new uploads)
+        self.empty = empty
+
+    def narrowed(self, date_from: date = None, date_to: date = None, empty: bool = False):
+        """
+        A copy of this scope restricted further to [date_from, date_to].
+        """
+        starts = [d for d in (self.date_from, date_from) if d]
+        ends = [d for d in (self.date_to, date_to) if d]
+        return ReconciliationScope(
+            statement_ids=self.statement_ids,
+            bank_name=self.bank_name,
+            gl_code_prefixes=self.gl_code_prefixes,
+            date_from=max(starts) if starts else None,
+            date_to=min(ends) if ends else None,
+            empty=self.empty or empty
+        )
+
+    def to_dict(self):
+        """
+        The filters that are set, JSON-friendly (stored on the run record).
+        """
+        data = {
+            "statement_ids": sorted(self.statement_ids) if self.statement_ids else None,
+            "bank_name": self.bank_name,
+            "gl_code_prefixes": sorted(self.gl_code_prefixes) if self.gl_code_prefixes else None,
+            "date_from": self.date_from.isoformat() if self.date_from else None,
+            "date_to": self.date_to.isoformat() if self.date_to else None,
+        }
+        return {k: v for k, v in data.items() if v is not None}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Inverse of to_dict (e.g. for a scope stored on a queued job).
+        """
+        data = dict(data or {})
+        for field in ("date_from", "date_to"):
+            if data.get(field):
+                data[field] = date.fromisoformat(data[field])
+        return cls(**data)
+
+    @property
+    def key(self):
+        """
+        Canonical string for the scope; runs with the same key share a watermark.
+        """
+        return json.dumps(self.to_dict(), sort_keys=True)
+
+    def overlaps(self, other: "ReconciliationScope"):
+        """
+        False only if the two scopes can't touch a common row on either side, so runs
+        over them can safely go at the same time. Anything that can't be decided from
+        the filters alone (e.g. statement_ids against a bank_name) counts as overlapping.
+        """
+        if self.empty or other.empty or self._dates_disjoint(other):
+            return False
+        return not (self._bank_side_disjoint(other) and self._ledger_side_disjoint(other))
+
+    def _dates_disjoint(self, other):
+        return bool(
+            (self.date_to and other.date_from and self.date_to < other.date_from)
+            or (other.date_to and self.date_from and other.date_to < self.date_from)
+        )
+
+    def _bank_side_disjoint(self, other):
+        if self.statement_ids and other.statement_ids:
+            return not set(self.statement_ids) & set(other.statement_ids)
+        if self.bank_name and other.bank_name:
+            return self.bank_name != other.bank_name
+        return False
+
+    def _ledger_side_disjoint(self, other):
+        if not (self.gl_code_prefixes and other.gl_code_prefixes):
+            return False
+        return not any(
+            p.startswith(q) or q.startswith(p) for p in self.gl_code_prefixes for q in other.gl_code_prefixes
+        )
+
+    def bank_filters(self):
+        if self.empty:
+            return [false()]
+        T = tables.Transaction
+        clauses = self._date_filters(T)
+        if self.statement_ids:
+            clauses.append(T.statement_id.in_(self.statement_ids))
+        if self.bank_name:
+            clauses.append(T.statement_id.in_(
+                select(tables.BankStatement.id).where(tables.BankStatement.bank_name == self.bank_name)
+            ))
+        return clauses
+
+    def ledger_filters(self):
+        if self.empty:
+            return [false()]
+        L = tables.InternalLedger
+        clauses = self._date_filters(L)
+        if self.gl_code_prefixes:
+            clauses.append(or_(*[L.gl_code.startswith(p) for p in self.gl_code_prefixes]))
+        return clauses
+
+    def filters_for(self, model):
+        return self.bank_filters() if model is tables.Transaction else self.ledger_filters()
+
+    def _date_filters(self, model):
+        clauses = []
+        if self.date_from:
+            clauses.append(model.date >= self.date_from)
+        if self.date_to:
+            clauses.append(model.date <= self.date_to)
+        return clauses
+
+# Key of a run over the whole database; its watermark covers every scope
+FULL_SCOPE_KEY = ReconciliationScope().key
@@ -0,0 +1,39 @@
+from datetime import datetime
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+from app.models import tables
+from app.services.lag_profiles import unlearn_lags
+from app.services.pattern_memory import unlearn_patterns
+
+def rollback_run(db: Session, run: tables.ReconciliationRun):
+    """
+    Deletes every match written by `run` with one bulk DELETE on the indexed run_id,
+    which puts those bank and ledger rows back in the unmatched pool.
+    Records the count and the date span of the released rows on the run (a re-run only
+    needs to look at that span) and marks it 'rolled_back'. Patterns and lag
+    histograms learned from the deleted matches lose those hits again. Returns the run.
+    """
+    T, L, M = tables.Transaction, tables.InternalLedger, tables.ReconciliationMatch
+
+    # Date span of the rows about to be released, both sides
+    dates = []
+    for model, match_fk in ((T, M.transaction_id), (L, M.ledger_id)):
+        dates.extend(db.execute(
+            select(func.min(model.date), func.max(model.date)).select_from(M).join(
+                model, model.id == match_fk
+            ).where(M.run_id == run.id)
+        ).one())
+    dates = [d for d in dates if d is not None]
+
+    unlearn_patterns(db, run.id)
+    unlearn_lags(db, run.id)
+    deleted = db.execute(delete(M).where(M.run_id == run.id)).rowcount
+    run.status = "rolled_back"
+    run.rollback = {
+        "matches_deleted": deleted,
+        "date_from": min(dates).isoformat() if dates else None,
+        "date_to": max(dates).isoformat() if dates else None,
+        "rolled_back_at": datetime.utcnow().isoformat()
+    }
+    db.commit()
+    return run
@@ -0,0 +1,80 @@
+import gc
+import time
+from contextlib import contextmanager
+
+# Where the time of a run goes: loading rows, pairing them, writing matches
+PHASES = ("fetch", "match", "persist")
+
+class RunStats:
+    """
+    Instrumentation of one engine run: seconds per phase (fetch / match / persist),
+    and per pass the candidates examined, ambiguous rows (more than one candidate),
+    matches and wall time. "match" is whatever is not fetch or persist.
+
+    With `count_objects`, the number of live Python objects is sampled at every pass
+    boundary (gc.get_objects, too slow to leave on for normal runs); otherwise only
+    the peak number of rows held in memory is tracked.
+    """
+    def __init__(self, count_objects: bool = False):
+        self.count_objects = count_objects
+        self.seconds = {phase: 0.0 for phase in PHASES}
+        self.passes = {}
+        self.peak_rows = 0
+        self.peak_objects = None
+        self._started = time.perf_counter()
+        self._pass_started = self._started
+
+    @contextmanager
+    def timed(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[phase] += time.perf_counter() - start
+
+    def add_seconds(self, phase, seconds):
+        self.seconds[phase] += seconds
+
+    def rows_in_memory(self, count):
+        self.peak_rows = max(self.peak_rows, count)
+
+    def count(self, pass_name, candidates: int = 0, ambiguous: int = 0):
+        entry = self._entry(pass_name)
+        entry["candidates"] += candidates
+        entry["ambiguous"] += ambiguous
+
+    def begin_passes(self):
+        """
+        Starts the clock of the first pass once the rows are loaded.
+        """
+        self._pass_started = time.perf_counter()
+
+    def end_pass(self, pass_name, matches: int):
+        now = time.perf_counter()
+        entry = self._entry(pass_name)
+        entry["matches"] += matches
+        entry["seconds"] += now - self._pass_started
+        self._pass_started = now
+        self._sample_objects()
+
+    def to_dict(self):
+        total = time.perf_counter() - self._started
+        seconds = dict(self.seconds)
+        seconds["match"] = max(0.0, total - seconds["fetch"] - seconds["persist"])
+        return {
+            "seconds": {k: round(v, 4) for k, v in {**seconds, "total": total}.items()},
+            "passes": {
+                name: {**entry, "seconds": round(entry["seconds"], 4)} for name, entry in self.passes.items()
+            },
+            "peak_rows_in_memory": self.peak_rows,
+            "peak_objects": self.peak_objects
+        }
+
+    def _entry(self, pass_name):
+        if pass_name not in self.passes:
+            self.passes[pass_name] = {"candidates": 0, "ambiguous": 0, "matches": 0, "seconds": 0.0}
+        return self.passes[pass_name]
+
+    def _sample_objects(self):
+        if self.count_objects:
+            self.peak_objects = max(self.peak_objects or 0, len(gc.get_objects()))
@@ -0,0 +1,43 @@
+from typing import List
+import numpy as np
+from app.services.descriptions import description_tokens
+
+def char_ngrams(description: str, n: int = 3) -> List[str]:
+    """
+    Character n-grams of the normalized description (noise words removed),
+    padded so short names like "AWS" still produce grams.
+    """
+    text = " " + " ".join(description_tokens(description)) + " "
+    if len(text.strip()) == 0:
+        return []
+    return [text[i:i + n] for i in range(len(text) - n + 1)]
+
+def tfidf_matrix(descriptions: List[str], n: int = 3) -> np.ndarray:
+    """
+    L2-normalized character n-gram TF-IDF vectors, one row per description.
+    The vocabulary is built from `descriptions` only, so keep the list block-sized.
+    """
+    vocab = {}
+    doc_grams = []
+    for description in descriptions:
+        grams = [vocab.setdefault(g, len(vocab)) for g in char_ngrams(description, n)]
+        doc_grams.append(grams)
+
+    counts = np.zeros((len(descriptions), max(1, len(vocab))), dtype=np.float32)
+    for row, grams in enumerate(doc_grams):
+        np.add.at(counts[row], grams, 1.0)
+
+    doc_freq = np.count_nonzero(counts, axis=0)
+    idf = np.log((1 + len(descriptions)) / (1 + doc_freq)) + 1.0
+    weights = counts * idf
+
+    norms = np.linalg.norm(weights, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return weights / norms
+
+def similarity_matrix(left: List[str], right: List[str]) -> np.ndarray:
+    """
+    Cosine similarity of every left description against every right description.
+    """
+    vectors = tfidf_matrix(list(left) + list(right))
+    return vectors[:len(left)] @ vectors[len(left):].T
@@ -0,0 +1,131 @@
+import time
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from app.services.amounts import to_cents
+from app.services.descriptions import counterparty_key
+
+class SplitSearchTimeout(Exception):
+    """
+    Raised when a block uses up its time budget; the block is abandoned.
+    """
+
+def find_subset(target, candidates, max_parts, deadline):
+    """
+    Depth-first subset-sum search over `candidates` (cents, sorted descending).
+    Returns the positions of 2..max_parts candidates adding up to `target`, or None.
+    Branches are pruned when the remaining candidates can no longer reach the target.
+    """
+    # suffix[i] = sum of candidates[i:], used to prune branches that can't reach the target
+    suffix = [0] * (len(candidates) + 1)
+    for i in range(len(candidates) - 1, -1, -1):
+        suffix[i] = suffix[i + 1] + candidates[i]
+
+    def search(start, remaining, chosen):
+        if remaining == 0:
+            return chosen if len(chosen) >= 2 else None
+        if len(chosen) == max_parts:
+            return None
+        if time.perf_counter() > deadline:
+            raise SplitSearchTimeout()
+
+        for i in range(start, len(candidates)):
+            if suffix[i] < remaining:
+                break
+            # Sorted descending: with k slots left, k times this value is the most we can add
+            if candidates[i] * (max_parts - len(chosen)) < remaining:
+                break
+            if candidates[i] > remaining:
+                continue
+            found = search(i + 1, remaining - candidates[i], chosen + [i])
+            if found:
+                return found
+        return None
+
+    return search(0, target, [])
+
+class SplitMatcher:
+    """
+    Finds many-to-one matches: one bank wire settling several ledger invoices, or one
+    ledger payment arriving as several bank debits.
+
+    Rows are blocked by counterparty (see descriptions.counterparty_key); inside a block
+    each row on the "one" side looks for 2..max_parts rows on the other side, dated
+    within the window, whose absolute amounts add up to its own. Each block has a hard
+    time budget, so one pathological block cannot stall the run.
+    """
+    def __init__(self, date_window_days: int, max_parts: int, max_candidates: int, block_time_limit_ms: int):
+        self.date_window_days = date_window_days
+        self.max_parts = max_parts
+        self.max_candidates = max_candidates
+        self.block_time_limit = block_time_limit_ms / 1000
+        self.timed_out_blocks = 0
+
+    def match(self, bank_rows, ledger_rows):
+        """
+        Returns a list of (bank rows, ledger rows) groups; one side always has one row.
+        """
+        bank_blocks = self._by_counterparty(bank_rows)
+        ledger_blocks = self._by_counterparty(ledger_rows)
+
+        groups = []
+        for key in sorted(bank_blocks.keys() & ledger_blocks.keys()):
+            banks, ledgers = bank_blocks[key], ledger_blocks[key]
+            deadline = time.perf_counter() + self.block_time_limit
+            try:
+                # One bank wire settling several ledger invoices
+                for bank_tx, parts in self._find_groups(banks, ledgers, deadline):
+                    groups.append(([bank_tx], parts))
+                # One ledger payment showing up as several bank debits
+                for entry, parts in self._find_groups(ledgers, banks, deadline):
+                    groups.append((parts, [entry]))
+            except SplitSearchTimeout:
+                # Groups found before the budget ran out are kept
+                self.timed_out_blocks += 1
+        return groups
+
+    def _find_groups(self, targets, parts, deadline):
+        """
+        Yields (target, parts) for each target whose amount is covered by a subset of
+        `parts`. Rows used here are removed from both lists so the other direction
+        can't reuse them.
+        """
+        parts.sort(key=lambda p: p.date.toordinal())
+        ordinals = [p.date.toordinal() for p in parts]
+        used, matched_targets = set(), set()
+
+        try:
+            for target in sorted(targets, key=lambda t: t.date.toordinal()):
+                ordinal = target.date.toordinal()
+                lo = bisect_left(ordinals, ordinal - self.date_window_days)
+                hi = bisect_right(ordinals, ordinal + self.date_window_days)
+
+                target_cents = to_cents(target.amount)
+                window = [
+                    p for p in parts[lo:hi]
+                    if id(p) not in used and 0 < to_cents(p.amount) < target_cents
+                ]
+                if len(window) < 2:
+                    continue
+
+                # Closest dates are the likeliest parts; cap the search width
+                window.sort(key=lambda p: abs(p.date.toordinal() - ordinal))
+                window = sorted(window[:self.max_candidates], key=lambda p: to_cents(p.amount), reverse=True)
+
+                subset = find_subset(target_cents, [to_cents(p.amount) for p in window], self.max_parts, deadline)
+                if subset:
+                    chosen = [window[i] for i in subset]
+                    used.update(id(p) for p in chosen)
+                    matched_targets.add(id(target))
+                    yield target, chosen
+        finally:
+            parts[:] = [p for p in parts if id(p) not in used]
+            targets[:] = [t for t in targets if id(t) not in matched_targets]
+
+    @staticmethod
+    def _by_counterparty(rows):
+        blocks = defaultdict(list)
+        for row in rows:
+            key = counterparty_key(row.description)
+            if key:
+                blocks[key].append(row)
+        return blocks
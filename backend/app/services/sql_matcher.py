@@ -0,0 +1,187 @@
+from datetime import date, datetime
+from sqlalchemy import BigInteger, Date, String, and_, cast, exists, func, insert, literal, select
+from sqlalchemy.orm import Session
+from app.models import tables
+from app.services.reconciliation_scope import ReconciliationScope
+
+# --- SHARED COLUMN EXPRESSIONS (also used by the columnar matcher) ---
+def cents_expr(amount_col):
+    """
+    Absolute amount as integer cents, so -100.00 and 100.00 land in the same group.
+    """
+    return cast(func.round(func.abs(amount_col) * 100), BigInteger)
+
+def day_number_expr(date_col, dialect):
+    """
+    A date as an integer day number, so dates can be shifted and compared as ints.
+    """
+    if dialect == "sqlite":
+        # SQLite stores dates as 'YYYY-MM-DD' text
+        return cast(func.julianday(date_col), BigInteger)
+    return date_col - literal(date(1970, 1, 1), Date)
+
+def unmatched_clause(model, match_fk):
+    """
+    True for rows of `model` that are still open: no ReconciliationMatch yet, or only
+    a 'mismatch' one. Mismatches are a recomputed status, not a lock on the row.
+    """
+    return ~exists().where(
+        match_fk == model.id,
+        tables.ReconciliationMatch.match_type != "mismatch"
+    )
+
+class SqlMatcher:
+    """
+    Runs the reconciliation passes inside the database as INSERT ... SELECT statements.
+    No Transaction / InternalLedger objects are loaded into Python.
+
+    Pairing follows the Python engine exactly: within each (absolute amount, day) group,
+    bank and ledger rows are numbered by id with ROW_NUMBER() and the n-th bank row is
+    paired with the n-th ledger row. The fuzzy_date pass repeats this once per day offset
+    (-1, +1, -2, +2, ...), so the closest-dated partner wins, just like in Python.
+    Works on SQLite (dev) and Postgres.
+
+    `commit(pass name, rows inserted, pass done)` replaces the plain commits (the engine
+    uses it to checkpoint the run); every fuzzy_date offset is committed on its own.
+    Given the checkpoint of an interrupted run as `resume`, finished passes are skipped
+    and the fuzzy_date pass picks up at the first offset not yet committed.
+    """
+    def __init__(
+        self,
+        db: Session,
+        date_window_days: int,
+        scope: ReconciliationScope = None,
+        commit=None,
+        resume=None,
+        run_id: str = None
+    ):
+        self.db = db
+        self.date_window_days = date_window_days
+        self.scope = scope or ReconciliationScope()
+        self.dialect = db.get_bind().dialect.name
+        self.commit = commit or (lambda name, rows, pass_done: self.db.commit())
+        self.resume = resume or {}
+        # Written on every inserted match
+        self.run_id = run_id
+
+    def run(self):
+        results = {
+            "bank_items_scanned": self._count_unmatched(tables.Transaction, tables.ReconciliationMatch.transaction_id),
+            "ledger_items_scanned": self._count_unmatched(tables.InternalLedger, tables.ReconciliationMatch.ledger_id),
+            "exact_matches": 0,
+            "fuzzy_matches": 0
+        }
+
+        if not results["bank_items_scanned"]:
+            return results
+
+        completed = self.resume.get("completed_passes", ())
+        try:
+            # --- PASS 1: EXACT MATCH (Amount + Date) ---
+            if "exact" not in completed:
+                results["exact_matches"] = self._pair_on_offset(0, "exact", 1.0)
+                self.commit("exact", results["exact_matches"], True)
+
+            # --- PASS 2: FUZZY DATE (Amount + Date +/- window) ---
+            if "fuzzy_date" not in completed:
+                offsets = [o for d in range(1, self.date_window_days + 1) for o in (-d, d)]
+                done = self.resume.get("batches", 0) if self.resume.get("pass") == "fuzzy_date" else 0
+                for step, offset in enumerate(offsets, 1):
+                    if step <= done:
+                        continue
+                    inserted = self._pair_on_offset(offset, "fuzzy_date", 0.85)
+                    results["fuzzy_matches"] += inserted
+                    self.commit("fuzzy_date", inserted, step == len(offsets))
+                if not offsets:
+                    self.commit("fuzzy_date", 0, True)
+
+            # --- FINAL PASS: REPORT MISMATCHES ---
+            self.commit("mismatch", self._insert_mismatches(), True)
+        except Exception:
+            self.db.rollback()
+            raise
+
+        return results
+
+    def _pair_on_offset(self, offset, match_type, confidence):
+        """
+        Pairs unmatched bank rows with unmatched ledger rows dated `offset` days later.
+        Returns the number of matches inserted.
+        """
+        bank = self._ranked_unmatched(tables.Transaction, tables.ReconciliationMatch.transaction_id)
+        ledger = self._ranked_unmatched(tables.InternalLedger, tables.ReconciliationMatch.ledger_id)
+
+        pairs = select(
+            self._new_id(),
+            bank.c.id,
+            ledger.c.id,
+            literal(match_type, String),
+            literal(confidence),
+            literal(datetime.utcnow())
+        ).select_from(
+            bank.join(ledger, and_(
+                ledger.c.cents == bank.c.cents,
+                ledger.c.day == bank.c.day + offset,
+                ledger.c.rn == bank.c.rn
+            ))
+        )
+        return self._insert_from(pairs)
+
+    def _insert_mismatches(self):
+        """
+        Records every bank row that is still unmatched as a 'mismatch' (no ledger pair).
+        """
+        T = tables.Transaction
+        leftovers = select(
+            self._new_id(),
+            T.id,
+            literal(None, String),
+            literal("mismatch", String),
+            literal(0.0),
+            literal(datetime.utcnow())
+        ).where(
+            ~exists().where(tables.ReconciliationMatch.transaction_id == T.id),
+            *self.scope.bank_filters()
+        )
+        return self._insert_from(leftovers)
+
+    def _insert_from(self, selectable):
+        M = tables.ReconciliationMatch
+        stmt = insert(M).from_select(
+            [M.id, M.transaction_id, M.ledger_id, M.match_type, M.confidence_score, M.matched_at, M.run_id],
+            selectable.add_columns(literal(self.run_id, String))
+        )
+        return self.db.execute(stmt).rowcount
+
+    def _ranked_unmatched(self, model, match_fk):
+        """
+        Unmatched rows of `model` with integer cents, day number, and their rank
+        inside the (cents, day) group.
+        """
+        cents = cents_expr(model.amount)
+        day = day_number_expr(model.date, self.dialect)
+        return select(
+            model.id.label("id"),
+            cents.label("cents"),
+            day.label("day"),
+            func.row_number().over(partition_by=(cents, day), order_by=model.id).label("rn")
+        ).where(unmatched_clause(model, match_fk), *self.scope.filters_for(model)).subquery()
+
+    def _count_unmatched(self, model, match_fk):
+        return self.db.scalar(
+            select(func.count()).select_from(model).where(
+                unmatched_clause(model, match_fk), *self.scope.filters_for(model)
+            )
+        )
+
+    def _new_id(self):
+        """
+        A uuid4-style string id generated by the database itself.
+        """
+        if self.dialect == "sqlite":
+            h = func.lower(func.hex(func.randomblob(16)))
+            part = lambda start, length: func.substr(h, start, length, type_=String)
+            return (
+                part(1, 8) + "-" + part(9, 4) + "-" + part(13, 4) + "-" + part(17, 4) + "-" + part(21, 12)
+            )
+        return cast(func.gen_random_uuid(), String)
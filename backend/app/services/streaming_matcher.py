@@ -0,0 +1,229 @@
+import csv
+import tempfile
+import time
+from collections import deque
+from itertools import chain, groupby, islice
+from operator import itemgetter
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.models import tables
+from app.services.columnar_matcher import ColumnarMatcher
+from app.services.reconciliation_scope import ReconciliationScope
+from app.services.sql_matcher import cents_expr, day_number_expr, unmatched_clause
+
+class StreamingMatcher:
+    """
+    Out-of-core exact + fuzzy_date matching for data sets larger than RAM.
+
+    Both sides are read through server-side cursors ordered by (cents, day, id), so
+    the database does the big sort, and merge-joined one amount at a time. Amounts
+    with up to `chunk_rows` rows per side are buffered and matched in chunks of about
+    `chunk_rows` rows with the columnar core. Bigger ones are never loaded whole: they
+    flow day by day through one stage per pass (exact, then each fuzzy offset in the
+    order the other modes use). Within a pass a bank day only meets the ledger day at
+    that offset, so a stage holds just |offset| + 1 days. Results are spilled to temp
+    files and only written back after the cursors are closed.
+
+    Peak memory is one chunk plus the rows of a single amount within about
+    window * (window + 1) days, however many rows there are. Matches are the same as
+    in the other modes.
+    """
+    def __init__(self, db: Session, date_window_days: int, chunk_rows: int, scope: ReconciliationScope = None):
+        self.db = db
+        self.date_window_days = date_window_days
+        self.chunk_rows = chunk_rows
+        self.scope = scope or ReconciliationScope()
+        self.dialect = db.get_bind().dialect.name
+
+        self.bank_count = 0
+        self.ledger_count = 0
+        # One spill file per pass so they can be written back pass by pass
+        self.spills = {name: tempfile.TemporaryFile("w+", newline="") for name in ("exact", "fuzzy_date", "mismatch")}
+        self._writers = {name: csv.writer(f) for name, f in self.spills.items()}
+        self._bank_buffer = []
+        self._ledger_buffer = []
+        # Time spent reading the cursors (the rest of run() is matching), and the
+        # largest chunk held at once
+        self.read_seconds = 0.0
+        self.peak_buffer_rows = 0
+        self._match_seconds = 0.0
+
+    def run(self):
+        """
+        Streams and matches everything in scope. Returns the spill files, rewound,
+        keyed by match type; each row is (transaction_id, ledger_id).
+        """
+        bank_stream = self._stream(tables.Transaction, tables.ReconciliationMatch.transaction_id)
+        ledger_stream = self._stream(tables.InternalLedger, tables.ReconciliationMatch.ledger_id)
+        started = time.perf_counter()
+        try:
+            for bank_rows, ledger_rows in self._merge_by_amount(bank_stream, ledger_stream):
+                bank_head = list(islice(bank_rows, self.chunk_rows + 1))
+                ledger_head = list(islice(ledger_rows, self.chunk_rows + 1))
+                if len(bank_head) > self.chunk_rows or len(ledger_head) > self.chunk_rows:
+                    self._match_large_amount(chain(bank_head, bank_rows), chain(ledger_head, ledger_rows))
+                    continue
+                self.bank_count += len(bank_head)
+                self.ledger_count += len(ledger_head)
+                self._bank_buffer.extend(bank_head)
+                self._ledger_buffer.extend(ledger_head)
+                if len(self._bank_buffer) + len(self._ledger_buffer) >= self.chunk_rows:
+                    self._match_buffer()
+            self._match_buffer()
+        finally:
+            bank_stream.close()
+            ledger_stream.close()
+        self.read_seconds = time.perf_counter() - started - self._match_seconds
+
+        for f in self.spills.values():
+            f.seek(0)
+        return {name: csv.reader(f) for name, f in self.spills.items()}
+
+    def close(self):
+        for f in self.spills.values():
+            f.close()
+
+    def _stream(self, model, match_fk):
+        cents = cents_expr(model.amount)
+        day = day_number_expr(model.date, self.dialect)
+        stmt = select(model.id, cents, day).where(
+            unmatched_clause(model, match_fk), *self.scope.filters_for(model)
+        ).order_by(cents, day, model.id)
+        # stream_results asks for a server-side cursor (Postgres); rows arrive in chunks
+        return self.db.execute(
+            stmt, execution_options={"stream_results": True, "yield_per": self.chunk_rows}
+        )
+
+    def _merge_by_amount(self, bank_stream, ledger_stream):
+        """
+        Merge-joins the two sorted streams on cents. Yields (bank rows, ledger rows)
+        iterators per amount that has bank rows, to be consumed before the next one;
+        ledger-only amounts are just counted.
+        """
+        bank_groups = groupby(bank_stream, key=itemgetter(1))
+        ledger_groups = groupby(ledger_stream, key=itemgetter(1))
+        bank = next(bank_groups, None)
+        ledger = next(ledger_groups, None)
+
+        while bank is not None:
+            if ledger is None or bank[0] < ledger[0]:
+                yield bank[1], iter(())
+                bank = next(bank_groups, None)
+            elif ledger[0] < bank[0]:
+                self.ledger_count += sum(1 for _ in ledger[1])
+                ledger = next(ledger_groups, None)
+            else:
+                yield bank[1], ledger[1]
+                bank = next(bank_groups, None)
+                ledger = next(ledger_groups, None)
+
+        # Remaining ledger-only amounts still count as scanned
+        while ledger is not None:
+            self.ledger_count += sum(1 for _ in ledger[1])
+            ledger = next(ledger_groups, None)
+
+    def _match_large_amount(self, bank_rows, ledger_rows):
+        """
+        Matches one amount too big for a chunk by piping its days through a stage per
+        pass, so only a few days of it are in memory at a time.
+        """
+        days = self._exact_stage(self._days(bank_rows, ledger_rows))
+        for distance in range(1, self.date_window_days + 1):
+            for offset in (-distance, distance):
+                days = self._offset_stage(days, offset)
+        for _, bank_ids, _ in days:
+            self._writers["mismatch"].writerows((bank_id, "") for bank_id in bank_ids)
+
+    def _days(self, bank_rows, ledger_rows):
+        """
+        (day, bank ids, ledger ids) for each day of one amount, in day order; ids in
+        id order.
+        """
+        bank_days = groupby(bank_rows, key=itemgetter(2))
+        ledger_days = groupby(ledger_rows, key=itemgetter(2))
+        bank = next(bank_days, None)
+        ledger = next(ledger_days, None)
+
+        while bank is not None or ledger is not None:
+            day = min(group[0] for group in (bank, ledger) if group is not None)
+            bank_ids, ledger_ids = [], []
+            if bank is not None and bank[0] == day:
+                bank_ids = [r[0] for r in bank[1]]
+                bank = next(bank_days, None)
+            if ledger is not None and ledger[0] == day:
+                ledger_ids = [r[0] for r in ledger[1]]
+                ledger = next(ledger_days, None)
+            self.bank_count += len(bank_ids)
+            self.ledger_count += len(ledger_ids)
+            yield day, bank_ids, ledger_ids
+
+    def _exact_stage(self, days):
+        for day, bank_ids, ledger_ids in days:
+            self._pair(bank_ids, ledger_ids, "exact")
+            yield day, bank_ids, ledger_ids
+
+    def _offset_stage(self, days, offset):
+        """
+        Pairs the open bank rows of each day with the open ledger rows `offset` days
+        away, first with first. A day is passed on once no later day can reach it.
+        """
+        reach = abs(offset)
+        held = {}
+        order = deque()
+        for day, bank_ids, ledger_ids in days:
+            held[day] = (bank_ids, ledger_ids)
+            order.append(day)
+            if offset < 0 and day + offset in held:
+                self._pair(bank_ids, held[day + offset][1], "fuzzy_date")
+            elif offset > 0 and day - offset in held:
+                self._pair(held[day - offset][0], ledger_ids, "fuzzy_date")
+            while order[0] + reach <= day:
+                done = order.popleft()
+                yield (done, *held.pop(done))
+        for done in order:
+            yield (done, *held[done])
+
+    def _pair(self, bank_ids, ledger_ids, match_type):
+        """
+        Pairs the two lists front to front and removes the pairs from both.
+        """
+        n = min(len(bank_ids), len(ledger_ids))
+        if n:
+            self._writers[match_type].writerows(zip(bank_ids[:n], ledger_ids[:n]))
+            del bank_ids[:n]
+            del ledger_ids[:n]
+
+    def _match_buffer(self):
+        """
+        Matches the buffered pieces (independent of each other) in one columnar pass
+        and spills the results.
+        """
+        if not self._bank_buffer:
+            self._ledger_buffer = []
+            return
+        started = time.perf_counter()
+        self.peak_buffer_rows = max(self.peak_buffer_rows, len(self._bank_buffer) + len(self._ledger_buffer))
+
+        matcher = ColumnarMatcher()
+        matcher.set_columns(self._columns(self._bank_buffer), self._columns(self._ledger_buffer))
+
+        self._writers["exact"].writerows(matcher.pair_on_offset(0))
+        for distance in range(1, self.date_window_days + 1):
+            for offset in (-distance, distance):
+                self._writers["fuzzy_date"].writerows(matcher.pair_on_offset(offset))
+        self._writers["mismatch"].writerows((bank_id, "") for bank_id in matcher.open_bank_ids())
+
+        self._bank_buffer = []
+        self._ledger_buffer = []
+        self._match_seconds += time.perf_counter() - started
+
+    @staticmethod
+    def _columns(rows):
+        """
+        (ids, cents, days) arrays in stream order, i.e. (day, id) order inside an amount.
+        """
+        ids = np.array([r[0] for r in rows], dtype=object)
+        cents = np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows))
+        days = np.fromiter((r[2] for r in rows), dtype=np.int64, count=len(rows))
+        return ids, cents, days
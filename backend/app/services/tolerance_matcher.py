@@ -0,0 +1,73 @@
+from bisect import bisect_left, bisect_right
+from decimal import Decimal
+from app.services.amounts import to_cents
+
+class ToleranceMatcher:
+    """
+    Pairs leftover rows whose amounts differ by a little (bank fees, FX rounding,
+    short-paid invoices) and whose dates are within the window.
+
+    A row's tolerance is the larger of `absolute` and `relative` times its amount.
+    Ledger rows sit in one list sorted by (cents, date), so the amounts in a bank row's
+    band are found with two bisects, and inside each amount the rows within the date
+    window with two more; only actual candidates are visited. All candidate pairs are
+    then taken smallest amount difference first (closest date breaks ties), one-to-one.
+    """
+    def __init__(self, date_window_days: int, absolute: Decimal, relative: float):
+        self.date_window_days = date_window_days
+        self.absolute_cents = to_cents(absolute)
+        self.relative = relative
+        # Pairs inside the tolerance and window, and bank rows with more than one,
+        # seen by the last match()
+        self.candidates = 0
+        self.ambiguous = 0
+
+    def tolerance_cents(self, cents):
+        return max(self.absolute_cents, int(cents * self.relative))
+
+    def match(self, bank_rows, ledger_rows, windows=None):
+        """
+        Returns (bank_tx, ledger_entry, closeness) triples; closeness goes from 1.0
+        (same amount) down to 0.0 (difference equal to the tolerance).
+        `windows` (bank id -> days) overrides the date window per bank row.
+        """
+        ledger = sorted(ledger_rows, key=lambda e: (to_cents(e.amount), e.date, e.id))
+        ledger_cents = [to_cents(e.amount) for e in ledger]
+        ledger_days = [e.date.toordinal() for e in ledger]
+        # Distinct amounts, and where each one's rows start in `ledger` (plus the end)
+        amounts, starts = [], []
+        for j, cents in enumerate(ledger_cents):
+            if not amounts or amounts[-1] != cents:
+                amounts.append(cents)
+                starts.append(j)
+        starts.append(len(ledger))
+
+        candidates = []
+        for position, bank_tx in enumerate(bank_rows):
+            cents = to_cents(bank_tx.amount)
+            day = bank_tx.date.toordinal()
+            window = windows[bank_tx.id] if windows else self.date_window_days
+            tolerance = self.tolerance_cents(cents)
+            found = len(candidates)
+            for k in range(bisect_left(amounts, cents - tolerance), bisect_right(amounts, cents + tolerance)):
+                lo = bisect_left(ledger_days, day - window, starts[k], starts[k + 1])
+                hi = bisect_right(ledger_days, day + window, starts[k], starts[k + 1])
+                delta = abs(amounts[k] - cents)
+                for j in range(lo, hi):
+                    candidates.append((delta, abs(ledger_days[j] - day), position, j, tolerance))
+            found = len(candidates) - found
+            self.candidates += found
+            self.ambiguous += found > 1
+
+        # Smallest difference first; bank and ledger order keep ties deterministic
+        candidates.sort()
+        used_banks, used_ledger = set(), set()
+        pairs = []
+        for delta, _, position, j, tolerance in candidates:
+            if position in used_banks or j in used_ledger:
+                continue
+            used_banks.add(position)
+            used_ledger.add(j)
+            closeness = 1.0 - delta / tolerance if tolerance else 1.0
+            pairs.append((bank_rows[position], ledger[j], closeness))
+        return pairs
@@ -13,11 +13,13 @@ sys.path.append(parent_dir)
 from app.core.database import SessionLocal, engine, Base
 from app.models import tables
 from app.core.security import get_password_hash
+from app.core.schema_upgrade import upgrade_schema
 
 def create_superuser():
     print("Checking database tables...")
     # Ensure tables exist
     Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
     
     db = SessionLocal()
     
@@ -0,0 +1,121 @@
+import asyncio
+import uuid
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base
+from app.models import tables
+from app.services.ingestion_matcher import IngestionMatcher
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+class RecordingManager:
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, message):
+        self.messages.append(message)
+
+    def flush(self):
+        pass
+
+
+def upload(db, model, *rows):
+    """
+    Saves rows the way the upload endpoints do and returns them as ingest dicts.
+    """
+    saved = []
+    for amount, day, description in rows:
+        row = {"id": str(uuid.uuid4()), "date": day, "amount": Decimal(amount), "description": description}
+        db.add(model(**row))
+        saved.append(row)
+    db.commit()
+    return saved
+
+
+def test_uploads_are_matched_against_the_warm_index(db):
+    matcher = IngestionMatcher(date_window_days=2)
+    manager = RecordingManager()
+    old_bank = upload(db, tables.Transaction, ("-80.00", date(2024, 5, 3), "ACH Utility Co"))[0]
+    db.add(tables.ReconciliationMatch(transaction_id=old_bank["id"], match_type="mismatch", confidence_score=0))
+    db.commit()
+
+    ledger = upload(
+        db, tables.InternalLedger,
+        ("80.00", date(2024, 5, 4), "Utility Co"),
+        ("15.00", date(2024, 5, 4), "Coffee"),
+    )
+    assert asyncio.run(matcher.ingest_ledger(db, ledger, manager)) == 1
+    match = db.query(tables.ReconciliationMatch).filter_by(transaction_id=old_bank["id"]).one()
+    assert (match.ledger_id, match.match_type) == (ledger[0]["id"], "fuzzy_date")
+
+    # The unmatched ledger row stayed in the index for the next bank upload
+    bank = upload(db, tables.Transaction, ("15.00", date(2024, 5, 4), "POS Coffee"))
+    assert asyncio.run(matcher.ingest_bank(db, bank, manager)) == 1
+    assert [m["match_type"] for m in manager.messages] == ["fuzzy_date", "exact"]
+    assert db.query(tables.ReconciliationMatch).count() == 2
+
+
+def test_stale_index_is_reloaded_instead_of_writing_a_conflicting_match(db):
+    matcher = IngestionMatcher(date_window_days=2)
+    taken, spare = upload(
+        db, tables.InternalLedger,
+        ("40.00", date(2024, 6, 3), "Rent"),
+        ("40.00", date(2024, 6, 4), "Rent"),
+    )
+    assert asyncio.run(matcher.ingest_ledger(db, [taken, spare])) == 0
+
+    # Another process (say the worker's run) matches a ledger row the index still holds
+    other_bank = upload(db, tables.Transaction, ("40.00", date(2024, 6, 3), "Rent"))[0]
+    db.add(tables.ReconciliationMatch(transaction_id=other_bank["id"], ledger_id=taken["id"], match_type="exact"))
+    db.commit()
+
+    bank = upload(db, tables.Transaction, ("40.00", date(2024, 6, 3), "Rent June"))
+    assert asyncio.run(matcher.ingest_bank(db, bank)) == 1
+    match = db.query(tables.ReconciliationMatch).filter_by(transaction_id=bank[0]["id"]).one()
+    assert (match.ledger_id, match.match_type) == (spare["id"], "fuzzy_date")
+
+
+def test_run_left_running_by_a_crashed_process_does_not_block_matching(db):
+    from datetime import datetime
+
+    crashed = datetime(2000, 1, 1)
+    db.add(tables.ReconciliationRun(status="running", watermark=crashed, heartbeat_at=crashed))
+    db.commit()
+    matcher = IngestionMatcher(date_window_days=2)
+    ledger = upload(db, tables.InternalLedger, ("12.00", date(2024, 7, 1), "Parking"))
+    asyncio.run(matcher.ingest_ledger(db, ledger))
+
+    bank = upload(db, tables.Transaction, ("12.00", date(2024, 7, 1), "Parking"))
+    assert asyncio.run(matcher.ingest_bank(db, bank)) == 1
+
+    db.add(tables.ReconciliationRun(status="running", watermark=datetime.utcnow(), heartbeat_at=datetime.utcnow()))
+    db.commit()
+    # A live run does hold it back
+    bank = upload(db, tables.Transaction, ("13.00", date(2024, 7, 1), "Parking"))
+    assert asyncio.run(matcher.ingest_bank(db, bank)) == 0
+    assert not matcher.warm
+
+
+def test_unrounded_upload_amount_finds_its_partner(db):
+    matcher = IngestionMatcher(date_window_days=2)
+    ledger = upload(db, tables.InternalLedger, ("20.00", date(2024, 8, 1), "Books"))
+    asyncio.run(matcher.ingest_ledger(db, ledger))
+
+    # As a parser hands it over; the database keeps 20.00
+    bank = upload(db, tables.Transaction, ("-19.999", date(2024, 8, 1), "Books"))
+    assert asyncio.run(matcher.ingest_bank(db, bank)) == 1
@@ -0,0 +1,111 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.database import Base
+from app.models import tables
+from app.services.job_queue import ScopeBusy, claim_job, enqueue_job, run_job
+from app.services.reconciliation_scope import ReconciliationScope
+
+
+@pytest.fixture
+def session_factory():
+    # One shared in-memory database for the API, worker and engine sessions
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+
+def test_one_job_per_scope_and_worker_runs_it(session_factory):
+    db = session_factory()
+    db.add(tables.Transaction(date=date(2024, 1, 2), amount=Decimal("10.00"), statement_id="s1"))
+    db.add(tables.InternalLedger(date=date(2024, 1, 2), amount=Decimal("10.00")))
+    db.commit()
+
+    job = enqueue_job(db, ReconciliationScope(statement_ids=["s1"]))
+    with pytest.raises(ScopeBusy):
+        enqueue_job(db, ReconciliationScope(statement_ids=["s1"]))
+    with pytest.raises(ScopeBusy):
+        enqueue_job(db)  # the full scope overlaps every other scope
+    with pytest.raises(ScopeBusy):
+        enqueue_job(db, ReconciliationScope(statement_ids=["s2"]))  # same ledger rows
+
+    claimed = claim_job(db, "worker-1")
+    assert claimed.id == job.id
+    assert claimed.status == "running"
+
+    assert run_job(job.id, session_factory) == "completed"
+    db.expire_all()
+    job = db.get(tables.ReconciliationJob, job.id)
+    assert job.results["exact_matches"] == 1
+    assert job.progress["matches_written"] == 1
+    assert db.get(tables.ReconciliationRun, job.run_id).status == "completed"
+
+
+def test_scopes_only_run_side_by_side_when_their_rows_cannot_meet(session_factory):
+    db = session_factory()
+    enqueue_job(db, ReconciliationScope(bank_name="Chase", date_to=date(2029, 12, 31)))
+    with pytest.raises(ScopeBusy):
+        # Another bank, but both would load (and match) the same ledger rows
+        enqueue_job(db, ReconciliationScope(bank_name="BofA"))
+    enqueue_job(db, ReconciliationScope(bank_name="BofA", date_from=date(2030, 1, 1)))
+
+    first = claim_job(db, "worker-1")
+    second = claim_job(db, "worker-2")
+    assert first.scope["bank_name"] == "Chase"
+    assert second.scope["bank_name"] == "BofA"
+    assert claim_job(db, "worker-3") is None
+
+
+def test_job_with_bad_options_fails_instead_of_killing_the_worker(session_factory):
+    db = session_factory()
+    job = enqueue_job(db, options={"mode": "sql", "assignment": "optimal"})
+    claim_job(db, "worker-1")
+
+    assert run_job(job.id, session_factory) == "failed"
+    db.expire_all()
+    job = db.get(tables.ReconciliationJob, job.id)
+    assert job.status == "failed"
+    assert job.error
+
+
+def test_heartbeat_survives_a_failed_commit(session_factory, monkeypatch):
+    import threading
+    from app.core import config
+    from app.services import job_queue
+
+    db = session_factory()
+    job = enqueue_job(db)
+    claim_job(db, "worker-1")
+    monkeypatch.setattr(config, "JOB_HEARTBEAT_SECONDS", 0.01)
+
+    failures = []
+
+    def flaky_factory():
+        session = session_factory()
+        if not failures:
+            def locked():
+                failures.append(1)
+                raise RuntimeError("database is locked")
+            session.commit = locked
+        return session
+
+    stop = threading.Event()
+    beat = threading.Thread(target=job_queue._beat, args=(job.id, flaky_factory, stop), daemon=True)
+    beat.start()
+    db.expire_all()
+    first_beat = db.get(tables.ReconciliationJob, job.id).heartbeat_at
+    for _ in range(100):
+        stop.wait(0.01)
+        db.expire_all()
+        if db.get(tables.ReconciliationJob, job.id).heartbeat_at != first_beat:
+            break
+    stop.set()
+    beat.join()
+
+    assert failures == [1]
+    assert db.get(tables.ReconciliationJob, job.id).heartbeat_at > first_beat
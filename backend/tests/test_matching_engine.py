@@ -0,0 +1,582 @@
+import asyncio
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base
+from app.models import tables
+from app.services.matching_engine import MatchingEngine
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def add_bank(db, amount, day, description="bank"):
+    tx = tables.Transaction(date=day, amount=Decimal(amount), description=description)
+    db.add(tx)
+    db.commit()
+    return tx
+
+
+def add_ledger(db, amount, day, description="ledger"):
+    entry = tables.InternalLedger(date=day, amount=Decimal(amount), description=description)
+    db.add(entry)
+    db.commit()
+    return entry
+
+
+def run_engine(db, **kwargs):
+    return asyncio.run(MatchingEngine(db, **kwargs).run())
+
+
+def match_for(db, tx):
+    return db.query(tables.ReconciliationMatch).filter_by(transaction_id=tx.id).one()
+
+
+def test_exact_match_accepts_flipped_sign(db):
+    bank = add_bank(db, "-100.00", date(2024, 1, 10))
+    ledger = add_ledger(db, "100.00", date(2024, 1, 10))
+
+    results = run_engine(db)
+
+    assert results["exact_matches"] == 1
+    match = match_for(db, bank)
+    assert match.ledger_id == ledger.id
+    assert match.match_type == "exact"
+
+
+def test_exact_match_uses_each_ledger_row_once(db):
+    first = add_bank(db, "50.00", date(2024, 1, 10))
+    second = add_bank(db, "50.00", date(2024, 1, 10))
+    ledger = add_ledger(db, "50.00", date(2024, 1, 10))
+
+    results = run_engine(db)
+
+    assert results["exact_matches"] == 1
+    types = {match_for(db, first).match_type, match_for(db, second).match_type}
+    assert types == {"exact", "mismatch"}
+    assert db.query(tables.ReconciliationMatch).filter_by(ledger_id=ledger.id).count() == 1
+
+
+def test_fuzzy_date_prefers_closest_ledger_date(db):
+    bank = add_bank(db, "75.00", date(2024, 3, 10))
+    add_ledger(db, "75.00", date(2024, 3, 8))
+    closest = add_ledger(db, "-75.00", date(2024, 3, 11))
+
+    results = run_engine(db)
+
+    assert results["fuzzy_matches"] == 1
+    assert match_for(db, bank).ledger_id == closest.id
+
+
+def test_fuzzy_date_window_is_configurable(db):
+    bank = add_bank(db, "20.00", date(2024, 3, 10))
+    add_ledger(db, "20.00", date(2024, 3, 14))
+
+    assert run_engine(db)["fuzzy_matches"] == 0
+    db.query(tables.ReconciliationMatch).delete()
+    db.commit()
+
+    assert run_engine(db, date_window_days=4)["fuzzy_matches"] == 1
+    assert match_for(db, bank).match_type == "fuzzy_date"
+
+
+def test_matches_are_written_in_batches(db):
+    for day in range(1, 6):
+        add_bank(db, "10.00", date(2024, 5, day))
+        add_ledger(db, "10.00", date(2024, 5, day))
+    add_bank(db, "99.00", date(2024, 5, 1))
+
+    results = run_engine(db, batch_size=2)
+
+    assert results["exact_matches"] == 5
+    assert db.query(tables.ReconciliationMatch).count() == 6
+    assert db.query(tables.ReconciliationMatch).filter_by(match_type="mismatch").count() == 1
+
+
+def test_failed_batch_rolls_back_the_pass(db, monkeypatch):
+    add_bank(db, "10.00", date(2024, 5, 1))
+    add_ledger(db, "10.00", date(2024, 5, 1))
+
+    def broken_commit():
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(db, "commit", broken_commit)
+    with pytest.raises(RuntimeError):
+        run_engine(db)
+    monkeypatch.undo()
+
+    assert db.query(tables.ReconciliationMatch).count() == 0
+
+
+def seed_random_month(db, seed=7, rows=200):
+    import random
+    rng = random.Random(seed)
+    for i in range(rows):
+        amount = Decimal(rng.choice(["10.00", "25.50", "99.99", "120.00", "7.25"]))
+        day = date(2024, 6, rng.randint(1, 28))
+        db.add(tables.Transaction(id=f"b{i:04d}", date=day, amount=amount * rng.choice([1, -1])))
+        ledger_day = date(2024, 6, min(28, max(1, day.day + rng.randint(-3, 3))))
+        db.add(tables.InternalLedger(id=f"l{i:04d}", date=ledger_day, amount=amount))
+    db.commit()
+
+
+def pairs(db):
+    return {
+        (m.transaction_id, m.ledger_id, m.match_type)
+        for m in db.query(tables.ReconciliationMatch).all()
+    }
+
+
+@pytest.mark.parametrize("mode", ["sql", "numpy", "parallel", "stream"])
+def test_mode_matches_python_mode(mode):
+    engines = []
+    for _ in range(2):
+        engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(engine)
+        engines.append(sessionmaker(bind=engine)())
+    python_db, other_db = engines
+    seed_random_month(python_db)
+    seed_random_month(other_db)
+
+    python_results = run_engine(python_db, mode="python")
+    other_results = run_engine(other_db, mode=mode)
+
+    assert python_results == other_results
+    assert python_results["fuzzy_matches"] > 0
+    assert pairs(python_db) == pairs(other_db)
+
+
+def test_optimal_assignment_recovers_partner_taken_by_greedy(db):
+    # The late bank row's closest candidate is the early bank row's only candidate
+    early = add_bank(db, "40.00", date(2024, 7, 10))
+    late = add_bank(db, "40.00", date(2024, 7, 12))
+    add_ledger(db, "40.00", date(2024, 7, 11))
+    add_ledger(db, "40.00", date(2024, 7, 14))
+
+    assert run_engine(db)["fuzzy_matches"] == 1
+    db.query(tables.ReconciliationMatch).delete()
+    db.commit()
+
+    assert run_engine(db, assignment="optimal")["fuzzy_matches"] == 2
+    assert match_for(db, early).match_type == "fuzzy_date"
+    assert match_for(db, late).match_type == "fuzzy_date"
+
+
+def test_tolerance_pass_prefers_smallest_amount_difference(db):
+    bank = add_bank(db, "-200.00", date(2024, 8, 12))
+    add_ledger(db, "200.40", date(2024, 8, 12))
+    closest = add_ledger(db, "199.85", date(2024, 8, 13))
+    add_ledger(db, "202.50", date(2024, 8, 12))  # outside max(0.50, 1% of 200.00)
+
+    results = run_engine(db, tolerance_matching=True)
+
+    assert results["tolerance_matches"] == 1
+    match = match_for(db, bank)
+    assert match.ledger_id == closest.id
+    assert match.match_type == "amount_tolerance"
+    assert 0.5 < float(match.confidence_score) < 0.8
+
+
+def test_tolerance_candidates_are_exactly_the_rows_in_band_and_window():
+    import random
+    from types import SimpleNamespace
+    from app.services.tolerance_matcher import ToleranceMatcher
+
+    rng = random.Random(3)
+
+    def row(i):
+        day = date.fromordinal(date(2024, 1, 1).toordinal() + rng.randint(0, 60))
+        return SimpleNamespace(id=i, amount=Decimal(rng.randint(9000, 11000)) / 100, date=day)
+
+    bank_rows = [row(f"b{i}") for i in range(200)]
+    ledger_rows = [row(f"l{i}") for i in range(400)]
+    matcher = ToleranceMatcher(3, Decimal("0.50"), 0.01)
+    matcher.match(bank_rows, ledger_rows)
+
+    expected = sum(
+        1 for b in bank_rows for e in ledger_rows
+        if abs(int(e.amount * 100) - int(b.amount * 100)) <= matcher.tolerance_cents(int(b.amount * 100))
+        and abs((e.date - b.date).days) <= 3
+    )
+    assert matcher.candidates == expected
+
+
+def test_adaptive_windows_follow_each_counterparty_history(db):
+    # History: Acme wires clear 4 days late, AWS card charges post the same day
+    for i in range(5):
+        day = date(2024, 2, 1 + 3 * i)
+        wire = add_bank(db, f"{100 + i}.00", day, "WIRE DEPOSIT FROM Acme Corp")
+        invoice = add_ledger(db, f"{100 + i}.00", date(2024, 2, 5 + 3 * i), "Inv - Acme Corp")
+        card = add_bank(db, f"{20 + i}.00", day, "POS DEBIT AWS")
+        charge = add_ledger(db, f"{20 + i}.00", day, "AWS")
+        for bank_tx, entry in ((wire, invoice), (card, charge)):
+            db.add(tables.ReconciliationMatch(
+                transaction_id=bank_tx.id, ledger_id=entry.id, match_type="fuzzy_date", confidence_score=0.85
+            ))
+    db.commit()
+
+    slow_wire = add_bank(db, "900.00", date(2024, 4, 1), "WIRE DEPOSIT FROM Acme Corp")
+    add_ledger(db, "900.00", date(2024, 4, 6), "Inv - Acme Corp")
+    late_charge = add_bank(db, "35.00", date(2024, 4, 1), "POS DEBIT AWS")
+    add_ledger(db, "35.00", date(2024, 4, 3), "AWS")
+
+    results = run_engine(db, adaptive_windows=True)
+
+    assert results["lag_profiles"] == 2
+    assert match_for(db, slow_wire).match_type == "fuzzy_date"  # 5 days: learned 4 + 1
+    assert match_for(db, late_charge).match_type == "mismatch"  # 2 days: learned 0 + 1
+
+
+def test_tolerance_pass_keeps_to_the_learned_window(db):
+    # AWS charges post the same day, so their learned window is 1 day
+    for i in range(5):
+        card = add_bank(db, f"{20 + i}.00", date(2024, 2, 1 + i), "POS DEBIT AWS")
+        charge = add_ledger(db, f"{20 + i}.00", date(2024, 2, 1 + i), "AWS")
+        db.add(tables.ReconciliationMatch(
+            transaction_id=card.id, ledger_id=charge.id, match_type="exact", confidence_score=1.0
+        ))
+    db.commit()
+
+    # Same amount, 2 days apart: outside the learned window, inside the default 3 days
+    late_charge = add_bank(db, "35.00", date(2024, 4, 1), "POS DEBIT AWS")
+    add_ledger(db, "35.00", date(2024, 4, 3), "AWS")
+
+    results = run_engine(db, adaptive_windows=True, tolerance_matching=True)
+
+    assert results["tolerance_matches"] == 0
+    assert match_for(db, late_charge).match_type == "mismatch"
+
+
+def test_lag_histories_only_learn_matches_committed_before_the_run(db):
+    for i in range(6):
+        add_bank(db, f"{20 + i}.00", date(2024, 5, 1 + i), "POS DEBIT AWS")
+        add_ledger(db, f"{20 + i}.00", date(2024, 5, 1 + i), "AWS")
+
+    # No history yet: the exact matches this run makes must not shape its own windows
+    assert run_engine(db, adaptive_windows=True, dry_run=True)["lag_profiles"] == 0
+    assert run_engine(db, adaptive_windows=True)["lag_profiles"] == 0
+
+    # The next runs learn those six pairs once, without re-reading them
+    from app.services.lag_profiles import load_lag_profiles
+    run_engine(db, adaptive_windows=True)
+    run_engine(db, adaptive_windows=True)
+    histogram = db.query(tables.CounterpartyLag).filter_by(bank_key="AWS").one()
+    assert (histogram.lag_days, histogram.hits) == (0, 6)
+    assert load_lag_profiles(db, 3, 5, 0.95, 7).windows == {"AWS": 1}
+
+
+def test_pattern_pass_uses_learned_counterparty_and_keeps_learning(db):
+    for i in range(2):
+        bank_tx = add_bank(db, f"{10 + i}.00", date(2024, 1, 5 + i), f"POS DEBIT AWS #{i}")
+        entry = add_ledger(db, f"{10 + i}.00", date(2024, 1, 5 + i), "Payment to AWS")
+        entry.gl_code = "5000-EXP"
+        db.add(tables.ReconciliationMatch(
+            transaction_id=bank_tx.id, ledger_id=entry.id, match_type="exact", confidence_score=1.0
+        ))
+    db.commit()
+
+    bank = add_bank(db, "-49.99", date(2024, 3, 10), "POS DEBIT AWS #8832")
+    add_ledger(db, "49.99", date(2024, 3, 10), "Payment to Uber")
+    aws = add_ledger(db, "49.99", date(2024, 3, 11), "Payment to AWS")
+    aws.gl_code = "5000-EXP"
+    db.commit()
+
+    results = run_engine(db, pattern_matching=True)
+
+    assert results["pattern_matches"] == 1
+    match = match_for(db, bank)
+    assert match.ledger_id == aws.id
+    assert match.match_type == "pattern"
+    pattern = db.query(tables.MatchPattern).filter_by(bank_key="AWS").one()
+    assert (pattern.ledger_key, pattern.gl_code, pattern.hits) == ("AWS", "5000-EXP", 3)
+
+
+def test_pattern_learning_counts_late_commits_once_and_forgets_rolled_back_runs(db):
+    from app.services.pattern_memory import learn_patterns
+    from app.services.run_rollback import rollback_run
+
+    def aws_pair(amount, day):
+        bank_tx = add_bank(db, amount, day, "POS DEBIT AWS")
+        entry = add_ledger(db, amount, day, "Payment to AWS")
+        return bank_tx, entry
+
+    bank_tx, entry = aws_pair("10.00", date(2024, 1, 5))
+    db.add(tables.ReconciliationMatch(
+        transaction_id=bank_tx.id, ledger_id=entry.id, match_type="exact", matched_at=datetime(2024, 1, 6)
+    ))
+    db.commit()
+    assert learn_patterns(db) == 1
+
+    # Committed after that learning, but stamped earlier (a run that took a while)
+    bank_tx, entry = aws_pair("11.00", date(2024, 1, 5))
+    db.add(tables.ReconciliationMatch(
+        transaction_id=bank_tx.id, ledger_id=entry.id, match_type="exact", matched_at=datetime(2024, 1, 5)
+    ))
+    db.commit()
+    assert learn_patterns(db) == 1
+    assert learn_patterns(db) == 0
+
+    aws_pair("12.00", date(2024, 2, 5))
+    run_engine(db, pattern_matching=True)
+    run = db.query(tables.ReconciliationRun).one()
+    pattern = db.query(tables.MatchPattern).filter_by(bank_key="AWS").one()
+    assert pattern.hits == 3
+
+    rollback_run(db, run)
+    db.refresh(pattern)
+    assert pattern.hits == 2
+    run_engine(db, pattern_matching=True, rerun_of=run.id)
+    db.refresh(pattern)
+    assert pattern.hits == 3
+
+
+def test_split_pass_matches_one_wire_to_several_invoices(db):
+    wire = add_bank(db, "1500.00", date(2024, 8, 5), "WIRE DEPOSIT FROM Acme Corp")
+    invoices = [
+        add_ledger(db, "1000.00", date(2024, 8, 1), "Inv #1001 - Acme Corp"),
+        add_ledger(db, "500.00", date(2024, 8, 2), "Inv #1002 - Acme Corp"),
+    ]
+    add_ledger(db, "500.00", date(2024, 8, 2), "Inv #2001 - Globex")
+
+    results = run_engine(db, split_matching=True)
+
+    assert results["split_matches"] == 1
+    group = db.query(tables.ReconciliationMatch).filter_by(match_type="split").all()
+    assert {m.ledger_id for m in group} == {i.id for i in invoices}
+    assert [m.transaction_id for m in group if m.transaction_id] == [wire.id]
+    assert len({m.group_id for m in group}) == 1
+
+
+def test_description_pass_pairs_similar_text_outside_fuzzy_window(db):
+    bank = add_bank(db, "-230.00", date(2024, 9, 10), "POS DEBIT Office Depot #8832")
+    depot = add_ledger(db, "230.00", date(2024, 9, 4), "Payment to Office Depot")
+    add_ledger(db, "230.00", date(2024, 9, 5), "Payment to Uber")
+
+    results = run_engine(db, description_matching=True)
+
+    assert results["description_matches"] == 1
+    match = match_for(db, bank)
+    assert match.ledger_id == depot.id
+    assert match.match_type == "description"
+    assert 0 < float(match.confidence_score) <= 0.8
+
+
+def test_incremental_run_only_loads_the_new_rows_date_span(db):
+    for month in range(1, 7):
+        add_bank(db, "10.00", date(2024, month, 1))
+        add_ledger(db, "10.00", date(2024, month, 1))
+    orphan = add_bank(db, "55.00", date(2024, 6, 20))
+    run_engine(db)
+    assert match_for(db, orphan).match_type == "mismatch"
+
+    # A late ledger upload for the orphan; nothing else in June is open
+    add_ledger(db, "55.00", date(2024, 6, 21))
+    results = run_engine(db, incremental=True)
+
+    assert results["bank_items_scanned"] == 1
+    assert results["fuzzy_matches"] == 1
+    assert match_for(db, orphan).match_type == "fuzzy_date"
+    last_run = db.query(tables.ReconciliationRun).order_by(tables.ReconciliationRun.watermark.desc()).first()
+    assert last_run.status == "completed" and last_run.incremental
+
+
+def test_incremental_run_without_new_rows_does_nothing(db):
+    add_bank(db, "10.00", date(2024, 1, 1))
+    run_engine(db)
+
+    assert run_engine(db, incremental=True)["bank_items_scanned"] == 0
+    assert db.query(tables.ReconciliationMatch).filter_by(match_type="mismatch").count() == 1
+
+
+def test_scoped_run_only_touches_its_slice(db):
+    from app.services.reconciliation_scope import ReconciliationScope
+
+    statement = tables.BankStatement(filename="ops.csv", bank_name="Chase", format_type="csv")
+    db.add(statement)
+    db.commit()
+    ours = tables.Transaction(date=date(2024, 2, 1), amount=Decimal("80.00"), statement_id=statement.id)
+    db.add(ours)
+    db.commit()
+    theirs = add_bank(db, "80.00", date(2024, 2, 1))
+    ours_ledger = tables.InternalLedger(date=date(2024, 2, 1), amount=Decimal("80.00"), gl_code="5000-EXP")
+    db.add(ours_ledger)
+    db.commit()
+    add_ledger(db, "80.00", date(2024, 2, 1))
+
+    scope = ReconciliationScope(bank_name="Chase", gl_code_prefixes=["5000"])
+    results = run_engine(db, scope=scope)
+
+    assert results["bank_items_scanned"] == 1
+    assert match_for(db, ours).ledger_id == ours_ledger.id
+    assert db.query(tables.ReconciliationMatch).filter_by(transaction_id=theirs.id).count() == 0
+
+
+def test_stream_mode_with_small_chunks_matches_python_mode():
+    import random
+    rng = random.Random(11)
+    sessions = []
+    for _ in range(2):
+        engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(engine)
+        sessions.append(sessionmaker(bind=engine)())
+    # Few amounts spread over a year: amount groups are larger than a chunk and go day by day
+    for db in sessions:
+        for i in range(300):
+            amount = Decimal(rng.choice(["10.00", "25.50", "99.99"]))
+            day = date.fromordinal(date(2024, 1, 1).toordinal() + rng.randint(0, 365))
+            db.add(tables.Transaction(id=f"b{i:04d}", date=day, amount=amount))
+            ledger_day = date.fromordinal(day.toordinal() + rng.randint(-3, 3))
+            db.add(tables.InternalLedger(id=f"l{i:04d}", date=ledger_day, amount=amount))
+        db.commit()
+        rng.seed(11)
+    python_db, stream_db = sessions
+
+    python_results = run_engine(python_db, mode="python")
+    stream_results = run_engine(stream_db, mode="stream", stream_chunk_rows=16)
+
+    assert python_results == stream_results
+    assert pairs(python_db) == pairs(stream_db)
+
+
+def test_stream_mode_matches_python_mode_on_one_dense_amount():
+    import random
+    rng = random.Random(5)
+    sessions = []
+    for _ in range(2):
+        engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(engine)
+        sessions.append(sessionmaker(bind=engine)())
+    # One subscription amount every day, several per day: no gap to cut the group on
+    for db in sessions:
+        for i in range(400):
+            day = date.fromordinal(date(2024, 1, 1).toordinal() + i // 4)
+            db.add(tables.Transaction(id=f"b{i:04d}", date=day, amount=Decimal("9.99")))
+            ledger_day = date.fromordinal(day.toordinal() + rng.randint(-4, 4))
+            db.add(tables.InternalLedger(id=f"l{i:04d}", date=ledger_day, amount=Decimal("9.99")))
+        db.commit()
+        rng.seed(5)
+    python_db, stream_db = sessions
+
+    python_results = run_engine(python_db, mode="python")
+    stream_results = run_engine(stream_db, mode="stream", stream_chunk_rows=16)
+
+    assert python_results == stream_results
+    assert pairs(python_db) == pairs(stream_db)
+
+
+def test_interrupted_run_resumes_after_its_last_checkpoint(db):
+    add_bank(db, "10.00", date(2024, 10, 1))
+    add_ledger(db, "10.00", date(2024, 10, 1))
+    late = add_bank(db, "20.00", date(2024, 10, 1))
+    add_ledger(db, "20.00", date(2024, 10, 2))
+
+    def crash_after_first_pass(progress):
+        if progress["passes_committed"] == 1:
+            raise SystemExit("container stopped")
+
+    with pytest.raises(SystemExit):
+        run_engine(db, mode="sql", on_progress=crash_after_first_pass)
+    interrupted = db.query(tables.ReconciliationRun).one()
+    assert interrupted.status == "running"
+    assert interrupted.checkpoint["completed_passes"] == ["exact"]
+    interrupted.heartbeat_at = datetime(2000, 1, 1)
+    db.commit()
+
+    results = run_engine(db, mode="sql")
+
+    assert (results["exact_matches"], results["fuzzy_matches"]) == (0, 1)
+    assert match_for(db, late).match_type == "fuzzy_date"
+    assert db.query(tables.ReconciliationMatch).filter_by(match_type="exact").count() == 1
+    resumed = db.query(tables.ReconciliationRun).filter_by(status="completed").one()
+    assert resumed.resumed_from == interrupted.id
+    assert db.get(tables.ReconciliationRun, interrupted.id).status == "interrupted"
+
+
+def test_resume_reruns_every_pass_when_rows_were_uploaded_after_the_crash(db):
+    add_bank(db, "10.00", date(2024, 10, 1))
+    add_ledger(db, "10.00", date(2024, 10, 1))
+
+    def crash_after_first_pass(progress):
+        if progress["passes_committed"] == 1:
+            raise SystemExit("container stopped")
+
+    with pytest.raises(SystemExit):
+        run_engine(db, mode="sql", on_progress=crash_after_first_pass)
+    interrupted = db.query(tables.ReconciliationRun).one()
+    interrupted.heartbeat_at = datetime(2000, 1, 1)
+    db.commit()
+
+    # A same-day pair arrives while the run is down; only the exact pass can take it
+    new = add_bank(db, "55.00", date(2024, 10, 3))
+    add_ledger(db, "55.00", date(2024, 10, 3))
+
+    results = run_engine(db, mode="sql")
+
+    assert results["exact_matches"] == 1
+    assert match_for(db, new).match_type == "exact"
+    resumed = db.query(tables.ReconciliationRun).filter_by(status="completed").one()
+    assert resumed.resumed_from == interrupted.id
+
+
+def test_rolled_back_run_can_be_rerun_on_its_rows_only(db):
+    from app.services.run_rollback import rollback_run
+
+    kept = add_bank(db, "10.00", date(2024, 1, 5))
+    add_ledger(db, "10.00", date(2024, 1, 5))
+    run_engine(db)
+    first_run = db.query(tables.ReconciliationRun).one()
+
+    late = add_bank(db, "30.00", date(2024, 11, 10))
+    add_ledger(db, "30.00", date(2024, 11, 14))
+    run_engine(db)  # the 4-day gap is outside the default window
+    bad_run = db.query(tables.ReconciliationRun).filter(tables.ReconciliationRun.id != first_run.id).one()
+    assert match_for(db, late).match_type == "mismatch"
+
+    rollback_run(db, bad_run)
+    assert bad_run.rollback["matches_deleted"] == 1
+    assert db.query(tables.ReconciliationMatch).filter_by(transaction_id=late.id).count() == 0
+    assert match_for(db, kept).run_id == first_run.id
+
+    results = run_engine(db, rerun_of=bad_run.id, date_window_days=5)
+
+    assert results["bank_items_scanned"] == 1  # January is outside the released span
+    assert match_for(db, late).match_type == "fuzzy_date"
+
+
+@pytest.mark.parametrize("mode", ["python", "sql", "stream"])
+def test_dry_run_reports_passes_and_writes_nothing(db, mode):
+    add_bank(db, "10.00", date(2024, 1, 5))
+    add_ledger(db, "10.00", date(2024, 1, 5))
+    add_ledger(db, "10.00", date(2024, 1, 5))
+    add_bank(db, "20.00", date(2024, 1, 5))
+    add_ledger(db, "20.00", date(2024, 1, 6))
+    add_bank(db, "99.00", date(2024, 1, 5))
+
+    report = run_engine(db, mode=mode, dry_run=True)
+
+    assert report["dry_run"] is True
+    assert (report["exact_matches"], report["fuzzy_matches"]) == (1, 1)
+    passes = report["stats"]["passes"]
+    assert [passes[name]["matches"] for name in ("exact", "fuzzy_date", "mismatch")] == [1, 1, 1]
+    assert set(report["stats"]["seconds"]) == {"fetch", "match", "persist", "total"}
+    assert report["stats"]["peak_objects"] > 0
+    if mode == "python":
+        assert passes["exact"]["ambiguous"] == 1  # two ledger rows share 10.00 on the 5th
+        assert passes["fuzzy_date"]["candidates"] == 1
+    assert db.query(tables.ReconciliationMatch).count() == 0
+    assert db.query(tables.ReconciliationRun).count() == 0
+
+    run_engine(db, mode=mode)
+    assert db.query(tables.ReconciliationRun).one().stats["passes"]["exact"]["matches"] == 1
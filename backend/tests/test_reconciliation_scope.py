@@ -0,0 +1,32 @@
+from datetime import date
+
+from app.services.reconciliation_scope import ReconciliationScope
+
+
+def test_scopes_overlap_unless_both_sides_are_disjoint():
+    chase = ReconciliationScope(bank_name="Chase")
+    hsbc = ReconciliationScope(bank_name="HSBC")
+    # Different banks, but both load the whole open ledger
+    assert chase.overlaps(hsbc)
+
+    assert not ReconciliationScope(bank_name="Chase", gl_code_prefixes=["4"]).overlaps(
+        ReconciliationScope(bank_name="HSBC", gl_code_prefixes=["5"])
+    )
+    assert ReconciliationScope(bank_name="Chase", gl_code_prefixes=["4"]).overlaps(
+        ReconciliationScope(bank_name="HSBC", gl_code_prefixes=["41"])
+    )
+    # statement_ids against a bank name can't be decided without the database
+    assert ReconciliationScope(statement_ids=["s1"], gl_code_prefixes=["4"]).overlaps(
+        ReconciliationScope(bank_name="HSBC", gl_code_prefixes=["5"])
+    )
+
+
+def test_date_ranges_decide_overlap_on_both_sides():
+    january = ReconciliationScope(date_from=date(2024, 1, 1), date_to=date(2024, 1, 31))
+    mid = ReconciliationScope(date_from=date(2024, 1, 15), date_to=date(2024, 2, 15))
+    march = ReconciliationScope(date_from=date(2024, 3, 1))
+
+    assert january.overlaps(mid)
+    assert not january.overlaps(march)
+    assert mid.overlaps(ReconciliationScope())
+    assert not ReconciliationScope(empty=True).overlaps(ReconciliationScope())
@@ -0,0 +1,39 @@
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+
+from app.core.database import Base
+from app.core.schema_upgrade import upgrade_schema
+from app.models import tables
+
+
+def test_upgrade_adds_new_columns_to_an_old_database_once():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    # The tables as they were before created_at / group_id / run_id / patterns_learned
+    with engine.begin() as connection:
+        for name in ("reconciliation_matches", "transactions", "internal_ledger"):
+            connection.execute(text(f"DROP TABLE {name}"))
+        connection.execute(text("CREATE TABLE transactions (id VARCHAR PRIMARY KEY, date DATE, amount NUMERIC, "
+                                "description VARCHAR, external_ref_id VARCHAR, raw_source VARCHAR, statement_id VARCHAR)"))
+        connection.execute(text("CREATE TABLE internal_ledger (id VARCHAR PRIMARY KEY, date DATE, amount NUMERIC, "
+                                "description VARCHAR, gl_code VARCHAR)"))
+        connection.execute(text("CREATE TABLE reconciliation_matches (id VARCHAR PRIMARY KEY, transaction_id VARCHAR UNIQUE, "
+                                "ledger_id VARCHAR UNIQUE, match_type VARCHAR, confidence_score NUMERIC(3, 2), matched_at DATETIME)"))
+        connection.execute(text("INSERT INTO reconciliation_matches (id, transaction_id, match_type) VALUES ('m1', 't1', 'mismatch')"))
+
+    assert sorted(upgrade_schema(engine)) == [
+        "internal_ledger.created_at", "reconciliation_matches.group_id", "reconciliation_matches.lags_learned",
+        "reconciliation_matches.patterns_learned",
+        "reconciliation_matches.run_id", "transactions.created_at"
+    ]
+    assert upgrade_schema(engine) == []
+
+    inspector = inspect(engine)
+    assert "ix_reconciliation_matches_run_id" in {i["name"] for i in inspector.get_indexes("reconciliation_matches")}
+    with engine.connect() as connection:
+        learned = connection.execute(text("SELECT patterns_learned FROM reconciliation_matches")).scalar()
+    assert learned in (0, False)
+    # What used to fail on the first query after deploying
+    with Session(engine) as db:
+        assert db.query(tables.ReconciliationMatch).one().patterns_learned is False
+        assert db.query(tables.Transaction).all() == []
@@ -0,0 +1,266 @@
+import asyncio
+import json
+
+import msgpack
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.database import Base
+from app.core.feed_backends import PollingFeedBackend
+from app.core.websocket import ConnectionManager
+
+
+class FakeSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data):
+        self.frames.append(json.loads(data))
+
+    async def send_bytes(self, data):
+        self.frames.append(msgpack.unpackb(data))
+
+
+def event(n, match_type="exact"):
+    return {"id": str(n), "match_type": match_type}
+
+
+def batches(socket):
+    return [f for f in socket.frames if f["type"] == "batch"]
+
+
+def test_published_events_are_sent_in_batches_per_tick():
+    async def scenario():
+        manager = ConnectionManager(flush_interval_ms=20, max_events=3)
+        socket = FakeSocket()
+        await manager.connect(socket)
+
+        # publish() is synchronous: nothing reaches the socket until the flusher runs
+        for n in range(7):
+            manager.publish(event(n, "mismatch" if n == 6 else "exact"))
+        assert batches(socket) == []
+
+        await asyncio.sleep(0.1)
+        await manager.stop()
+        return batches(socket)
+
+    frames = asyncio.run(scenario())
+
+    assert [len(f["events"]) for f in frames] == [3, 3, 1]
+    assert [e["id"] for f in frames for e in f["events"]] == [str(n) for n in range(7)]
+    assert frames[-1]["progress"] == {"events": 7, "by_type": {"exact": 6, "mismatch": 1}}
+
+
+def test_events_published_before_any_client_are_kept_for_replay():
+    async def scenario():
+        manager = ConnectionManager(flush_interval_ms=5)
+        await manager.start()  # at app startup, no client yet
+        for n in range(3):
+            manager.publish({**event(n), "run_id": "r1"})
+        await asyncio.sleep(0.05)
+
+        socket = FakeSocket()
+        await manager.connect(socket)
+        await asyncio.sleep(0.01)
+        await manager.stop()
+        return socket.frames
+
+    frames = asyncio.run(scenario())
+
+    assert frames[0]["runs"][0]["events"] == 3
+    assert [e["seq"] for e in frames[1]["events"]] == [1, 2, 3]
+
+
+class SlowSocket(FakeSocket):
+    """
+    Blocks on every send after the hello until released, like a client on a stalled network.
+    """
+    def __init__(self):
+        super().__init__()
+        self.release = asyncio.Event()
+        self.closed_with = None
+
+    async def send_text(self, data):
+        if json.loads(data)["type"] != "hello":
+            await self.release.wait()
+        await super().send_text(data)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+def run_with_slow_client(policy):
+    async def scenario():
+        manager = ConnectionManager(flush_interval_ms=1000, queue_size=2, slow_client_policy=policy)
+        fast, slow = FakeSocket(), SlowSocket()
+        await manager.connect(fast)
+        await manager.connect(slow)
+
+        for n in range(5):
+            manager.broadcast({"type": "batch", "n": n})
+            await asyncio.sleep(0)
+        metrics = {m["id"]: m for m in manager.metrics()}
+        slow.release.set()
+        await asyncio.sleep(0.01)
+        await manager.stop()
+        return manager, fast, slow, metrics
+
+    return asyncio.run(scenario())
+
+
+def test_slow_client_drops_its_oldest_frames_without_delaying_others():
+    manager, fast, slow, metrics = run_with_slow_client("drop_oldest")
+
+    assert [f["n"] for f in batches(fast)] == [0, 1, 2, 3, 4]
+    # Frame 0 was already being sent; 1 and 2 were dropped for 3 and 4
+    assert [f["n"] for f in batches(slow)] == [0, 3, 4]
+    slow_metrics = max(metrics.values(), key=lambda m: m["dropped"])
+    assert (slow_metrics["queue_depth"], slow_metrics["dropped"]) == (2, 2)
+
+
+def test_slow_client_gets_a_snapshot_instead_of_its_backlog():
+    manager, fast, slow, _ = run_with_slow_client("snapshot")
+
+    assert [f["type"] for f in slow.frames] == ["hello", "batch", "snapshot", "batch"]
+    assert slow.frames[-1]["n"] == 4
+
+
+def test_slow_client_is_disconnected():
+    manager, fast, slow, _ = run_with_slow_client("disconnect")
+
+    assert slow.closed_with == 1013
+    assert [m["sent"] for m in manager.metrics()] == [6]  # hello + 5 batches
+
+
+def test_polling_backend_relays_another_process_events_in_order():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    async def scenario():
+        # The API process, with a client, and a worker publishing without a flusher
+        api = ConnectionManager(flush_interval_ms=10, backend=PollingFeedBackend(Session, 0.01, 300))
+        socket = FakeSocket()
+        await api.connect(socket)
+        worker = ConnectionManager(flush_interval_ms=60000, max_events=2, backend=PollingFeedBackend(Session, 0.01, 300))
+
+        for n in range(5):
+            worker.publish({**event(n), "run_id": "r1" if n % 2 else "r2"})
+        worker.flush()
+        await asyncio.sleep(0.1)
+        await api.stop()
+        return batches(socket)
+
+    frames = asyncio.run(scenario())
+
+    events = [e for f in frames for e in f["events"]]
+    assert [e["id"] for e in events] == ["0", "1", "2", "3", "4"]
+    assert [e["seq"] for e in events if e["run_id"] == "r2"] == [1, 2, 3]
+    assert frames[-1]["progress"]["events"] == 5
+
+
+def test_late_client_gets_summary_and_tail_and_can_resume():
+    async def scenario():
+        manager = ConnectionManager(flush_interval_ms=5, replay_events=3)
+        first = FakeSocket()
+        await manager.connect(first)
+        for n in range(5):
+            manager.publish({**event(n, "mismatch" if n == 4 else "exact"), "run_id": "r1"})
+        await asyncio.sleep(0.05)
+
+        late, resumed, too_late, unknown = FakeSocket(), FakeSocket(), FakeSocket(), FakeSocket()
+        await manager.connect(late)
+        await manager.connect(resumed, run_id="r1", after_seq=3)
+        await manager.connect(too_late, run_id="r1", after_seq=1)
+        await manager.connect(unknown, run_id="r0", after_seq=7)
+        await asyncio.sleep(0.05)
+        await manager.stop()
+        return late.frames, resumed.frames, too_late.frames, unknown.frames
+
+    late, resumed, too_late, unknown = asyncio.run(scenario())
+
+    hello = late[0]
+    assert hello["type"] == "hello"
+    assert hello["runs"] == [{"run_id": "r1", "events": 5, "by_type": {"exact": 4, "mismatch": 1}, "last_seq": 5}]
+    # Only the last 3 events are kept
+    assert [e["seq"] for e in late[1]["events"]] == [3, 4, 5]
+    assert [e["seq"] for e in resumed[1]["events"]] == [4, 5]
+    # seq 2 is gone: the client is told to reload, and gets what is left
+    assert too_late[0]["gaps"] == ["r1"]
+    assert [e["seq"] for e in too_late[1]["events"]] == [3, 4, 5]
+    # A run this process doesn't have (evicted, or from before a restart) is a gap too
+    assert unknown[0]["gaps"] == ["r0"]
+
+
+def test_columnar_and_msgpack_clients_get_arrays_per_field():
+    match = {
+        "id": "m1", "match_type": "exact", "run_id": "r1", "amount": 120.5, "date": "2024-01-05",
+        "bank_desc": "ACH Utility", "ledger_desc": "Utility Co", "confidence": 1.0
+    }
+
+    async def scenario():
+        manager = ConnectionManager(flush_interval_ms=5)
+        sockets = {encoding: FakeSocket() for encoding in ("json", "columnar", "msgpack")}
+        for encoding, socket in sockets.items():
+            await manager.connect(socket, encoding=encoding)
+        manager.publish(dict(match))
+        manager.publish({**match, "id": "m2", "match_type": "mismatch", "amount": -3.0})
+        await asyncio.sleep(0.05)
+        await manager.stop()
+        return {encoding: batches(socket)[0] for encoding, socket in sockets.items()}, manager.metrics()
+
+    frames, metrics = asyncio.run(scenario())
+
+    assert [e["id"] for e in frames["json"]["events"]] == ["m1", "m2"]
+    for encoding in ("columnar", "msgpack"):
+        frame = frames[encoding]
+        assert "events" not in frame
+        assert frame["match_types"] == ["exact", "mismatch"]
+        assert frame["runs"] == ["r1"]
+        assert frame["columns"]["type"] == [0, 1]
+        assert frame["columns"]["amount_cents"] == [12050, -300]
+        assert frame["columns"]["day"] == [738890, 738890]
+        assert frame["progress"] == frames["json"]["progress"]
+    assert {m["encoding"] for m in metrics} == {"json", "columnar", "msgpack"}
+
+
+def test_engine_publishes_through_the_polling_backend_without_locking_itself(tmp_path):
+    from datetime import date
+    from decimal import Decimal
+    from app.models import tables
+    from app.models.tables import FeedEvent
+    from app.services.matching_engine import MatchingEngine
+
+    # A file database: the run's session and the publishing session are separate connections
+    engine = create_engine(f"sqlite:///{tmp_path / 'feed.db'}", connect_args={"timeout": 1})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    for n in range(5):
+        db.add(tables.Transaction(date=date(2024, 3, 1 + n), amount=Decimal(f"{10 + n}.00")))
+        db.add(tables.InternalLedger(date=date(2024, 3, 1 + n), amount=Decimal(f"{10 + n}.00")))
+    db.commit()
+
+    worker = ConnectionManager(flush_interval_ms=60000, max_events=2, backend=PollingFeedBackend(Session, 0.01, 300))
+    results = asyncio.run(MatchingEngine(db).run(worker))
+
+    assert results["exact_matches"] == 5
+    published = [e for (events,) in db.query(FeedEvent.events).order_by(FeedEvent.id) for e in events]
+    assert [e["seq"] for e in published] == [1, 2, 3, 4, 5]
+
+
+def test_failing_backend_does_not_fail_the_publisher():
+    class BrokenBackend:
+        shared = True
+
+        def publish(self, events):
+            raise RuntimeError("feed database is down")
+
+    manager = ConnectionManager(flush_interval_ms=60000, max_events=2, backend=BrokenBackend())
+    for n in range(5):
+        manager.publish(event(n))
+    manager.flush()
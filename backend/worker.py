@@ -0,0 +1,46 @@
+import os
+import socket
+import sys
+import time
+
+# --- PATH FIX ---
+# Same as createsuperuser.py: run this from the directory containing 'app'
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from app.core import config
+from app.core.database import SessionLocal, engine, Base
+from app.models import tables
+from app.core.schema_upgrade import upgrade_schema
+from app.services.job_queue import claim_job, run_job
+
+def work(poll_seconds: float):
+    """
+    Claims and runs queued reconciliation jobs one at a time, forever.
+    Start as many workers as you like; each job is claimed by exactly one.
+    """
+    name = f"{socket.gethostname()}:{os.getpid()}"
+    print(f"Reconciliation worker {name} waiting for jobs...")
+    while True:
+        db = SessionLocal()
+        try:
+            job = claim_job(db, name)
+            job_id = job.id if job else None
+        finally:
+            db.close()
+
+        if job_id is None:
+            time.sleep(poll_seconds)
+            continue
+
+        print(f"Running job {job_id}")
+        status = run_job(job_id, SessionLocal)
+        print(f"Job {job_id} {status}")
+
+if __name__ == "__main__":
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+    work(config.JOB_POLL_SECONDS)
@@ -3,6 +3,26 @@ import { AlertTriangle, CheckCircle2, DollarSign, Activity, Loader2, Play, Zap,
 import apiClient from '@/api/client';
 import { useAuth } from '@/features/auth/AuthContext';
 
+// --- LIVE FEED ---
+// date.toordinal() of 1970-01-01: "day" columns count days from 0001-01-01 (= 1)
+const EPOCH_ORDINAL = 719163;
+
+// Rebuilds the event objects of a columnar batch frame (?encoding=columnar)
+const expandColumns = (frame) => {
+    const c = frame.columns;
+    return c.id.map((id, i) => ({
+        id,
+        seq: c.seq[i],
+        run_id: frame.runs[c.run[i]],
+        match_type: frame.match_types[c.type[i]],
+        amount: c.amount_cents[i] / 100,
+        date: new Date((c.day[i] - EPOCH_ORDINAL) * 86400000).toISOString().slice(0, 10),
+        confidence: c.confidence[i],
+        bank_desc: c.bank_desc[i],
+        ledger_desc: c.ledger_desc[i]
+    }));
+};
+
 // --- RENDER HELPERS ---
 const FeedTable = ({ matches, limit }) => (
     <div className="overflow-x-auto">
@@ -112,25 +132,64 @@ export default function DashboardPage() {
         // Use production URL or localhost based on environment
         const protocol = window.location.protocol === "https:" ? "wss:" : "ws:";
         const host = window.location.host; // includes port if any
-        const wsUrl = `${protocol}//${host}/api/v1/reconcile/ws`;
-        // Check if websockets available (simple check)
+        // Columnar batches are far smaller than one JSON object per match
+        const wsUrl = `${protocol}//${host}/api/v1/reconcile/ws?encoding=columnar`;
+        // Last run event seen: a reconnect asks the server to replay only what came after it
+        let lastSeen = null;
         let ws;
-        try {
-            ws = new WebSocket(wsUrl);
+        let retryTimer;
+        let closed = false;
+
+        const connect = () => {
+            const resume = lastSeen ? `&run_id=${encodeURIComponent(lastSeen.run_id)}&after_seq=${lastSeen.seq}` : '';
+            try {
+                ws = new WebSocket(wsUrl + resume);
+            } catch (e) {
+                console.error("WS Create failed", e);
+                return;
+            }
             ws.onopen = () => console.log("Connected to Real-Time Reconciliation Feed");
             ws.onmessage = (event) => {
                 try {
-                    const newMatch = JSON.parse(event.data);
-                    // Prepend new match.
+                    // The server sends a "hello" (run summaries), the recent events of each run
+                    // ("replay" batches), then live batches: {"type": "batch", "events": [...], "progress": {...}}
+                    const frame = JSON.parse(event.data);
+                    if (frame.type === 'hello') {
+                        // Only reload if the server no longer has everything we missed
+                        if (frame.gaps && frame.gaps.length > 0) loadData();
+                        return;
+                    }
+                    if (frame.type === 'snapshot') {
+                        // We fell behind and the server dropped our backlog; reload instead
+                        loadData();
+                        return;
+                    }
+                    const newMatches = frame.format === 'columnar' ? expandColumns(frame)
+                        : frame.type === 'batch' ? frame.events : [frame];
+                    const last = newMatches[newMatches.length - 1];
+                    if (last && last.run_id) lastSeen = { run_id: last.run_id, seq: last.seq };
+
+                    if (frame.replay) {
+                        // Catch-up events may already be on screen (and in the stats)
+                        setRecentMatches(prev => {
+                            const known = new Set(prev.map(m => m.id));
+                            const missed = newMatches.filter(m => !known.has(m.id));
+                            return [...missed.reverse(), ...prev];
+                        });
+                        return;
+                    }
+
+                    // Prepend new matches, newest first.
                     // User wants ALL matches, so we don't slice off old ones anymore.
-                    setRecentMatches(prev => [newMatch, ...prev]);
+                    setRecentMatches(prev => [...newMatches.slice().reverse(), ...prev]);
 
-                    if (newMatch.match_type !== 'mismatch') {
+                    const matched = newMatches.filter(m => m.match_type !== 'mismatch').length;
+                    if (matched > 0) {
                         setStats(prev => ({
                             ...prev,
-                            total_matches: prev.total_matches + 1,
+                            total_matches: prev.total_matches + matched,
                             reconciliation_rate: prev.total_transactions > 0
-                                ? (((prev.total_matches + 1) / prev.total_transactions) * 100).toFixed(1)
+                                ? (((prev.total_matches + matched) / prev.total_transactions) * 100).toFixed(1)
                                 : 0
                         }));
                     }
@@ -138,11 +197,16 @@ export default function DashboardPage() {
                     console.error("Error parsing WS message", e);
                 }
             };
-        } catch (e) {
-            console.error("WS Create failed", e);
-        }
+            // Reconnect and resume instead of reloading the whole feed
+            ws.onclose = () => {
+                if (!closed) retryTimer = setTimeout(connect, 2000);
+            };
+        };
+        connect();
 
         return () => {
+            closed = true;
+            clearTimeout(retryTimer);
             if (ws) ws.close();
         };
     }, []); // Re-connect if limit changes? No, logic is inside setter.
@@ -154,23 +218,33 @@ export default function DashboardPage() {
         try {
             const res = await apiClient.post('/reconcile/run');
 
-            // Backend now returns {"status": "started", "message": "..."}
-            // The actual results will come via WebSocket in real-time
-            if (res.data.status === "started") {
-                console.log("Reconciliation started:", res.data.message);
-                // Optionally show a toast or notification that it started
-                // Results will appear in real-time via WebSocket
-
-                // Reload stats after reconciliation completes
-                // We'll reload after a delay or when WebSocket closes
-                setTimeout(async () => {
-                    await loadData();
-                    setRunning(false);
-                }, 2000); // Give it 2 seconds for initial matches to appear
+            // Backend returns {"status": "queued", "job_id": "..."}; a worker process runs the job
+            if (res.data.status === "queued") {
+                console.log("Reconciliation queued:", res.data.job_id);
+
+                // Poll the job and reload stats once it is done
+                const poll = setInterval(async () => {
+                    try {
+                        const job = await apiClient.get(`/reconcile/jobs/${res.data.job_id}`);
+                        if (job.data.status === "completed" || job.data.status === "failed") {
+                            clearInterval(poll);
+                            await loadData();
+                            setRunning(false);
+                        }
+                    } catch (pollErr) {
+                        console.error(pollErr);
+                        clearInterval(poll);
+                        setRunning(false);
+                    }
+                }, 2000);
             }
         } catch (err) {
             console.error(err);
-            alert("Failed to start reconciliation. Check console for details.");
+            if (err.response && err.response.status === 409) {
+                alert("A reconciliation is already queued or running.");
+            } else {
+                alert("Failed to start reconciliation. Check console for details.");
+            }
             setRunning(false);
         }
     };